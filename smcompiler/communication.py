@@ -3,13 +3,35 @@ Utilities for client communication with the trusted server.
 You should not need to change this file.
 """
 
+import asyncio
+import functools
 import json
+import logging
 import time
-from typing import Union, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Union, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from secret_sharing import Share
+import tracing
+import wire
+from finite_field import FF, FiniteField
+from secret_sharing import as_share, Share
+from tracing import NULL_TRACER, Tracer
+
+if TYPE_CHECKING:
+    from transport import Transport
+
+# Requests of the clients, logged at debug level: printing them would slow every message down.
+logger = logging.getLogger("smc.client")
+
+try:
+    import aiohttp
+except ImportError:
+    # Optional: without it, the requests of `AsyncCommunication` are run in worker threads.
+    aiohttp = None
 
 
 def sanitize_url_param(url_param: Union[bytes, str]) -> str:
@@ -26,6 +48,27 @@ def sanitize_url_param(url_param: Union[bytes, str]) -> str:
     return url_param.replace("/", "_").replace("+", "-") # type: ignore
 
 
+def _to_bytes(message: Union[bytes, str]) -> bytes:
+    return message.encode() if isinstance(message, str) else message
+
+
+def _traced(method):
+    """
+    Record the calls of a network method as spans of the tracer of the client.
+    """
+    if asyncio.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def traced(self, *args, **kwargs):
+            with self.tracer.span(method.__name__, "network"):
+                return await method(self, *args, **kwargs)
+    else:
+        @functools.wraps(method)
+        def traced(self, *args, **kwargs):
+            with self.tracer.span(method.__name__, "network"):
+                return method(self, *args, **kwargs)
+    return traced
+
+
 class Communication:
     """
     Network communications with the server.
@@ -36,6 +79,21 @@ class Communication:
         client_id: Identifier of this client
         poll_delay: delay between requests in seconds (default: 0.2 s)
         protocol: network protocol to use (default: "http")
+        long_poll: let the server hold retrieval requests until the message is posted, instead of
+            polling every `poll_delay` seconds (default: False)
+        long_poll_timeout: longest time in seconds a request is held by the server (default: 10 s)
+        pool_size: number of keep-alive connections kept open to the server (default: 4)
+        retries: number of times a request is retried on connection errors (default: 3)
+        binary: exchange bulk messages and triplets in the compact binary format of `wire` rather
+            than JSON (default: False)
+        transport: exchange the messages with this transport rather than with the server over HTTP,
+            e.g. a `transport.LocalTransport` shared by parties running in the same process (default: None)
+        session: session of the server in which the protocol runs, so that several protocols run
+            concurrently on one server (default: None, the default session of the server)
+        tracer: records the requests in the trace of the run, see `tracing` (default: None, no trace)
+        bytes_sent: number of payload bytes sent so far
+        bytes_received: number of payload bytes received so far
+        requests_sent: number of HTTP requests made so far
     """
 
     def __init__(
@@ -44,14 +102,118 @@ class Communication:
             server_port: int,
             client_id: str,
             poll_delay: float = 0.2,
-            protocol: str = "http"
+            protocol: str = "http",
+            long_poll: bool = False,
+            long_poll_timeout: float = 10.0,
+            pool_size: int = 4,
+            retries: int = 3,
+            binary: bool = False,
+            transport: Optional["Transport"] = None,
+            session: Optional[str] = None,
+            tracer: Optional[Tracer] = None
     ):
-        self.base_url = f"{protocol}://{server_host}:{server_port}"
+        self.server_url = f"{protocol}://{server_host}:{server_port}"
+        self.base_url = self.server_url
+        if session is not None:
+            self.base_url = f"{self.server_url}/sessions/{sanitize_url_param(session)}"
+        self.session_id = session
+        self.transport = transport
         self.client_id = client_id
         self.poll_delay = poll_delay
+        self.long_poll = long_poll
+        self.long_poll_timeout = long_poll_timeout
+        self.binary = binary
+        self.tracer = tracer if tracer is not None else NULL_TRACER
         self.bytes_sent = 0
         self.bytes_received = 0
+        self.requests_sent = 0
+
+        # One keep-alive session for the lifetime of the client, rather than a new TCP connection per
+        # message. Messages are stored under a unique label, so POST requests are safe to retry.
+        self._adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.1,
+                allowed_methods=frozenset({"GET", "POST"}),
+                status_forcelist=(),
+            ),
+        )
+        self.session = requests.Session()
+        self.session.mount(f"{protocol}://", self._adapter)
+
+    @property
+    def connections_opened(self) -> int:
+        """
+        Number of TCP connections opened to the server so far.
+        """
+        pools = self._adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
 
+    def connection_stats(self) -> Dict[str, float]:
+        """
+        Reuse statistics of the pooled connections.
+        """
+        opened = self.connections_opened
+        return {
+            "requests": self.requests_sent,
+            "connections": opened,
+            "reused": self.requests_sent - opened,
+            "requests_per_connection": self.requests_sent / opened if opened else 0.0,
+        }
+
+    def close(self) -> None:
+        """
+        Close the pooled connections.
+        """
+        self.session.close()
+
+    def open_session(self, participant_ids: Iterable[str]) -> None:
+        """
+        Open the session of this client on the server, with the given participants.
+        """
+        if self.session_id is None:
+            raise ValueError("The client has no session")
+        self._post(self.base_url, json.dumps({"participants": list(participant_ids)}),
+                   headers=self._headers("application/json"))
+
+    def close_session(self) -> None:
+        """
+        Close the session of this client on the server, once the protocol is over.
+        """
+        if self.session_id is None:
+            raise ValueError("The client has no session")
+        self._account(requests=1)
+        self.session.delete(self.base_url)
+
+    def _account(self, sent: int = 0, received: int = 0, requests: int = 0) -> None:
+        """
+        Count payload bytes and requests, in the totals of the client and in the current span of its trace.
+        """
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.requests_sent += requests
+        tracing.count(bytes_sent=sent, bytes_received=received, requests=requests)
+
+    def _headers(self, body_type: Optional[str] = None) -> Dict[str, str]:
+        """
+        Headers negotiating the format of the bodies with the server.
+        """
+        headers = {"Accept": wire.CONTENT_TYPE if self.binary else "application/json"}
+        if body_type is not None:
+            headers["Content-Type"] = body_type
+        return headers
+
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        self._account(requests=1)
+        return self.session.get(url, **kwargs)
+
+    def _post(self, url: str, data: Union[bytes, str], **kwargs) -> requests.Response:
+        self._account(requests=1)
+        return self.session.post(url, data, **kwargs)
+
+    @_traced
     def send_private_message(
             self,
             receiver_id: str,
@@ -61,21 +223,25 @@ class Communication:
         """
         Send a private message to the server.
         """
+        if self.transport is not None:
+            self.send_private_many({(receiver_id, label): message})
+            return
 
         client_id_san = sanitize_url_param(self.client_id)
         receiver_id_san = sanitize_url_param(receiver_id)
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/private/{client_id_san}/{receiver_id_san}/{label_san}"
-        print(f"POST {url}")
+        logger.debug("POST %s", url)
 
-        res = requests.post(url, message)
+        res = self._post(url, message)
         if isinstance(message, str):
             message_size = len(message.encode())  # convert str to bytes to get accurate size
         else:
             message_size = len(message)
-        self.bytes_sent += message_size
+        self._account(sent=message_size)
 
+    @_traced
     def retrieve_private_message(
             self,
             label: str
@@ -83,22 +249,17 @@ class Communication:
         """
         Retrieve a private message from the server.
         """
+        if self.transport is not None:
+            return self.retrieve_private_many([label])[label]
 
         client_id_san = sanitize_url_param(self.client_id)
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/private/{client_id_san}/{label_san}"
-        # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
-        while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
-            if res.status_code == 200:
-                self.bytes_received += len(res.content)
-                return res.content
-            time.sleep(self.poll_delay)
+        return self._poll(url)
 
 
+    @_traced
     def publish_message(
             self,
             label: str,
@@ -107,20 +268,24 @@ class Communication:
         """
         Publish a message on the server.
         """
+        if self.transport is not None:
+            self.publish_many({label: message})
+            return
 
         client_id_san = sanitize_url_param(self.client_id)
         label_san = sanitize_url_param(label)
 
         url = f"{self.base_url}/public/{client_id_san}/{label_san}"
-        print(f"POST {url}")
-        res = requests.post(url, message)
+        logger.debug("POST %s", url)
+        res = self._post(url, message)
         if isinstance(message, str):
             message_size = len(message.encode())  # convert str to bytes to get accurate size
         else:
             message_size = len(message)
-        self.bytes_sent += message_size
+        self._account(sent=message_size)
 
 
+    @_traced
     def retrieve_public_message(
             self,
             sender_id: str,
@@ -129,6 +294,8 @@ class Communication:
         """
         Retrieve a public message from the server.
         """
+        if self.transport is not None:
+            return self.retrieve_many([sender_id], [label])[(sender_id, label)]
 
         client_id_san = sanitize_url_param(self.client_id)
         sender_id_san = sanitize_url_param(sender_id)
@@ -136,31 +303,549 @@ class Communication:
 
         url = f"{self.base_url}/public/{client_id_san}/{sender_id_san}/{label_san}"
 
+        return self._poll(url)
+
+
+    @_traced
+    def send_private_many(
+            self,
+            messages: Dict[Tuple[str, str], Union[bytes, str]]
+        ) -> None:
+        """
+        Send several private messages to the server in one request.
+        In JSON mode, messages must be text.
+
+        Args:
+            messages: messages indexed by (receiver_id, label)
+        """
+        if self.transport is not None:
+            messages = {key: _to_bytes(message) for key, message in messages.items()}
+            self.transport.send_private_many(self.client_id, messages)
+            self._account(sent=sum(len(message) for message in messages.values()), requests=1)
+            return
+
+        client_id_san = sanitize_url_param(self.client_id)
+        keys = [(sanitize_url_param(receiver_id), sanitize_url_param(label)) for receiver_id, label in messages]
+        body = self._bulk_body(keys, list(messages.values()))
+
+        url = f"{self.base_url}/bulk/private/{client_id_san}"
+        logger.debug("POST %s", url)
+        self._post(url, body, headers=self._headers(wire.CONTENT_TYPE if self.binary else "application/json"))
+        self._account(sent=len(body))
+
+
+    @_traced
+    def retrieve_private_many(
+            self,
+            labels: Iterable[str]
+        ) -> Dict[str, bytes]:
+        """
+        Retrieve several private messages from the server in one request, once all of them are posted.
+        """
+        if self.transport is not None:
+            res = self.transport.retrieve_private_many(self.client_id, list(labels))
+            self._account(received=sum(len(message) for message in res.values()), requests=1)
+            return res
+
+        client_id_san = sanitize_url_param(self.client_id)
+        labels = list(labels)
+        labels_san = [sanitize_url_param(label) for label in labels]
+
+        url = f"{self.base_url}/bulk/private/{client_id_san}/retrieve"
+        res = self._bulk_response(self._poll(url, {"labels": labels_san}), 1)
+        return {label: res[(label_san,)] for label, label_san in zip(labels, labels_san)}
+
+
+    @_traced
+    def publish_many(
+            self,
+            messages: Dict[str, Union[bytes, str]]
+        ) -> None:
+        """
+        Publish several messages, indexed by label, on the server in one request.
+        In JSON mode, messages must be text.
+        """
+        if self.transport is not None:
+            messages = {label: _to_bytes(message) for label, message in messages.items()}
+            self.transport.publish_many(self.client_id, messages)
+            self._account(sent=sum(len(message) for message in messages.values()), requests=1)
+            return
+
+        client_id_san = sanitize_url_param(self.client_id)
+        keys = [(sanitize_url_param(label),) for label in messages]
+        body = self._bulk_body(keys, list(messages.values()))
+
+        url = f"{self.base_url}/bulk/public/{client_id_san}"
+        logger.debug("POST %s", url)
+        self._post(url, body, headers=self._headers(wire.CONTENT_TYPE if self.binary else "application/json"))
+        self._account(sent=len(body))
+
+
+    @_traced
+    def retrieve_many(
+            self,
+            sender_ids: Iterable[str],
+            labels: Iterable[str],
+            min_senders: Optional[int] = None
+        ) -> Dict[Tuple[str, str], bytes]:
+        """
+        Retrieve the public messages of several senders under several labels in one request, once all
+        of them are published or, if `min_senders` is given, as soon as that many senders published all
+        their messages.
+
+        Returns:
+            messages indexed by (sender_id, label), of the senders that published all of them
+        """
+        if self.transport is not None:
+            res = self.transport.retrieve_many(self.client_id, list(sender_ids), list(labels), min_senders)
+            self._account(received=sum(len(message) for message in res.values()), requests=1)
+            return res
+
+        client_id_san = sanitize_url_param(self.client_id)
+        sender_ids, labels = list(sender_ids), list(labels)
+        senders_san = [sanitize_url_param(sender_id) for sender_id in sender_ids]
+        labels_san = [sanitize_url_param(label) for label in labels]
+
+        url = f"{self.base_url}/bulk/public/{client_id_san}/retrieve"
+        query = {"senders": senders_san, "labels": labels_san}
+        if min_senders is not None:
+            query["min_senders"] = min_senders
+        res = self._bulk_response(self._poll(url, query), 2)
+        return self._sender_messages(res, sender_ids, labels)
+
+    def _sender_messages(
+            self,
+            res: Dict[Tuple[str, ...], bytes],
+            sender_ids: List[str],
+            labels: List[str]
+        ) -> Dict[Tuple[str, str], bytes]:
+        """
+        Index the messages of a bulk response by (sender_id, label) rather than by sanitized keys.
+        """
+        return {
+            (sender_id, label): res[(sanitize_url_param(sender_id), sanitize_url_param(label))]
+            for sender_id in sender_ids
+            for label in labels
+            if (sanitize_url_param(sender_id), sanitize_url_param(label)) in res
+        }
+
+
+    def _bulk_body(self, keys: List[Tuple[str, ...]], messages: List[Union[bytes, str]]) -> bytes:
+        """
+        Encode the body of a bulk request: binary records, or JSON (an object for single keys, a list
+        of [*keys, message] entries otherwise).
+        """
+        if self.binary:
+            return wire.pack_records(keys, [m.encode() if isinstance(m, str) else m for m in messages])
+
+        messages = [m.decode() if isinstance(m, bytes) else m for m in messages]
+        if all(len(k) == 1 for k in keys):
+            return json.dumps({k[0]: m for k, m in zip(keys, messages)}).encode()
+        return json.dumps([[*k, m] for k, m in zip(keys, messages)]).encode()
+
+    def _bulk_response(self, content: bytes, num_keys: int) -> Dict[Tuple[str, ...], bytes]:
+        """
+        Decode the body of a bulk response into messages indexed by their keys.
+        """
+        if self.binary:
+            return dict(wire.unpack_records(content, num_keys))
+
+        def flatten(node, keys):
+            if isinstance(node, str):
+                yield keys, node.encode()
+            else:
+                for key, child in node.items():
+                    yield from flatten(child, keys + (key,))
+
+        return dict(flatten(json.loads(content), ()))
+
+    def _poll(self, url: str, query: Optional[dict] = None) -> bytes:
+        """
+        Query an URL until the server has the message.
+        Bulk queries are sent as the JSON body of a POST request, as they do not fit in an URL.
+        """
         # We can either use a websocket, or do some polling, but websockets would require asyncio.
-        # So we are doing polling to avoid introducing a new programming paradigm.
+        # So we are doing (long) polling to avoid introducing a new programming paradigm.
+        params = {"wait": self.long_poll_timeout} if self.long_poll else None
         while True:
-            print(f"GET  {url}")
-            res = requests.get(url)
+            if query is None:
+                logger.debug("GET %s", url)
+                res = self._get(url, params=params)
+            else:
+                logger.debug("POST %s", url)
+                res = self._post(url, json.dumps(query), params=params, headers=self._headers("application/json"))
             if res.status_code == 200:
-                self.bytes_received += len(res.content)
+                self._account(received=len(res.content))
                 return res.content
-            time.sleep(self.poll_delay)
+            # Not posted yet (or not within the long poll timeout): try again.
+            tracing.count(retries=1)
+            if not self.long_poll:
+                time.sleep(self.poll_delay)
 
 
+    @_traced
     def retrieve_beaver_triplet_shares(
             self,
-            op_id: str
+            op_id: str,
+            size: Optional[int] = None,
+            field: FiniteField = FF,
+            threshold: Optional[int] = None
         ) -> Tuple[Share, Share, Share]:
         """
-        Retrieve a triplet of shares generated by the trusted server.
+        Retrieve a triplet of shares generated by the trusted server, in the given field.
+        If `size` is given, the triplet is made of vectors of `size` elements.
+        If `threshold` is given, the triplet is Shamir-shared with that threshold (see `ShamirScheme`).
         """
+        if self.transport is not None:
+            sizes = None if size is None else {op_id: size}
+            return self.retrieve_beaver_triplet_shares_many([op_id], sizes, field, threshold)[op_id]
 
         client_id_san = sanitize_url_param(self.client_id)
         op_id_san = sanitize_url_param(op_id)
 
         url = f"{self.base_url}/shares/{client_id_san}/{op_id_san}"
-        print(f"GET  {url}")
+        logger.debug("GET %s", url)
+
+        params = self._triplet_query(field, threshold)
+        if size is not None:
+            params["size"] = size
+        res = self._get(url, params=params or None, headers=self._headers())
+        self._account(received=len(res.content))
+        return self._decode_triplet(res.content, field)
+
+
+    @_traced
+    def retrieve_beaver_triplet_shares_many(
+            self,
+            op_ids: Iterable[str],
+            sizes: Optional[Dict[str, int]] = None,
+            field: FiniteField = FF,
+            threshold: Optional[int] = None
+        ) -> Dict[str, Tuple[Share, Share, Share]]:
+        """
+        Retrieve the triplets of shares of several operations in one request, in the given field.
+        `sizes` gives the vector size of the operations on vectors, `threshold` the threshold of the
+        Shamir sharing of the triplets (if any).
+        """
+        if self.transport is not None:
+            triplets = self.transport.retrieve_triplets(self.client_id, list(op_ids), sizes, field, threshold)
+            self._account(received=self._triplets_size(triplets), requests=1)
+            return triplets
+
+        client_id_san = sanitize_url_param(self.client_id)
+        op_ids = list(op_ids)
+        op_ids_san = [sanitize_url_param(op_id) for op_id in op_ids]
+        sizes_san = {sanitize_url_param(op_id): size for op_id, size in (sizes or dict()).items()}
+
+        url = f"{self.base_url}/bulk/shares/{client_id_san}/retrieve"
+        logger.debug("POST %s", url)
+
+        query = {"op_ids": op_ids_san, "sizes": sizes_san, **self._triplet_query(field, threshold)}
+        res = self._post(url, json.dumps(query), headers=self._headers("application/json"))
+        self._account(received=len(res.content))
+        return self._decode_triplets(res.content, op_ids, field)
+
+    def _triplets_size(self, triplets: Dict[str, Tuple[Share, Share, Share]]) -> int:
+        """
+        Size of the payload of triplets handed over by a transport, as serialized for the server.
+        """
+        return sum(len(_to_bytes(share.serialize(self.binary))) for triplet in triplets.values() for share in triplet)
+
+    def _triplet_query(self, field: FiniteField, threshold: Optional[int]) -> dict:
+        """
+        Parameters of a triplet request, beyond the operation ids and vector sizes.
+        """
+        query = dict()
+        if field != FF:
+            query["order"] = field.order
+        if threshold is not None:
+            query["threshold"] = threshold
+        return query
+
+    def _decode_triplet(self, content: bytes, field: FiniteField) -> Tuple[Share, Share, Share]:
+        if self.binary:
+            return tuple([as_share(v, field) for v in wire.decode_all(content)]) # type: ignore
+        return tuple([Share.deserialize(s, field) for s in json.loads(content)]) # type: ignore
+
+    def _decode_triplets(
+            self,
+            content: bytes,
+            op_ids: List[str],
+            field: FiniteField
+        ) -> Dict[str, Tuple[Share, Share, Share]]:
+        if self.binary:
+            triplets = {keys[0]: triplet for keys, triplet in wire.unpack_records(content, 1)}
+            return {op_id: self._decode_triplet(triplets[sanitize_url_param(op_id)], field) for op_id in op_ids}
+
+        triplets = json.loads(content)
+        return {
+            op_id: tuple([Share.deserialize(s, field) for s in triplets[sanitize_url_param(op_id)]]) # type: ignore
+            for op_id in op_ids
+        }
+
+
+class AsyncCommunication(Communication):
+    """
+    Network communications with the server, with coroutines: the requests of a client (and of many
+    clients sharing one event loop) are in flight concurrently, e.g. a party publishes its messages
+    while it waits for those of its peers.
+
+    Same methods and options as `Communication`, to be awaited. The requests are sent with aiohttp if
+    it is installed, or else with the pooled session of `Communication`, in `pool_size` worker threads.
+    With a `transport`, messages are sent inline (they do not block), and reads, which wait for their
+    messages, are run in `pool_size` worker threads of the client: each client has its own, so that the
+    reads of the parties sharing the event loop never hold up the messages of the others.
+    The client must be closed (`await close()`) once done.
+    """
+
+    def __init__(
+            self,
+            server_host: str,
+            server_port: int,
+            client_id: str,
+            pool_size: int = 4,
+            **options
+    ):
+        super().__init__(server_host, server_port, client_id, pool_size=pool_size, **options)
+        self.pool_size = pool_size
+        self._client = None
+        self._executor = None
+        if aiohttp is None or self.transport is not None:
+            self._executor = ThreadPoolExecutor(max_workers=pool_size)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+        self.session.close()
+
+    async def _request(
+            self,
+            method: str,
+            url: str,
+            data: Union[bytes, str, None] = None,
+            params: Optional[dict] = None,
+            headers: Optional[Dict[str, str]] = None
+        ) -> Tuple[int, bytes]:
+        """
+        Send a request.
+
+        Returns:
+            the status code and the content of the response
+        """
+        self._account(requests=1)
+        if aiohttp is None:
+            send = functools.partial(self.session.request, method, url, data=data, params=params, headers=headers)
+            res = await asyncio.get_running_loop().run_in_executor(self._executor, send)
+            return res.status_code, res.content
+
+        if self._client is None:
+            # Bound to the running event loop, so it is only created once in it.
+            self._client = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        params = {key: str(value) for key, value in params.items()} if params else None
+        async with self._client.request(method, url, data=data, params=params, headers=headers) as res:
+            return res.status, await res.read()
+
+    async def _wait(self, read, *args):
+        """
+        Run a blocking read of the transport in a worker thread of the client.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(read, *args))
+
+    async def _send(self, url: str, body: Union[bytes, str], headers: Optional[Dict[str, str]] = None) -> None:
+        logger.debug("POST %s", url)
+        await self._request("POST", url, body, headers=headers)
+        self._account(sent=len(body.encode() if isinstance(body, str) else body))
+
+    async def _poll(self, url: str, query: Optional[dict] = None) -> bytes:
+        """
+        Query an URL until the server has the message, see `Communication._poll`.
+        """
+        params = {"wait": self.long_poll_timeout} if self.long_poll else None
+        while True:
+            if query is None:
+                logger.debug("GET %s", url)
+                status, content = await self._request("GET", url, params=params)
+            else:
+                logger.debug("POST %s", url)
+                status, content = await self._request(
+                    "POST", url, json.dumps(query), params=params, headers=self._headers("application/json")
+                )
+            if status == 200:
+                self._account(received=len(content))
+                return content
+            # Not posted yet (or not within the long poll timeout): try again.
+            tracing.count(retries=1)
+            if not self.long_poll:
+                await asyncio.sleep(self.poll_delay)
+
+    @_traced
+    async def send_private_message(self, receiver_id: str, label: str, message: Union[bytes, str]) -> None:
+        if self.transport is not None:
+            await self.send_private_many({(receiver_id, label): message})
+            return
 
-        res = requests.get(url)
-        self.bytes_received += len(res.content)
-        return tuple([Share.deserialize(s) for s in json.loads(res.text)]) # type: ignore
+        client_id_san = sanitize_url_param(self.client_id)
+        receiver_id_san = sanitize_url_param(receiver_id)
+        label_san = sanitize_url_param(label)
+        await self._send(f"{self.base_url}/private/{client_id_san}/{receiver_id_san}/{label_san}", message)
+
+    @_traced
+    async def retrieve_private_message(self, label: str) -> bytes:
+        if self.transport is not None:
+            return (await self.retrieve_private_many([label]))[label]
+
+        client_id_san = sanitize_url_param(self.client_id)
+        label_san = sanitize_url_param(label)
+        return await self._poll(f"{self.base_url}/private/{client_id_san}/{label_san}")
+
+    @_traced
+    async def publish_message(self, label: str, message: Union[bytes, str]) -> None:
+        if self.transport is not None:
+            await self.publish_many({label: message})
+            return
+
+        client_id_san = sanitize_url_param(self.client_id)
+        label_san = sanitize_url_param(label)
+        await self._send(f"{self.base_url}/public/{client_id_san}/{label_san}", message)
+
+    @_traced
+    async def retrieve_public_message(self, sender_id: str, label: str) -> bytes:
+        if self.transport is not None:
+            return (await self.retrieve_many([sender_id], [label]))[(sender_id, label)]
+
+        client_id_san = sanitize_url_param(self.client_id)
+        sender_id_san = sanitize_url_param(sender_id)
+        label_san = sanitize_url_param(label)
+        return await self._poll(f"{self.base_url}/public/{client_id_san}/{sender_id_san}/{label_san}")
+
+    @_traced
+    async def send_private_many(self, messages: Dict[Tuple[str, str], Union[bytes, str]]) -> None:
+        if self.transport is not None:
+            messages = {key: _to_bytes(message) for key, message in messages.items()}
+            self.transport.send_private_many(self.client_id, messages)
+            self._account(sent=sum(len(message) for message in messages.values()), requests=1)
+            return
+
+        client_id_san = sanitize_url_param(self.client_id)
+        keys = [(sanitize_url_param(receiver_id), sanitize_url_param(label)) for receiver_id, label in messages]
+        body = self._bulk_body(keys, list(messages.values()))
+        await self._send(
+            f"{self.base_url}/bulk/private/{client_id_san}",
+            body,
+            self._headers(wire.CONTENT_TYPE if self.binary else "application/json")
+        )
+
+    @_traced
+    async def retrieve_private_many(self, labels: Iterable[str]) -> Dict[str, bytes]:
+        if self.transport is not None:
+            res = await self._wait(self.transport.retrieve_private_many, self.client_id, list(labels))
+            self._account(received=sum(len(message) for message in res.values()), requests=1)
+            return res
+
+        client_id_san = sanitize_url_param(self.client_id)
+        labels = list(labels)
+        labels_san = [sanitize_url_param(label) for label in labels]
+
+        url = f"{self.base_url}/bulk/private/{client_id_san}/retrieve"
+        res = self._bulk_response(await self._poll(url, {"labels": labels_san}), 1)
+        return {label: res[(label_san,)] for label, label_san in zip(labels, labels_san)}
+
+    @_traced
+    async def publish_many(self, messages: Dict[str, Union[bytes, str]]) -> None:
+        if self.transport is not None:
+            messages = {label: _to_bytes(message) for label, message in messages.items()}
+            self.transport.publish_many(self.client_id, messages)
+            self._account(sent=sum(len(message) for message in messages.values()), requests=1)
+            return
+
+        client_id_san = sanitize_url_param(self.client_id)
+        keys = [(sanitize_url_param(label),) for label in messages]
+        body = self._bulk_body(keys, list(messages.values()))
+        await self._send(
+            f"{self.base_url}/bulk/public/{client_id_san}",
+            body,
+            self._headers(wire.CONTENT_TYPE if self.binary else "application/json")
+        )
+
+    @_traced
+    async def retrieve_many(
+            self,
+            sender_ids: Iterable[str],
+            labels: Iterable[str],
+            min_senders: Optional[int] = None
+        ) -> Dict[Tuple[str, str], bytes]:
+        if self.transport is not None:
+            res = await self._wait(
+                self.transport.retrieve_many, self.client_id, list(sender_ids), list(labels), min_senders
+            )
+            self._account(received=sum(len(message) for message in res.values()), requests=1)
+            return res
+
+        client_id_san = sanitize_url_param(self.client_id)
+        sender_ids, labels = list(sender_ids), list(labels)
+        query = {
+            "senders": [sanitize_url_param(sender_id) for sender_id in sender_ids],
+            "labels": [sanitize_url_param(label) for label in labels],
+        }
+        if min_senders is not None:
+            query["min_senders"] = min_senders
+
+        url = f"{self.base_url}/bulk/public/{client_id_san}/retrieve"
+        res = self._bulk_response(await self._poll(url, query), 2)
+        return self._sender_messages(res, sender_ids, labels)
+
+    @_traced
+    async def retrieve_beaver_triplet_shares(
+            self,
+            op_id: str,
+            size: Optional[int] = None,
+            field: FiniteField = FF,
+            threshold: Optional[int] = None
+        ) -> Tuple[Share, Share, Share]:
+        if self.transport is not None:
+            sizes = None if size is None else {op_id: size}
+            return (await self.retrieve_beaver_triplet_shares_many([op_id], sizes, field, threshold))[op_id]
+
+        client_id_san = sanitize_url_param(self.client_id)
+        op_id_san = sanitize_url_param(op_id)
+
+        url = f"{self.base_url}/shares/{client_id_san}/{op_id_san}"
+        logger.debug("GET %s", url)
+
+        params = self._triplet_query(field, threshold)
+        if size is not None:
+            params["size"] = size
+        _, content = await self._request("GET", url, params=params or None, headers=self._headers())
+        self._account(received=len(content))
+        return self._decode_triplet(content, field)
+
+    @_traced
+    async def retrieve_beaver_triplet_shares_many(
+            self,
+            op_ids: Iterable[str],
+            sizes: Optional[Dict[str, int]] = None,
+            field: FiniteField = FF,
+            threshold: Optional[int] = None
+        ) -> Dict[str, Tuple[Share, Share, Share]]:
+        if self.transport is not None:
+            triplets = await self._wait(
+                self.transport.retrieve_triplets, self.client_id, list(op_ids), sizes, field, threshold
+            )
+            self._account(received=self._triplets_size(triplets), requests=1)
+            return triplets
+
+        client_id_san = sanitize_url_param(self.client_id)
+        op_ids = list(op_ids)
+        query = {
+            "op_ids": [sanitize_url_param(op_id) for op_id in op_ids],
+            "sizes": {sanitize_url_param(op_id): size for op_id, size in (sizes or dict()).items()},
+            **self._triplet_query(field, threshold),
+        }
+
+        url = f"{self.base_url}/bulk/shares/{client_id_san}/retrieve"
+        logger.debug("POST %s", url)
+        _, content = await self._request("POST", url, json.dumps(query), headers=self._headers("application/json"))
+        self._account(received=len(content))
+        return self._decode_triplets(content, op_ids, field)
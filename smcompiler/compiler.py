@@ -0,0 +1,359 @@
+"""
+Compilation of an expression tree into an optimized DAG before evaluation.
+
+The compiler
+* deduplicates structurally identical subexpressions, so that each is evaluated (and each
+  multiplication opened) only once,
+* folds subexpressions made of scalars only,
+* merges the scalars of chains of additions and subtractions into a single constant,
+* rebuilds runs of additions and of multiplications (e.g. a * b * c * d) as balanced trees, so that an
+  N-way product takes log2(N) rounds instead of N - 1,
+* keeps only the products of secret operands in inner products, and adds the others locally,
+and reports the communication cost of the result (gates opened and multiplicative depth).
+
+Compiled nodes are named after their structure, so every party compiling the same expression gets
+the same DAG with the same ids. The nodes are also numbered in evaluation order: their messages and
+triplets are exchanged under these short labels.
+"""
+
+import base64
+import hashlib
+import heapq
+from typing import Callable, Dict, List, Optional, Tuple
+
+from expression import (
+    Expression,
+    Addition, DotProduct, InnerProduct, Multiplication, Scalar, Secret, Subtraction, SumReduce, Truncation,
+    postorder
+)
+from finite_field import FF, FiniteField
+from fixed_point import truncation_op_id, value_bits
+from scheduler import Schedule
+
+ID_BYTES = 8
+
+
+def structural_id(*parts) -> bytes:
+    """
+    Deterministic id of a node, derived from its structure.
+    """
+    digest = hashlib.sha256(repr(parts).encode()).digest()
+    return base64.b64encode(digest[:ID_BYTES])
+
+
+class Circuit:
+    """
+    A compiled expression.
+
+    Attributes:
+        expr: root of the optimized DAG
+        num_nodes: number of distinct nodes of the DAG
+        schedule: evaluation plan of the DAG, see `scheduler.Schedule`
+        levels: gates (secret multiplications, dot products and truncations) grouped by round, see
+            `scheduler.multiplication_levels`
+    """
+
+    def __init__(self, expr: Expression):
+        self.expr = expr
+        self.schedule = Schedule(expr)
+        self.levels = self.schedule.levels
+        self.num_nodes = len(self.schedule.numbers)
+
+    def label(self, node: Expression) -> str:
+        """
+        Label under which the messages and the triplet of a node are exchanged: its number in the
+        circuit, the same for every party (and the trusted third party) compiling the protocol.
+        """
+        return str(self.schedule.numbers[node.id])
+
+    def op_id(self, gate: Expression) -> str:
+        """
+        Id under which the trusted third party serves the preprocessed values of a gate: the Beaver
+        triplet of a product, or the truncation pair of a truncation (see `fixed_point`).
+        """
+        if isinstance(gate, Truncation):
+            return truncation_op_id(self.label(gate), gate.bits)
+        return self.label(gate)
+
+    @property
+    def num_multiplications(self) -> int:
+        """Number of gates, i.e. of Beaver triplets (or truncation pairs) consumed."""
+        return sum(len(level) for level in self.levels)
+
+    @property
+    def multiplicative_depth(self) -> int:
+        """Number of communication rounds of the online phase."""
+        return len(self.levels)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(nodes={self.num_nodes}, multiplications={self.num_multiplications}, "
+            f"depth={self.multiplicative_depth})"
+        )
+
+
+class _Compiler:
+    """
+    Rebuilds an expression bottom-up, interning every node by its structural id.
+    """
+
+    def __init__(self, field: FiniteField = FF):
+        self.field = field
+        self.nodes: Dict[bytes, Expression] = dict()
+        # Compiled node of every original node, indexed by original id.
+        self.compiled: Dict[bytes, Expression] = dict()
+        # Multiplicative depth of the nodes built by `rebalance`.
+        self.depths: Dict[bytes, int] = dict()
+
+    def intern(self, node_id: bytes, build: Callable[[], Expression]) -> Expression:
+        if node_id not in self.nodes:
+            self.nodes[node_id] = build()
+        return self.nodes[node_id]
+
+    def scalar(self, value: int) -> Scalar:
+        value = value % self.field.order
+        node_id = structural_id("scalar", value)
+        return self.intern(node_id, lambda: Scalar(value, id=node_id))
+
+    def unary(self, cls, a: Expression, **parameters) -> Expression:
+        node_id = structural_id(cls.__name__, a.id, *parameters.values())
+        return self.intern(node_id, lambda: cls(a, id=node_id, **parameters))
+
+    def operation(self, cls, a: Expression, b: Expression) -> Expression:
+        if cls is not Subtraction and (isinstance(a, Scalar), a.id) > (isinstance(b, Scalar), b.id):
+            # Addition and multiplication commute: one canonical order for both, scalars on the right.
+            a, b = b, a
+        node_id = structural_id(cls.__name__, a.id, b.id)
+        return self.intern(node_id, lambda: cls(a, b, id=node_id))
+
+    def split(self, node: Expression) -> Tuple[Optional[Expression], int]:
+        """
+        Split a compiled node into its non-scalar part and the scalar added to it.
+        """
+        if isinstance(node, Scalar):
+            return None, node.value
+        if isinstance(node, (Addition, Subtraction)) and isinstance(node.b, Scalar):
+            sign = 1 if isinstance(node, Addition) else -1
+            return node.a, sign * node.b.value
+        if isinstance(node, Addition) and isinstance(node.a, Scalar):
+            return node.b, node.a.value
+        return node, 0
+
+    def offset(self, part: Optional[Expression], offset: int) -> Expression:
+        if part is None:
+            return self.scalar(offset)
+        if offset % self.field.order == 0:
+            return part
+        return self.operation(Addition, part, self.scalar(offset))
+
+    def build(self, expr: Expression) -> Expression:
+        """
+        Compile every node of `expr` after its operands, without recursion.
+        """
+        for node in postorder(expr, skip=self.compiled):
+            self.compiled[node.id] = self.build_node(node)
+        return self.compiled[expr.id]
+
+    def build_node(self, expr: Expression) -> Expression:
+        """
+        Compile a node whose operands are compiled already.
+        """
+        if isinstance(expr, Scalar):
+            node = self.scalar(expr.value)
+        elif isinstance(expr, Secret):
+            node = self.intern(expr.id, lambda: expr)
+        elif isinstance(expr, (Addition, Subtraction)):
+            node = self.additive(type(expr), self.compiled[expr.a.id], self.compiled[expr.b.id])
+        elif isinstance(expr, InnerProduct):
+            node = self.inner_product([(self.compiled[x.id], self.compiled[y.id]) for x, y in expr.pairs()])
+        elif isinstance(expr, Multiplication):
+            node = self.multiplication(self.compiled[expr.a.id], self.compiled[expr.b.id])
+        elif isinstance(expr, DotProduct):
+            a, b = self.compiled[expr.a.id], self.compiled[expr.b.id]
+            if isinstance(a, Scalar) or isinstance(b, Scalar):
+                # A public operand is the same for every element: sum up the product.
+                node = self.sum_reduce(self.multiplication(a, b))
+            else:
+                node = self.operation(DotProduct, a, b)
+        elif isinstance(expr, SumReduce):
+            node = self.sum_reduce(self.compiled[expr.a.id])
+        elif isinstance(expr, Truncation):
+            a = self.compiled[expr.a.id]
+            if isinstance(a, Scalar):
+                signed = a.value - self.field.order if a.value > self.field.order // 2 else a.value
+                node = self.scalar(signed >> expr.bits)
+            elif expr.bits == 0:
+                node = a
+            else:
+                node = self.unary(Truncation, a, bits=expr.bits)
+        else:
+            raise ValueError("Unknown expression type")
+        return node
+
+    def additive(self, cls, a: Expression, b: Expression) -> Expression:
+        """
+        Sum (or difference) of compiled nodes, their scalars merged into a single constant.
+        """
+        part_a, offset_a = self.split(a)
+        part_b, offset_b = self.split(b)
+        if cls is Addition:
+            offset = offset_a + offset_b
+            if part_a is None or part_b is None:
+                part = part_a if part_b is None else part_b
+            else:
+                part = self.operation(Addition, part_a, part_b)
+        else:
+            offset = offset_a - offset_b
+            if part_b is None:
+                part = part_a
+            else:
+                part = self.operation(Subtraction, part_a if part_a is not None else self.scalar(0), part_b)
+        return self.offset(part, offset)
+
+    def inner_product(self, pairs: List[Tuple[Expression, Expression]]) -> Expression:
+        """
+        Sum of products of compiled nodes: the products of two secret operands are fused, the others
+        are local and added to them.
+        """
+        secret, terms = [], []
+        for a, b in pairs:
+            if isinstance(a, Scalar) or isinstance(b, Scalar):
+                terms.append(self.multiplication(a, b))
+            else:
+                secret.append(tuple(sorted((a, b), key=lambda x: x.id)))
+        if len(secret) == 1:
+            terms.append(self.multiplication(*secret[0]))
+        elif secret:
+            # Products commute: one canonical order for all of them.
+            secret.sort(key=lambda pair: (pair[0].id, pair[1].id))
+            terms.append(self.fused([a for a, _ in secret], [b for _, b in secret]))
+        node = terms[0]
+        for term in terms[1:]:
+            node = self.additive(Addition, node, term)
+        return node
+
+    def fused(self, xs: List[Expression], ys: List[Expression]) -> InnerProduct:
+        node_id = structural_id("InnerProduct", *(x.id for x in xs), *(y.id for y in ys))
+        node = self.intern(node_id, lambda: InnerProduct(xs, ys, id=node_id))
+        self.depths[node_id] = max(self.depths.get(x.id, 0) for x in node.children()) + 1
+        return node
+
+    def multiplication(self, a: Expression, b: Expression) -> Expression:
+        if isinstance(a, Scalar) and isinstance(b, Scalar):
+            return self.scalar(self.field.mul(a, b))
+        if any(isinstance(x, Scalar) and x.value == 0 for x in (a, b)):
+            return self.scalar(0)
+        if isinstance(a, Scalar) and a.value == 1:
+            return b
+        if isinstance(b, Scalar) and b.value == 1:
+            return a
+        return self.operation(Multiplication, a, b)
+
+    def sum_reduce(self, a: Expression) -> Expression:
+        # Scalars are single values, which are their own sum.
+        return a if isinstance(a, Scalar) else self.unary(SumReduce, a)
+
+    def rebalance(self, expr: Expression) -> Expression:
+        """
+        Rebuild the runs of additions and of multiplications of a compiled DAG as balanced trees.
+
+        A run is a maximal subtree of nodes of the same associative operation whose inner nodes are not
+        used anywhere else (shared nodes must keep their value, so they end a run). Its scalar operands
+        are folded into one constant, and the others are combined shallowest first.
+        """
+        consumers: Dict[bytes, int] = dict()
+        # Type of the (last seen) node using each node, to find out where runs start.
+        parent_type: Dict[bytes, type] = dict()
+        for node in postorder(expr):
+            for child in node.children():
+                consumers[child.id] = consumers.get(child.id, 0) + 1
+                parent_type[child.id] = type(node)
+
+        def in_run(node: Expression, cls) -> bool:
+            return type(node) is cls and consumers.get(node.id) == 1
+
+        rebuilt: Dict[bytes, Expression] = dict()
+        for node in postorder(expr):
+            cls = type(node)
+            if cls in (Addition, Multiplication):
+                if in_run(node, parent_type.get(node.id)):
+                    # Inner node of a run, rebuilt with the whole run.
+                    continue
+                operands = []
+                stack = [node]
+                while stack:
+                    inner = stack.pop()
+                    for child in reversed(inner.children()):
+                        if in_run(child, cls):
+                            stack.append(child)
+                        else:
+                            operands.append(rebuilt[child.id])
+                rebuilt[node.id] = self.combine_run(cls, operands)
+            elif isinstance(node, (Subtraction, DotProduct)):
+                rebuilt[node.id] = self.combined(cls, rebuilt[node.a.id], rebuilt[node.b.id])
+            elif isinstance(node, InnerProduct):
+                rebuilt[node.id] = self.fused([rebuilt[x.id] for x in node.xs], [rebuilt[y.id] for y in node.ys])
+            elif isinstance(node, (SumReduce, Truncation)):
+                a = rebuilt[node.a.id]
+                rebuilt[node.id] = self.unary(cls, a, **node.parameters())
+                self.depths[rebuilt[node.id].id] = self.depths.get(a.id, 0) + isinstance(node, Truncation)
+            else:
+                rebuilt[node.id] = node
+        return rebuilt[expr.id]
+
+    def combine_run(self, cls, operands: List[Expression]) -> Expression:
+        constant = 0 if cls is Addition else 1
+        heap: List[Tuple[int, int, Expression]] = []
+        for operand in operands:
+            if isinstance(operand, Scalar):
+                constant = self.field.add(constant, operand) if cls is Addition else self.field.mul(constant, operand)
+            else:
+                heap.append((self.depths.get(operand.id, 0), len(heap), operand))
+        if cls is Multiplication and constant == 0:
+            return self.scalar(0)
+
+        heapq.heapify(heap)
+        count = len(heap)
+        while len(heap) > 1:
+            _, _, a = heapq.heappop(heap)
+            _, _, b = heapq.heappop(heap)
+            node = self.combined(cls, a, b)
+            heapq.heappush(heap, (self.depths[node.id], count, node))
+            count += 1
+
+        part = heap[0][2] if heap else None
+        if part is None:
+            return self.scalar(constant)
+        if constant == (0 if cls is Addition else 1):
+            return part
+        return self.combined(cls, part, self.scalar(constant))
+
+    def combined(self, cls, a: Expression, b: Expression) -> Expression:
+        """
+        Node applying an operation to rebuilt nodes, keeping track of its multiplicative depth.
+        """
+        node = self.operation(cls, a, b)
+        depth = max(self.depths.get(a.id, 0), self.depths.get(b.id, 0))
+        if cls in (Multiplication, DotProduct) and not isinstance(a, Scalar) and not isinstance(b, Scalar):
+            depth += 1
+        self.depths[node.id] = depth
+        return node
+
+
+def compile_expression(expr: Expression, rebalance: bool = True, field: FiniteField = FF) -> Circuit:
+    """
+    Compile an expression into an optimized DAG, see the module documentation.
+
+    Args:
+        rebalance: whether to rebuild runs of associative operations as balanced trees
+        field: field in which the constants are folded
+    """
+    compiler = _Compiler(field)
+    expr = compiler.build(expr)
+    if rebalance:
+        expr = compiler.rebalance(expr)
+    circuit = Circuit(expr)
+    if any(isinstance(gate, Truncation) for level in circuit.levels for gate in level):
+        # Raises if the field is too small for the truncations, before any of them is attempted.
+        value_bits(field)
+    return circuit
@@ -6,24 +6,52 @@ Example expression:
 >>> bob_secret = Secret()
 >>> expr = alice_secret * bob_secret * Scalar(2)
 
+Secrets given a precision hold fixed-point reals (see `fixed_point`), and so do scalars of float values.
+Products of two fixed-point values are truncated back to their precision, and integer operands of
+fixed-point sums are scaled up to it:
+>>> price, quantity = Secret(precision=16), Secret()
+>>> expr = price * quantity * Scalar(0.9) + Scalar(1.5)
+
+Secrets may also be vectors (see `SMCParty`): operations apply element-wise, `dot` and `sum` reduce
+vectors to single values.
+
+A sum of products x1 * y1 + ... + xn * yn is best written `inner_product([x1, ..., xn], [y1, ..., yn])`:
+its n products are opened together, in a single message, and summed up locally.
+
 MODIFY THIS FILE.
 """
 
-import base64
-import json
-import random
-from typing import Optional
+import itertools
+import threading
+from typing import Container, Iterator, Optional, Sequence, Tuple, Union
 
+from fixed_point import DEFAULT_PRECISION, encode
 from secret_sharing import Share
 
-ID_BYTES = 4
+
+class IdAllocator:
+    """
+    Source of expression ids: consecutive integers, in ASCII.
+
+    Ids never collide within a process, and a program building its expressions in the same order gets
+    the same ids in every process and run. They are short, so cheap to hash and to send around, and
+    never clash with the structural ids of compiled nodes (see `compiler.structural_id`).
+    """
+
+    def __init__(self, start: int = 0):
+        self._counter = itertools.count(start)
+        self._lock = threading.Lock()
+
+    def __call__(self) -> bytes:
+        with self._lock:
+            return b"%d" % next(self._counter)
+
+
+_allocator = IdAllocator()
 
 
 def gen_id() -> bytes:
-    id_bytes = bytearray(
-        random.getrandbits(8) for _ in range(ID_BYTES)
-    )
-    return base64.b64encode(id_bytes)
+    return _allocator()
 
 
 class Expression:
@@ -31,6 +59,9 @@ class Expression:
     Base class for an arithmetic expression.
     """
 
+    # Fractional bits of the fixed-point value of the node, None for a field element.
+    precision: Optional[int] = None
+
     def __init__(
             self,
             id: Optional[bytes] = None
@@ -41,28 +72,63 @@ class Expression:
         self.id = id
 
     def __add__(self, other):
-        return Addition(self, other)
+        a, b = _aligned(self, other)
+        return _with_precision(Addition(a, b), a.precision)
 
 
     def __sub__(self, other):
-        return Subtraction(self, other)
+        a, b = _aligned(self, other)
+        return _with_precision(Subtraction(a, b), a.precision)
 
 
     def __mul__(self, other):
-        return Multiplication(self, other)
+        return _product(Multiplication, self, other)
+
+
+    def dot(self, other: "Expression") -> "Expression":
+        """Inner product of two vectors."""
+        return _product(DotProduct, self, other)
+
+
+    def sum(self) -> "Expression":
+        """Sum of the elements of a vector."""
+        return _with_precision(SumReduce(self), self.precision)
 
 
     def __hash__(self):
         return hash(self.id)
 
+    def children(self) -> Tuple["Expression", ...]:
+        """Operands of this node, empty for a leaf."""
+        return ()
+
+    def parameters(self) -> dict:
+        """Arguments of the constructor of this node besides its operands and id."""
+        return {}
+
+    @classmethod
+    def from_children(cls, children: Sequence["Expression"], id: Optional[bytes] = None, **parameters) -> "Expression":
+        """Build a node from its operands, as listed by `children`."""
+        return cls(*children, id=id, **parameters)
+
 class Scalar(Expression):
-    """Term representing a scalar finite field value."""
+    """
+    Term representing a scalar finite field value, or a fixed-point real with `precision` fractional
+    bits, stored encoded. Floats are fixed-point, at the precision of the fixed-point operand they are
+    combined with (or `DEFAULT_PRECISION`).
+    """
 
     def __init__(
             self,
-            value: int,
-            id: Optional[bytes] = None
+            value: Union[int, float],
+            id: Optional[bytes] = None,
+            precision: Optional[int] = None
         ):
+        if precision is None and isinstance(value, float):
+            precision = DEFAULT_PRECISION
+        if precision is not None:
+            value = encode(value, precision)
+            self.precision = precision
         self.value = value
         super().__init__(id)
 
@@ -74,27 +140,31 @@ class Scalar(Expression):
     def __hash__(self):
         return
 
-    def serialize(self):
+    def serialize(self, binary: bool = False):
         """Generate a representation suitable for passing in a message."""
-        return json.dumps({"value": self.value})
+        return Share(self.value).serialize(binary)
 
     @staticmethod
     def deserialize(serialized) -> Share:
         """Restore object from its serialized representation."""
-        data = json.loads(serialized)
-        return Share(data["value"])
+        return Share.deserialize(serialized)
 
 
 class Secret(Expression):
-    """Term representing a secret finite field value (variable)."""
+    """
+    Term representing a secret finite field value (variable), or a fixed-point real with `precision`
+    fractional bits: its owner gives its real value, encoded when it is shared.
+    """
 
     def __init__(
             self,
             value: Optional[Share] = None,
             id: Optional[bytes] = None,
+            precision: Optional[int] = None,
     ):
         super().__init__(id)
         self.value = value
+        self.precision = precision
 
 
     def __repr__(self):
@@ -110,6 +180,9 @@ class Addition(Expression):
     def __repr__(self):
         return f"({self.a} + {self.b})"
 
+    def children(self) -> Tuple[Expression, ...]:
+        return (self.a, self.b)
+
 class Subtraction(Expression):
     def __init__(self, a: Expression, b: Expression, id: Optional[bytes] = None):
         super().__init__(id)
@@ -119,6 +192,9 @@ class Subtraction(Expression):
     def __repr__(self):
         return f"({self.a} - {self.b})"
 
+    def children(self) -> Tuple[Expression, ...]:
+        return (self.a, self.b)
+
 class Multiplication(Expression):
     def __init__(self, a: Expression, b: Expression, id: Optional[bytes] = None):
         super().__init__(id)
@@ -126,4 +202,175 @@ class Multiplication(Expression):
         self.b = b
 
     def __repr__(self):
-        return f"({self.a} * {self.b})"
\ No newline at end of file
+        return f"({self.a} * {self.b})"
+
+    def children(self) -> Tuple[Expression, ...]:
+        return (self.a, self.b)
+
+class DotProduct(Expression):
+    """Inner product of two vectors: a single value, opened in one round like a product."""
+
+    def __init__(self, a: Expression, b: Expression, id: Optional[bytes] = None):
+        super().__init__(id)
+        self.a = a
+        self.b = b
+
+    def __repr__(self):
+        return f"({self.a} . {self.b})"
+
+    def children(self) -> Tuple[Expression, ...]:
+        return (self.a, self.b)
+
+class SumReduce(Expression):
+    """Sum of the elements of a vector, computed locally."""
+
+    def __init__(self, a: Expression, id: Optional[bytes] = None):
+        super().__init__(id)
+        self.a = a
+
+    def __repr__(self):
+        return f"sum({self.a})"
+
+    def children(self) -> Tuple[Expression, ...]:
+        return (self.a,)
+
+class InnerProduct(Expression):
+    """
+    Sum of the products of two lists of operands, x1 * y1 + ... + xn * yn: its products are opened in
+    one round, and summed up locally.
+    """
+
+    def __init__(self, xs: Sequence[Expression], ys: Sequence[Expression], id: Optional[bytes] = None):
+        if len(xs) != len(ys) or not xs:
+            raise ValueError(f"Inner product of {len(xs)} and {len(ys)} operands")
+        super().__init__(id)
+        self.xs = tuple(xs)
+        self.ys = tuple(ys)
+
+    def __repr__(self):
+        return " + ".join(f"{x} * {y}" for x, y in zip(self.xs, self.ys)).join("()")
+
+    def children(self) -> Tuple[Expression, ...]:
+        return self.xs + self.ys
+
+    @classmethod
+    def from_children(cls, children: Sequence[Expression], id: Optional[bytes] = None, **parameters) -> Expression:
+        half = len(children) // 2
+        return cls(children[:half], children[half:], id=id)
+
+    def pairs(self) -> Iterator[Tuple[Expression, Expression]]:
+        return zip(self.xs, self.ys)
+
+class Truncation(Expression):
+    """
+    Division of a (signed) value by 2^bits, rounded down or up at random: it takes a round, like a
+    product. Fixed-point products are truncated by their precision.
+    """
+
+    def __init__(self, a: Expression, bits: int, id: Optional[bytes] = None):
+        super().__init__(id)
+        self.a = a
+        self.bits = bits
+        if a.precision is not None:
+            self.precision = a.precision - bits
+
+    def __repr__(self):
+        return f"({self.a} >> {self.bits})"
+
+    def children(self) -> Tuple[Expression, ...]:
+        return (self.a,)
+
+    def parameters(self) -> dict:
+        return {"bits": self.bits}
+
+
+def _with_precision(node: Expression, precision: Optional[int]) -> Expression:
+    if precision is not None:
+        node.precision = precision
+    return node
+
+
+def _matched(a: Expression, b: Expression) -> Tuple[Expression, Expression]:
+    """
+    Fixed-point operands of the same precision: constants are encoded again at that of the other operand.
+    """
+    if a.precision is None or b.precision is None or a.precision == b.precision:
+        return a, b
+    if isinstance(b, Scalar):
+        return a, Scalar(b.value / (1 << b.precision), precision=a.precision)
+    if isinstance(a, Scalar):
+        return Scalar(a.value / (1 << a.precision), precision=b.precision), b
+    raise ValueError(f"Fixed-point operands of different precisions: {a.precision} and {b.precision}")
+
+
+def _aligned(a: Expression, b: Expression) -> Tuple[Expression, Expression]:
+    """
+    Operands of a sum at the same precision: an integer operand of a fixed-point one is scaled up.
+    """
+    a, b = _matched(a, b)
+    precision = a.precision if a.precision is not None else b.precision
+    if precision is None:
+        return a, b
+
+    def scaled(x: Expression) -> Expression:
+        if x.precision is not None:
+            return x
+        if isinstance(x, Scalar):
+            return Scalar(x.value, precision=precision)
+        return _with_precision(Multiplication(x, Scalar(1 << precision)), precision)
+
+    return scaled(a), scaled(b)
+
+
+def inner_product(xs: Sequence[Expression], ys: Sequence[Expression]) -> Expression:
+    """
+    Fused x1 * y1 + ... + xn * yn (see `InnerProduct`), truncated back if the products are fixed-point.
+    """
+    if len(xs) != len(ys):
+        raise ValueError(f"Inner product of {len(xs)} and {len(ys)} operands")
+    pairs = [_matched(x, y) for x, y in zip(xs, ys)]
+    fixed = {(x.precision is not None) + (y.precision is not None) for x, y in pairs}
+    precisions = {x.precision for x, y in pairs} | {y.precision for x, y in pairs}
+    precisions.discard(None)
+    if len(fixed) > 1 or len(precisions) > 1:
+        raise ValueError("The products of an inner product must all have the same precision")
+    node = InnerProduct([x for x, _ in pairs], [y for _, y in pairs])
+    if not precisions:
+        return node
+    precision = precisions.pop()
+    if fixed == {2}:
+        return Truncation(_with_precision(node, 2 * precision), precision)
+    return _with_precision(node, precision)
+
+
+def _product(cls, a: Expression, b: Expression) -> Expression:
+    """
+    Product (or inner product) of two operands: truncated back to their precision if both are fixed-point.
+    """
+    a, b = _matched(a, b)
+    if a.precision is not None and b.precision is not None:
+        return Truncation(_with_precision(cls(a, b), 2 * a.precision), a.precision)
+    return _with_precision(cls(a, b), a.precision if a.precision is not None else b.precision)
+
+
+def postorder(expr: Expression, skip: Container[bytes] = ()) -> Iterator[Expression]:
+    """
+    Iterate over the distinct nodes (by id) of an expression, operands before the nodes using them and
+    left before right, without recursion: expressions as deep as the available memory are supported.
+
+    Nodes whose id is in `skip` (e.g. already evaluated) are neither visited nor descended into.
+    """
+    visited = set()
+    stack = [(expr, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if node.id in visited or node.id in skip:
+            continue
+        if expanded:
+            visited.add(node.id)
+            yield node
+            continue
+        stack.append((node, True))
+        for child in reversed(node.children()):
+            if child.id not in visited and child.id not in skip:
+                stack.append((child, False))
@@ -1,34 +1,172 @@
+"""
+Arithmetic in prime finite fields.
+
+All parties of a protocol must compute in the same field, so the field is part of the protocol
+specification (`ProtocolSpec.field`). `FF` is the default field; larger ones (e.g. `FiniteField(PRIME_128)`)
+can be used at the same time by other protocols.
+"""
+
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+from randomness import RandomSource, default_source
+
+try:
+    import gmpy2
+except ImportError:
+    # Optional: only speeds up inversions and exponentiations in large fields.
+    gmpy2 = None
+
+
 class FiniteField:
     """
-    Implemented as a singleton because all parties must do arithmetic in the same finite field
+    A prime field. Fields of the same order are interchangeable.
+
+    Values are either Python ints or NumPy arrays of field elements (vectors), on which the operations
+    are applied element-wise.
     """
-    _instance = None
-
-    def __new__(cls, order):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.order = order
-        return cls._instance
-
-    def _get_value(self, a) -> int:
-        return a if isinstance(a, int) else a.value
-
-    def add(self, a, b) -> int:
-        return (self._get_value(a) + self._get_value(b)) % self.order
-    
-    def sub(self, a, b) -> int:
-        return (self._get_value(a) - self._get_value(b)) % self.order
-    
-    def mul(self, a, b) -> int:
-        return (self._get_value(a) * self._get_value(b)) % self.order
-    
-    def sum(self, l) -> int:
-        current_sum = 0
-        for e in l:
-            current_sum = self.add(current_sum, e)
 
+    # Vectors of a field whose order fits in that many bits are multiplied with uint64 arithmetic.
+    _NATIVE_BITS = 40
+    _LIMB_BITS = 20
+    # Number of native elements (< 2^40) whose sum cannot overflow 64 bits, so that it is reduced once.
+    _LAZY_TERMS = 1 << (64 - _NATIVE_BITS)
+
+    def __init__(self, order: int):
+        self.order = order
+        self.native = order.bit_length() <= self._NATIVE_BITS
+
+    def __eq__(self, other):
+        return isinstance(other, FiniteField) and other.order == self.order
+
+    def __hash__(self):
+        return hash(self.order)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.order})"
+
+    def _get_value(self, a) -> Union[int, np.ndarray]:
+        return a if isinstance(a, (int, np.ndarray)) else a.value
+
+    def array(self, values: Iterable[int]) -> np.ndarray:
+        """
+        Convert values to a vector of field elements.
+        """
+        if self.native:
+            if isinstance(values, np.ndarray) and values.dtype == np.uint64:
+                return values % np.uint64(self.order)
+            return np.array([int(v) % self.order for v in values], dtype=np.uint64)
+        if isinstance(values, np.ndarray) and values.dtype == object:
+            return values % self.order
+        return np.array([int(v) % self.order for v in values], dtype=object)
+
+    def random(self, size: Optional[int] = None, source: RandomSource = default_source) -> Union[int, np.ndarray]:
+        """
+        Uniformly random element, or vector of `size` elements, drawn from a cryptographically secure
+        source (see `randomness`).
+        """
+        if size is None:
+            return source.below(self.order)
+        values = source.elements(self.order, size)
+        if not self.native and values.dtype != object:
+            return values.astype(object)
+        return values
+
+    def _vectors(self, a, b):
+        if not self.native:
+            # Vectors decoded from the wire may be uint64: compute on Python ints, which do not overflow.
+            a = a.astype(object) if isinstance(a, np.ndarray) and a.dtype != object else a
+            b = b.astype(object) if isinstance(b, np.ndarray) and b.dtype != object else b
+            return a, b
+        # Keep Python ints out of uint64 arithmetic: they may be negative or promote to float.
+        a = a if isinstance(a, np.ndarray) else np.uint64(a % self.order)
+        b = b if isinstance(b, np.ndarray) else np.uint64(b % self.order)
+        return a, b
+
+    def add(self, a, b) -> Union[int, np.ndarray]:
+        a, b = self._get_value(a), self._get_value(b)
+        if type(a) is int and type(b) is int:
+            return (a + b) % self.order
+        a, b = self._vectors(a, b)
+        return (a + b) % self.order
+
+    def sub(self, a, b) -> Union[int, np.ndarray]:
+        a, b = self._get_value(a), self._get_value(b)
+        if type(a) is int and type(b) is int:
+            return (a - b) % self.order
+        a, b = self._vectors(a, b)
+        if not self.native:
+            return (a - b) % self.order
+        # Unsigned arithmetic: add the order before subtracting to stay positive.
+        return (a + (self.order - b)) % self.order
+
+    def mul(self, a, b) -> Union[int, np.ndarray]:
+        a, b = self._get_value(a), self._get_value(b)
+        if type(a) is int and type(b) is int:
+            return (a * b) % self.order
+        a, b = self._vectors(a, b)
+        if not self.native:
+            return (a * b) % self.order
+        # Split b in two limbs so that no partial product overflows 64 bits.
+        order = np.uint64(self.order)
+        limb = np.uint64(self._LIMB_BITS)
+        b_high, b_low = b >> limb, b & np.uint64((1 << self._LIMB_BITS) - 1)
+        return ((((a * b_high) % order) << limb) + a * b_low) % order
+
+    def sum(self, l) -> Union[int, np.ndarray]:
+        """
+        Sum of many values, reduced once rather than after every addition.
+        """
+        values = [self._get_value(e) for e in l]
+        vectors = [v for v in values if isinstance(v, np.ndarray)]
+        total = sum(int(v) for v in values if not isinstance(v, np.ndarray)) % self.order
+        if not vectors:
+            return total
+        if not self.native:
+            return (sum(v.astype(object) for v in vectors) + total) % self.order
+        vectors = [v if v.dtype == np.uint64 else self.array(v) for v in vectors]
+        if len(vectors) < self._LAZY_TERMS:
+            # Elements are below 2^40: their sum fits in 64 bits.
+            return (np.sum(np.stack(vectors), axis=0, dtype=np.uint64) + np.uint64(total)) % np.uint64(self.order)
+        current_sum = total
+        for v in vectors:
+            current_sum = self.add(current_sum, v)
         return current_sum
 
-    
+    def total(self, a) -> int:
+        """
+        Sum of the elements of a vector (a single element is its own sum).
+        """
+        a = self._get_value(a)
+        if not isinstance(a, np.ndarray):
+            return a % self.order
+        if not self.native or a.dtype != np.uint64:
+            return sum(int(v) for v in a) % self.order
+        # Partial sums of native elements that cannot overflow 64 bits.
+        return sum(
+            int(np.sum(a[i:i + self._LAZY_TERMS], dtype=np.uint64)) for i in range(0, len(a), self._LAZY_TERMS)
+        ) % self.order
+
+    def inv(self, a) -> int:
+        """
+        Multiplicative inverse of a non-zero element.
+        """
+        a = self._get_value(a)
+        if gmpy2 is not None:
+            return int(gmpy2.invert(a, self.order))
+        return pow(a, -1, self.order)
+
+    def pow(self, a, exponent: int) -> int:
+        a = self._get_value(a)
+        if gmpy2 is not None:
+            return int(gmpy2.powmod(a, exponent, self.order))
+        return pow(a, exponent, self.order)
+
+
 prime = 100000000003
-FF = FiniteField(prime)
\ No newline at end of file
+# Largest primes below 2^128 and 2^256, for inputs that do not fit in the default field.
+PRIME_128 = 2 ** 128 - 159
+PRIME_256 = 2 ** 256 - 189
+
+FF = FiniteField(prime)
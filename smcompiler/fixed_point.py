@@ -0,0 +1,90 @@
+"""
+Fixed-point encoding of real values as field elements.
+
+A real x is encoded with `precision` fractional bits as round(x * 2^precision), negative values wrapping
+around to the upper half of the field. Sums of encodings encode the sums, but a product has twice the
+fractional bits: it is truncated back by `precision` bits (see `expression.Truncation`).
+
+Truncation is probabilistic, with a pair (r, floor(r / 2^bits)) of random shares: the parties open
+x + 2^(k-1) + r, where r has STATISTICAL_SECURITY more bits than the k-bit values, shift it right and
+subtract the shares of floor(r / 2^bits). The result is floor(x / 2^bits), or one more. The field must
+leave room for r: fixed-point protocols need a large field (e.g. `FiniteField(PRIME_128)`).
+"""
+
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from finite_field import FF, FiniteField
+from randomness import STATISTICAL_SECURITY, RandomSource, default_source
+from secret_sharing import is_vector
+
+DEFAULT_PRECISION = 16
+
+# Operation ids of the truncation pairs served by the trusted third party, see `truncation_op_id`.
+_TRUNCATION_TAG = ".trunc"
+
+
+def encode(value: Union[float, Sequence[float]], precision: int) -> Union[int, List[int]]:
+    """
+    Encoding of a real (or of a vector of reals), as a signed integer: fields reduce it.
+    """
+    if is_vector(value):
+        return [round(float(v) * (1 << precision)) for v in value]
+    return round(float(value) * (1 << precision))
+
+
+def decode(value: Union[int, Sequence[int]], precision: int, field: FiniteField = FF) -> Union[float, List[float]]:
+    """
+    Real (or vector of reals) encoded by a field element.
+    """
+    if is_vector(value):
+        return [decode(int(v), precision, field) for v in value]
+    value = int(value) % field.order
+    if value > field.order // 2:
+        value -= field.order
+    return value / (1 << precision)
+
+
+def value_bits(field: FiniteField) -> int:
+    """
+    Bits k of the values that can be truncated in a field: those in (-2^(k-1), 2^(k-1)).
+    """
+    bits = field.order.bit_length() - STATISTICAL_SECURITY - 2
+    if bits < 2:
+        raise ValueError(f"The field {field} is too small to truncate fixed-point values")
+    return bits
+
+
+def truncation_pair(
+        field: FiniteField,
+        bits: int,
+        size: Optional[int] = None,
+        source: RandomSource = default_source
+    ) -> Tuple[Union[int, np.ndarray], Union[int, np.ndarray]]:
+    """
+    Random mask r of the truncation of `bits` bits, and floor(r / 2^bits) (vectors of `size` elements
+    if it is given).
+    """
+    high_bits = value_bits(field) + STATISTICAL_SECURITY - bits
+    if size is None:
+        r_high, r_low = source.below(1 << high_bits), source.below(1 << bits)
+        return (r_high << bits) + r_low, r_high
+    r_high = [int(v) for v in source.elements(1 << high_bits, size)]
+    r_low = [int(v) for v in source.elements(1 << bits, size)]
+    return field.array((h << bits) + l for h, l in zip(r_high, r_low)), field.array(r_high)
+
+
+def truncation_op_id(label: str, bits: int) -> str:
+    """
+    Id under which the truncation pair of a gate is served, in place of a Beaver triplet.
+    """
+    return f"{label}{_TRUNCATION_TAG}{bits}"
+
+
+def truncated_bits(op_id: str) -> Optional[int]:
+    """
+    Bits truncated by the pair of an operation id, None if it is the id of a Beaver triplet.
+    """
+    _, tag, bits = op_id.rpartition(_TRUNCATION_TAG)
+    return int(bits) if tag and bits.isdigit() else None
@@ -0,0 +1,163 @@
+"""
+Paillier cryptosystem: public-key encryption whose ciphertexts can be added (multiplied together) and
+multiplied by known integers (raised to a power) without decrypting them.
+
+Ciphertexts are plain ints modulo n^2, with generator g = n + 1, so that encrypting m costs one
+exponentiation (the randomizer r^n) and decrypting costs two half-size ones (by CRT).
+Arithmetic uses gmpy2 if it is installed, which speeds it up by an order of magnitude.
+"""
+
+from typing import List, Sequence, Tuple
+
+from randomness import RandomSource, default_source
+
+try:
+    import gmpy2
+except ImportError:
+    # Optional: only speeds up the modular exponentiations.
+    gmpy2 = None
+
+# Primes below 1000, to discard most candidates before the Miller-Rabin test.
+_SMALL_PRIMES = [2] + [p for p in range(3, 1000, 2) if all(p % d for d in range(3, int(p ** 0.5) + 1, 2))]
+_MILLER_RABIN_ROUNDS = 40
+
+
+def powmod(base: int, exponent: int, modulus: int) -> int:
+    if gmpy2 is not None:
+        return int(gmpy2.powmod(base, exponent, modulus))
+    return pow(base, exponent, modulus)
+
+
+def invert(a: int, modulus: int) -> int:
+    if gmpy2 is not None:
+        return int(gmpy2.invert(a, modulus))
+    return pow(a, -1, modulus)
+
+
+def is_probable_prime(n: int, source: RandomSource = default_source) -> bool:
+    if n < 2:
+        return False
+    for p in _SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if gmpy2 is not None:
+        return bool(gmpy2.is_prime(n, _MILLER_RABIN_ROUNDS))
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+    for _ in range(_MILLER_RABIN_ROUNDS):
+        x = pow(2 + source.below(n - 3), d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def random_prime(bits: int, source: RandomSource = default_source) -> int:
+    """
+    Random prime of exactly `bits` bits.
+    """
+    while True:
+        # Top two bits set, so that the product of two such primes has exactly 2 * bits bits.
+        candidate = source.below(1 << bits) | (3 << (bits - 2)) | 1
+        if is_probable_prime(candidate, source):
+            return candidate
+
+
+class PublicKey:
+    """
+    Encryption key: the modulus n.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self.n2 = n * n
+        # Byte length of a ciphertext.
+        self.width = (self.n2.bit_length() + 7) // 8
+
+    def randomizer(self, source: RandomSource = default_source) -> int:
+        """
+        r^n mod n^2 for a random r: multiplying a ciphertext by it re-randomizes it.
+        """
+        return powmod(1 + source.below(self.n - 1), self.n, self.n2)
+
+    def encrypt(self, m: int, source: RandomSource = default_source) -> int:
+        # (n + 1)^m = 1 + m * n mod n^2
+        return (1 + (m % self.n) * self.n) * self.randomizer(source) % self.n2
+
+    def add(self, c1: int, c2: int) -> int:
+        """Encryption of the sum of the plaintexts."""
+        return c1 * c2 % self.n2
+
+    def mul(self, c: int, k: int) -> int:
+        """Encryption of the plaintext times k."""
+        return powmod(c, k, self.n2)
+
+    def to_bytes(self) -> bytes:
+        return self.n.to_bytes((self.n.bit_length() + 7) // 8, "big")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PublicKey":
+        return cls(int.from_bytes(data, "big"))
+
+    def encode(self, ciphertexts: Sequence[int]) -> bytes:
+        """
+        Serialize ciphertexts, at a fixed width each.
+        """
+        return b"".join(c.to_bytes(self.width, "big") for c in ciphertexts)
+
+    def decode(self, data: bytes) -> List[int]:
+        return [int.from_bytes(data[i:i + self.width], "big") for i in range(0, len(data), self.width)]
+
+
+class PrivateKey:
+    """
+    Decryption key: the factors p and q of n. It also encrypts faster than the public key, by CRT.
+    """
+
+    def __init__(self, p: int, q: int):
+        self.p, self.q = p, q
+        self.public_key = PublicKey(p * q)
+        self.p2, self.q2 = p * p, q * q
+        # Decryption modulo p^2 and q^2, see Paillier (1999), section 7.
+        self.h_p = invert(self._l(powmod(self.public_key.n + 1, p - 1, self.p2), p), p)
+        self.h_q = invert(self._l(powmod(self.public_key.n + 1, q - 1, self.q2), q), q)
+        self.q_inv = invert(q, p)
+        self.q2_inv = invert(self.q2, self.p2)
+
+    @staticmethod
+    def _l(x: int, d: int) -> int:
+        return (x - 1) // d
+
+    def _crt(self, x_p: int, x_q: int, p: int, q: int, q_inv: int) -> int:
+        return x_q + ((x_p - x_q) * q_inv % p) * q
+
+    def decrypt(self, c: int) -> int:
+        m_p = self._l(powmod(c, self.p - 1, self.p2), self.p) * self.h_p % self.p
+        m_q = self._l(powmod(c, self.q - 1, self.q2), self.q) * self.h_q % self.q
+        return self._crt(m_p, m_q, self.p, self.q, self.q_inv)
+
+    def encrypt(self, m: int, source: RandomSource = default_source) -> int:
+        key = self.public_key
+        r = 1 + source.below(key.n - 1)
+        # r^n computed modulo p^2 and q^2, half-size moduli.
+        randomizer = self._crt(
+            powmod(r, key.n, self.p2), powmod(r, key.n, self.q2), self.p2, self.q2, self.q2_inv
+        )
+        return (1 + (m % key.n) * key.n) * randomizer % key.n2
+
+
+def generate_keypair(bits: int = 2048, source: RandomSource = default_source) -> Tuple[PublicKey, PrivateKey]:
+    """
+    New key pair, with a modulus n of `bits` bits.
+    """
+    while True:
+        p, q = random_prime(bits // 2, source), random_prime(bits - bits // 2, source)
+        if p != q:
+            private_key = PrivateKey(p, q)
+            return private_key.public_key, private_key
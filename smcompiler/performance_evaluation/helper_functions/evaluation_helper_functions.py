@@ -1,56 +1,67 @@
+import asyncio
+import multiprocessing
+import threading
 import time
 import sys
-import csv
 import os
-import statistics
+import timeit
 from multiprocessing import Process, Queue
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 
-from expression import Secret, Scalar 
+from communication import Communication
+from expression import Secret, Scalar, Addition, Subtraction, inner_product
+from finite_field import FF, FiniteField
 from protocol import ProtocolSpec
-from server import run
-from smc_party import SMCParty
+from scheduler import Schedule
+from secret_sharing import as_share
+import server
+from smc_party import AsyncSMCParty, SMCParty
+from tracing import Tracer, write_chrome_trace
+from transport import LocalTransport
 
 
 # ===============================
 # Helper functions
 # ===============================
 
-def smc_client(client_id, protocol, value_dict, queue):
+def smc_client(client_id, protocol, value_dict, queue, trace=False):
     start_time = time.time()
-    cli = SMCParty(client_id, "localhost", 5000, protocol_spec=protocol, value_dict=value_dict)
+    tracer = Tracer(client_id) if trace else None
+    cli = SMCParty(client_id, "localhost", 5000, protocol_spec=protocol, value_dict=value_dict,
+                   long_poll=True, binary=True, tracer=tracer)
     result = cli.run()
     elapsed = time.time() - start_time
     # Collect communication cost from the client after execution
     comm_cost = cli.comm.bytes_sent + cli.comm.bytes_received
-    queue.put({"client_id": client_id, "elapsed_time": elapsed, "comm_cost": comm_cost, "result": result})
+    queue.put({
+        "client_id": client_id, "elapsed_time": elapsed, "comm_cost": comm_cost, "result": result,
+        "connection_stats": cli.comm.connection_stats(),
+        "trace": tracer.to_dict() if trace else None,
+    })
 
-def smc_server(args):
-    run("localhost", 5000, args)
-
-def run_smc(participants, expr):
+def run_smc(participants, expr, trace_path=None):
+    """
+    Run a protocol with one process per party. With `trace_path`, the runs of the parties are traced and
+    written there as one Chrome trace (see `tracing`).
+    """
     protocol = ProtocolSpec(expr=expr, participant_ids=list(participants.keys()))
     queue = Queue()
 
-    server = Process(target=smc_server, args=(participants,))
-
     clients = [
-        Process(target=smc_client, args=(name, protocol, values, queue))
+        Process(target=smc_client, args=(name, protocol, values, queue, trace_path is not None))
         for name, values in participants.items()
     ]
     
     global_start = time.time()
-    server.start()
-    time.sleep(2)
+    server_process = server.start("localhost", 5000, list(participants.keys()), protocol)
     for client in clients:
         client.start()
 
     for client in clients:
         client.join()
 
-    server.terminate()
-    server.join()
+    server.stop(server_process)
     
     global_elapsed = time.time() - global_start
 
@@ -58,10 +69,198 @@ def run_smc(participants, expr):
     while not queue.empty():
         results.append(queue.get())
 
+    if trace_path is not None:
+        write_chrome_trace(trace_path, [r["trace"] for r in results])
+
     total_comm = sum(r['comm_cost'] for r in results)
     return global_elapsed, total_comm
 
 
+def run_smc_async(participants, expr):
+    """Same as `run_smc`, with all the parties running in one event loop of this process."""
+    protocol = ProtocolSpec(expr=expr, participant_ids=list(participants.keys()))
+    server_process = server.start("localhost", 5000, list(participants.keys()), protocol)
+
+    async def run_parties():
+        parties = [
+            AsyncSMCParty(name, "localhost", 5000, protocol_spec=protocol, value_dict=values,
+                          long_poll=True, binary=True)
+            for name, values in participants.items()
+        ]
+        start_time = time.time()
+        await asyncio.gather(*(party.run() for party in parties))
+        elapsed = time.time() - start_time
+        return elapsed, sum(party.comm.bytes_sent + party.comm.bytes_received for party in parties)
+
+    try:
+        return asyncio.run(run_parties())
+    finally:
+        server.stop(server_process)
+
+
+def run_smc_local(participants, expr, trace_path=None):
+    """
+    Same as `run_smc`, with the parties in threads of this process exchanging their messages in memory:
+    measures the computation of the protocol without the network stack.
+    """
+    protocol = ProtocolSpec(expr=expr, participant_ids=list(participants.keys()))
+    transport = LocalTransport(protocol.participant_ids, protocol)
+    transport.ttp.wait_preprocessing()
+    parties = [
+        SMCParty(name, "localhost", 5000, protocol_spec=protocol, value_dict=values, transport=transport,
+                 tracer=Tracer(name) if trace_path is not None else None)
+        for name, values in participants.items()
+    ]
+    threads = [threading.Thread(target=party.run) for party in parties]
+
+    start_time = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start_time
+    if trace_path is not None:
+        write_chrome_trace(trace_path, [party.tracer for party in parties])
+    return elapsed, sum(party.comm.bytes_sent + party.comm.bytes_received for party in parties)
+
+
+def throughput_client(client_id, num_requests, queue):
+    """Publish then read back messages as fast as possible, to load the server."""
+    comm = Communication("localhost", 5000, client_id, long_poll=True)
+    start_time = time.time()
+    for i in range(num_requests // 2):
+        comm.publish_message(f"load_{i}", str(i))
+        comm.retrieve_public_message(client_id, f"load_{i}")
+    queue.put({"requests": comm.requests_sent, "elapsed_time": time.time() - start_time})
+
+def run_server_throughput(num_parties, requests_per_party, production=True):
+    """Measure the request throughput (requests per second) of the server under `num_parties` clients."""
+    party_ids = [f"P{i+1}" for i in range(num_parties)]
+    queue = Queue()
+
+    clients = [Process(target=throughput_client, args=(pid, requests_per_party, queue)) for pid in party_ids]
+
+    server_process = server.start("localhost", 5000, party_ids, production=production, verbose=False)
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    server.stop(server_process)
+
+    results = [queue.get() for _ in clients]
+    total_requests = sum(r["requests"] for r in results)
+    return total_requests / max(r["elapsed_time"] for r in results)
+
+
+def session_client(session, protocol, secrets, start_event, queue):
+    """Run the parties of one session in one event loop, once `start_event` is set."""
+
+    async def run_parties():
+        parties = [
+            AsyncSMCParty(pid, "localhost", 5000, protocol_spec=protocol, value_dict={secret: 2},
+                          session=session, long_poll=True, binary=True)
+            for pid, secret in zip(protocol.participant_ids, secrets)
+        ]
+        return await asyncio.gather(*(party.run() for party in parties))
+
+    start_event.wait()
+    queue.put(asyncio.run(run_parties()))
+
+
+def run_concurrent_sessions(num_sessions, num_parties=3, num_multiplications=10, production=True):
+    """
+    Run `num_sessions` protocols at the same time on one server, each in its own session (and client
+    process). Returns the throughput of the server in protocols per second.
+    """
+    party_ids = [f"P{i+1}" for i in range(num_parties)]
+    queue = Queue()
+    start_event = multiprocessing.Event()
+
+    server_process = server.start("localhost", 5000, [], production=production, verbose=False)
+    clients = []
+    for k in range(num_sessions):
+        secrets = [Secret() for _ in party_ids]
+        expr = secrets[0]
+        for i in range(num_multiplications):
+            expr = expr * secrets[(i + 1) % num_parties]
+        session = f"session-{k}"
+        Communication("localhost", 5000, party_ids[0], session=session).open_session(party_ids)
+        protocol = ProtocolSpec(expr=expr, participant_ids=party_ids)
+        clients.append(Process(target=session_client, args=(session, protocol, secrets, start_event, queue)))
+
+    for client in clients:
+        client.start()
+    start_time = time.time()
+    start_event.set()
+    results = [queue.get() for _ in clients]
+    elapsed = time.time() - start_time
+    for client in clients:
+        client.join()
+    for k in range(num_sessions):
+        Communication("localhost", 5000, party_ids[0], session=f"session-{k}").close_session()
+    server.stop(server_process)
+
+    assert all(result == FF.pow(2, num_multiplications + 1) for session in results for result in session)
+    return num_sessions / elapsed
+
+
+def recursive_process_expression(party, expr):
+    """Reference evaluator: the recursive walk SMCParty used before its explicit-stack evaluator."""
+    if expr.id in party.results:
+        return party.results[expr.id]
+    if isinstance(expr, Scalar):
+        return expr
+    resA = recursive_process_expression(party, expr.a)
+    resB = recursive_process_expression(party, expr.b)
+    if isinstance(expr, (Addition, Subtraction)):
+        z = party.combine(resA, party.negate(resB) if isinstance(expr, Subtraction) else resB)
+    elif isinstance(resA, Scalar) and isinstance(resB, Scalar):
+        z = Scalar(party.field.mul(resA, resB))
+    else:
+        z = as_share(party.field.mul(resA, resB), party.field)
+    party.results[expr.id] = z
+    return z
+
+def resident_memory(field="VmRSS"):
+    """Resident memory of the process (VmRSS), or its peak since the last reset (VmHWM), in bytes. Linux only."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            if key == field:
+                return int(value.split()[0]) * 1024
+
+def local_evaluation(num_ops, recursive, queue):
+    """
+    Evaluate a chain of scalar additions by a single party, without network, and report the time spent
+    in the evaluator and the growth of the peak memory of the process during the evaluation. The
+    schedule of the iterative evaluator is computed beforehand, as it is when compiling the expression.
+    """
+    secrets = [Secret() for _ in range(num_ops)]
+    expr = generate_scalar_add_expr(secrets)
+    party = SMCParty("P1", "localhost", 5000, ProtocolSpec(participant_ids=["P1"], expr=expr), {})
+    for secret in secrets:
+        party.results[secret.id] = as_share(1)
+    schedule = Schedule(expr)
+    party.consumers = dict(schedule.consumers)
+    if recursive:
+        # One frame per level of the chain (and two for the leaves).
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * num_ops + 1000))
+
+    # Reset the peak resident memory to the current one.
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+    start_memory = resident_memory()
+    start_time = time.time()
+    if recursive:
+        recursive_process_expression(party, expr)
+    else:
+        party.evaluate(schedule.stages[0])
+    elapsed = time.time() - start_time
+    peak_memory = resident_memory("VmHWM") - start_memory
+    queue.put({"elapsed_time": elapsed, "peak_memory": peak_memory})
+
+
 # ===============================
 # Expression Generators
 # ===============================
@@ -95,80 +294,85 @@ def generate_scalar_mul_expr(secret_vars):
     return expr
 
 
-# ===============================
-# Experiment Runners (no logging inside)
-# ===============================
+def generate_mixed_expr(secret_vars):
+    """Creates an expression cycling through additions, multiplications and scalar operations."""
+    expr = secret_vars[0]
+    for i, var in enumerate(secret_vars[1:]):
+        kind = i % 4
+        if kind == 0:
+            expr = expr + var
+        elif kind == 1:
+            expr = expr * var
+        elif kind == 2:
+            expr = expr + (var + Scalar(5))
+        else:
+            expr = expr * (var * Scalar(3))
+    return expr
 
-def run_addition_experiment(num_parties, num_ops):
-    """Evaluate the cost of addition expressions with varying number of parties or operations."""
-    secrets = [Secret() for _ in range(num_ops)]
-    expr = generate_add_expr(secrets)
-    
-    party_ids = [f"P{i+1}" for i in range(num_parties)]
-    secrets_per_party = num_ops // num_parties
-    remaining = num_ops % num_parties
-    participants = {}
-    i = 0
-    for pid in party_ids:
-        count = secrets_per_party + (1 if remaining > 0 else 0)
-        values = {secrets[j]: 1 for j in range(i, i + count)}
-        participants[pid] = values
-        i += count
-        remaining -= 1
 
-    return run_smc(participants, expr)
+def generate_sum_of_products_expr(secret_vars):
+    """Creates the sum of the products of consecutive pairs of secret variables, gate by gate."""
+    expr = secret_vars[0] * secret_vars[1]
+    for i in range(2, len(secret_vars) - 1, 2):
+        expr = expr + secret_vars[i] * secret_vars[i + 1]
+    return expr
 
-def run_multiplication_experiment(num_parties, num_ops):
-    """Evaluate the cost of multiplication expressions with varying number of parties or operations."""
-    secrets = [Secret() for _ in range(num_ops)]
-    expr = generate_mul_expr(secrets)
 
-    party_ids = [f"P{i+1}" for i in range(num_parties)]
-    secrets_per_party = num_ops // num_parties
-    remaining = num_ops % num_parties
-    participants = {}
-    i = 0
-    for pid in party_ids:
-        count = secrets_per_party + (1 if remaining > 0 else 0)
-        values = {secrets[j]: 2 for j in range(i, i + count)}
-        participants[pid] = values
-        i += count
-        remaining -= 1
-    return run_smc(participants, expr)
+def generate_inner_product_expr(secret_vars):
+    """Creates the same sum of products as one fused inner product."""
+    pairs = len(secret_vars) // 2
+    return inner_product(secret_vars[0:2 * pairs:2], secret_vars[1:2 * pairs:2])
 
-def run_scalar_addition_experiment(num_parties, num_ops):
-    """Evaluate the cost of scalar additions with varying number of parties or operations."""
-    secrets = [Secret() for _ in range(num_ops)]
-    expr = generate_scalar_add_expr(secrets)
 
-    party_ids = [f"P{i+1}" for i in range(num_parties)]
-    secrets_per_party = num_ops // num_parties
-    remaining = num_ops % num_parties
-    participants = {}
-    i = 0
-    for pid in party_ids:
-        count = secrets_per_party + (1 if remaining > 0 else 0)
-        values = {secrets[j]: 1 for j in range(i, i + count)}
-        participants[pid] = values
-        i += count
-        remaining -= 1
-    return run_smc(participants, expr)
+EXPRESSION_GENERATORS = {
+    "add": generate_add_expr,
+    "mul": generate_mul_expr,
+    "scalar_add": generate_scalar_add_expr,
+    "scalar_mul": generate_scalar_mul_expr,
+    "mixed": generate_mixed_expr,
+    "sum_of_products": generate_sum_of_products_expr,
+    "inner_product": generate_inner_product_expr,
+}
 
-def run_scalar_multiplication_experiment(num_parties, num_ops):
-    """Evaluate the cost of scalar multiplications with varying number of parties or operations."""
-    secrets = [Secret() for _ in range(num_ops)]
-    expr = generate_scalar_mul_expr(secrets)
 
-    party_ids = [f"P{i+1}" for i in range(num_parties)]
-    secrets_per_party = num_ops // num_parties
-    remaining = num_ops % num_parties
+def split_secrets(secrets, party_ids, value):
+    """Spread the secrets over the parties as evenly as possible, every secret holding `value`."""
     participants = {}
+    secrets_per_party, remaining = divmod(len(secrets), len(party_ids))
     i = 0
     for pid in party_ids:
         count = secrets_per_party + (1 if remaining > 0 else 0)
-        values = {secrets[j]: 2 for j in range(i, i + count)}
-        participants[pid] = values
+        participants[pid] = {secrets[j]: value for j in range(i, i + count)}
         i += count
         remaining -= 1
+    return participants
+
+
+# ===============================
+# Experiment Runners (no logging inside)
+# ===============================
+
+def run_evaluator_experiment(num_ops, recursive):
+    """Evaluate the time and peak memory of the local evaluation of a chain of scalar operations."""
+    queue = Queue()
+    # A fresh process per run, so that the peak memory of a run does not hide the next one.
+    process = Process(target=local_evaluation, args=(num_ops, recursive, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result["elapsed_time"], result["peak_memory"]
 
-    return run_smc(participants, expr)
+def run_field_benchmark(order, operation, size=None, number=1000):
+    """
+    Time one field operation ("add", "sub", "mul" or "sum" of 10 values) on random elements, or on
+    random vectors of `size` elements. Returns the mean time per call in seconds.
+    """
+    field = FiniteField(order)
+    a, b = field.random(size), field.random(size)
+    if operation == "sum":
+        values = [field.random(size) for _ in range(10)]
+        call = lambda: field.sum(values)
+    else:
+        method = getattr(field, operation)
+        call = lambda: method(a, b)
+    return timeit.timeit(call, number=number) / number
@@ -0,0 +1,495 @@
+"""
+Benchmark runner of the SMC protocols, and of the parts they are made of.
+
+Runs a protocol for every point of a grid of settings: number of parties, number of operations, gate
+mix, transport, field size and preprocessing (triplets of the trusted third party, or generated by the
+parties with Paillier encryption, see `preprocessing`). Every point is run a few times to warm up,
+then measured over repeated runs. A run is split into
+* setup: starting the server (or the in-memory transport), not part of the protocol,
+* offline: generating the Beaver triplets and downloading them,
+* online: sharing the inputs, the rounds of the circuit and the reconstruction of the result,
+taken from the traces of the parties (see `tracing`), so that process start-up is never measured.
+
+The results are written as JSON (every run) and CSV (mean and standard deviation of every point, with
+the columns read by `results_plots/plots.py`). Failed runs are reported, and make the runner exit with
+an error. Results can be compared with a baseline (a JSON file written earlier) to catch regressions.
+
+Other suites measure the parts of the protocols over grids of their own, with the same outputs:
+* evaluator: time and peak memory of the recursive and iterative evaluation of deep expressions,
+* server: request throughput of the server, in development and production mode,
+* sessions: protocols per second of a server running concurrent sessions,
+* field: time of the operations of the finite fields, on elements and vectors.
+
+Example:
+    python benchmark.py --parties 3 5 --ops 10 50 --gates add mul --transports local http
+    python benchmark.py --ops 100 --baseline ../performance_evaluation_logs/baseline.json
+    python benchmark.py --gates mul --ops 100 1000 --preprocessing ttp paillier --key-bits 2048
+    python benchmark.py server --parties 1 10 40 --modes production
+    python benchmark.py field --field-bits 37 256 --sizes 1 1000
+"""
+
+import argparse
+import asyncio
+import csv
+import datetime
+import functools
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import Process, Queue
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'helper_functions')))
+from evaluation_helper_functions import (
+    EXPRESSION_GENERATORS, run_concurrent_sessions, run_evaluator_experiment, run_field_benchmark,
+    run_server_throughput, split_secrets
+)
+from expression import Addition, InnerProduct, Multiplication, Scalar, Secret, Subtraction, postorder
+from finite_field import PRIME_128, PRIME_256, FiniteField, prime
+from protocol import PREPROCESSING, ProtocolSpec
+import server
+from smc_party import AsyncSMCParty, SMCParty
+from tracing import Tracer
+from transport import LocalTransport
+
+FIELDS = {37: prime, 128: PRIME_128, 256: PRIME_256}
+TRANSPORTS = ("local", "async", "http")
+EVALUATORS = ("recursive", "iterative")
+SERVER_MODES = ("development", "production")
+FIELD_OPERATIONS = ("add", "sub", "mul", "sum")
+PHASES = ("setup", "offline", "online", "compile")
+# Online phases of the trace of a party, see `SMCParty.run`.
+ONLINE_SPANS = ("input", "round", "stage", "output")
+# Settings identifying a point of the grid of every suite (the options of the suite), the metrics
+# measured, and those compared with the baseline.
+KEYS = {
+    "protocol": ("transport", "gates", "parties", "ops", "field_bits", "preprocessing"),
+    "evaluator": ("evaluator", "ops"),
+    "server": ("mode", "parties", "requests"),
+    "sessions": ("sessions", "parties", "multiplications"),
+    "field": ("field_bits", "operation", "size"),
+}
+METRICS = {
+    "protocol": PHASES + ("bytes", "requests", "rounds"),
+    "evaluator": ("time", "peak_memory"),
+    "server": ("throughput",),
+    "sessions": ("throughput",),
+    "field": ("time",),
+}
+COMPARED = {
+    "protocol": ("online", "offline", "bytes"),
+    "evaluator": ("time", "peak_memory"),
+    "server": ("throughput",),
+    "sessions": ("throughput",),
+    "field": ("time",),
+}
+# Metrics of which a drop (rather than a rise) is a regression.
+HIGHER_IS_BETTER = ("throughput",)
+# Settings of the results written before they were added.
+DEFAULTS = {"suite": "protocol", "preprocessing": "ttp"}
+
+LOG_DIR = os.path.join(os.path.dirname(__file__), '..', 'performance_evaluation_logs')
+
+
+def plain_value(expr, values, field):
+    """Value of an expression computed in the clear, to check the result of the protocol."""
+    results = {}
+    for node in postorder(expr):
+        if isinstance(node, Secret):
+            results[node.id] = values[node] % field.order
+        elif isinstance(node, Scalar):
+            results[node.id] = node.value % field.order
+        elif isinstance(node, Addition):
+            results[node.id] = field.add(results[node.a.id], results[node.b.id])
+        elif isinstance(node, Subtraction):
+            results[node.id] = field.sub(results[node.a.id], results[node.b.id])
+        elif isinstance(node, Multiplication):
+            results[node.id] = field.mul(results[node.a.id], results[node.b.id])
+        elif isinstance(node, InnerProduct):
+            results[node.id] = field.sum([field.mul(results[x.id], results[y.id]) for x, y in node.pairs()])
+    return results[expr.id]
+
+
+def phases_of(trace):
+    """Compile, offline (download of the triplets) and online time of a party, from its trace."""
+    phases = dict.fromkeys(("compile", "offline", "online"), 0.0)
+    for span in trace["spans"]:
+        name = span["name"]
+        if name == "compile":
+            phases["compile"] += span["duration"]
+        elif name == "triplets":
+            phases["offline"] += span["duration"]
+        elif name.split()[0] in ONLINE_SPANS and span["category"] == "round":
+            phases["online"] += span["duration"]
+    return phases
+
+
+def party_report(party, result):
+    """What a party measured during its run."""
+    return {
+        "result": result,
+        "trace": party.tracer.to_dict(),
+        "bytes": party.comm.bytes_sent + party.comm.bytes_received,
+        "requests": party.comm.requests_sent,
+    }
+
+
+def party_client(name, protocol, value_dict, port, queue):
+    """One party in its own process, against the server."""
+    party = SMCParty(name, "localhost", port, protocol, value_dict, long_poll=True, binary=True,
+                     tracer=Tracer(name, nodes=False))
+    result = party.run()
+    queue.put(party_report(party, result))
+
+
+def wait_preprocessed(port, timeout=60.0):
+    deadline = time.time() + timeout
+    while not server.wait_ready("localhost", port, timeout)["preprocessed"]:
+        if time.time() > deadline:
+            raise TimeoutError(f"The triplets are not generated after {timeout} seconds")
+        time.sleep(0.001)
+
+
+def run_local(protocol, participants):
+    """
+    Parties in threads of this process, exchanging their messages in memory.
+    """
+    start = time.perf_counter()
+    transport = LocalTransport(protocol.participant_ids)
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    thread = transport.ttp.preprocess(protocol)
+    if thread is not None:
+        thread.join()
+    preprocessing = time.perf_counter() - start
+
+    parties = [
+        SMCParty(name, "localhost", 0, protocol, values, transport=transport, tracer=Tracer(name, nodes=False))
+        for name, values in participants.items()
+    ]
+    results = {}
+    threads = [threading.Thread(target=lambda p=party: results.update({p.client_id: p.run()})) for party in parties]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    reports = [party_report(party, results.get(party.client_id)) for party in parties]
+    return setup, preprocessing, reports
+
+
+def run_async(protocol, participants, port):
+    """
+    Parties in one event loop of this process, against a server.
+    """
+    start = time.perf_counter()
+    server_process = server.start("localhost", port, protocol.participant_ids, protocol, production=True)
+    setup = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        wait_preprocessed(port)
+        preprocessing = time.perf_counter() - start
+
+        async def run_parties():
+            parties = [
+                AsyncSMCParty(name, "localhost", port, protocol, values, long_poll=True, binary=True,
+                              tracer=Tracer(name, nodes=False))
+                for name, values in participants.items()
+            ]
+            results = await asyncio.gather(*(party.run() for party in parties))
+            return [party_report(party, result) for party, result in zip(parties, results)]
+
+        reports = asyncio.run(run_parties())
+    finally:
+        server.stop(server_process)
+    return setup, preprocessing, reports
+
+
+def run_http(protocol, participants, port, timeout=300.0):
+    """
+    Parties in processes of their own, against a server.
+    """
+    start = time.perf_counter()
+    server_process = server.start("localhost", port, protocol.participant_ids, protocol, production=True)
+    setup = time.perf_counter() - start
+    queue = Queue()
+    clients = [
+        Process(target=party_client, args=(name, protocol, values, port, queue))
+        for name, values in participants.items()
+    ]
+    try:
+        start = time.perf_counter()
+        wait_preprocessed(port)
+        preprocessing = time.perf_counter() - start
+
+        for client in clients:
+            client.start()
+        reports = [queue.get(timeout=timeout) for _ in clients]
+    finally:
+        for client in clients:
+            if client.is_alive():
+                client.terminate()
+            client.join()
+        server.stop(server_process)
+    return setup, preprocessing, reports
+
+
+def run_once(config, port):
+    """
+    Run the protocol of a point of the grid once, and measure it.
+    """
+    field = FiniteField(FIELDS[config["field_bits"]])
+    secrets = [Secret() for _ in range(config["ops"])]
+    expr = EXPRESSION_GENERATORS[config["gates"]](secrets)
+    party_ids = [f"P{i + 1}" for i in range(config["parties"])]
+    participants = split_secrets(secrets, party_ids, 2)
+    protocol = ProtocolSpec(
+        participant_ids=party_ids, expr=expr, field=field,
+        preprocessing=config["preprocessing"], key_bits=config["key_bits"]
+    )
+
+    transport = config["transport"]
+    if transport == "local":
+        setup, preprocessing, reports = run_local(protocol, participants)
+    elif transport == "async":
+        setup, preprocessing, reports = run_async(protocol, participants, port)
+    else:
+        setup, preprocessing, reports = run_http(protocol, participants, port)
+
+    expected = plain_value(expr, {s: v for values in participants.values() for s, v in values.items()}, field)
+    wrong = [report["result"] for report in reports if report["result"] != expected]
+    if wrong:
+        raise AssertionError(f"Wrong result {wrong[0]}, expected {expected}")
+
+    # The protocol is over when the slowest party is done.
+    phases = [phases_of(report["trace"]) for report in reports]
+    rounds = max(sum(1 for span in report["trace"]["spans"] if span["name"].startswith("round ")) for report in reports)
+    return {
+        "setup": setup,
+        "offline": preprocessing + max(p["offline"] for p in phases),
+        "online": max(p["online"] for p in phases),
+        "compile": max(p["compile"] for p in phases),
+        "bytes": sum(report["bytes"] for report in reports),
+        "requests": sum(report["requests"] for report in reports),
+        "rounds": rounds,
+    }
+
+
+def measure_evaluator(config):
+    elapsed, peak_memory = run_evaluator_experiment(config["ops"], config["evaluator"] == "recursive")
+    return {"time": elapsed, "peak_memory": peak_memory}
+
+
+def measure_server(config):
+    production = config["mode"] == "production"
+    return {"throughput": run_server_throughput(config["parties"], config["requests"], production=production)}
+
+
+def measure_sessions(config):
+    return {"throughput": run_concurrent_sessions(config["sessions"], config["parties"], config["multiplications"])}
+
+
+def measure_field(config):
+    """Mean time of a call, a size of 1 standing for single elements."""
+    size = config["size"] if config["size"] > 1 else None
+    # Fewer calls on large vectors, for every setting to take about the same time.
+    number = 10000 if size is None else max(10, 1000000 // (size * 10))
+    return {"time": run_field_benchmark(FIELDS[config["field_bits"]], config["operation"], size, number)}
+
+
+def run_point(config, warmup, repeats, measure, metrics):
+    """
+    Warm up, then measure the repeated runs of a point of the grid. Failures are recorded.
+    """
+    runs, errors = [], []
+    for i in range(warmup + repeats):
+        try:
+            run = measure(config)
+        except Exception:
+            errors.append(traceback.format_exc())
+            print(f"  run {i + 1} failed:\n{errors[-1]}", file=sys.stderr)
+            continue
+        if i >= warmup:
+            runs.append(run)
+    summary = dict(config, repeats=len(runs), failures=len(errors))
+    for metric in metrics:
+        values = [run[metric] for run in runs]
+        summary[f"mean_{metric}"] = statistics.mean(values) if values else None
+        summary[f"std_{metric}"] = statistics.stdev(values) if len(values) > 1 else 0.0
+    return {"config": config, "summary": summary, "runs": runs, "errors": errors}
+
+
+def plot_columns(summary):
+    """Columns read by `results_plots/plots.py`: the online time is the computation cost."""
+    return {
+        "num_parties": summary["parties"],
+        "num_operations": summary["ops"],
+        "mean_computation_time": summary["mean_online"],
+        "std_computation_time": summary["std_online"],
+        "mean_communication_cost": summary["mean_bytes"],
+        "std_communication_cost": summary["std_bytes"],
+    }
+
+
+def write_results(results, prefix, options):
+    metadata = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "suite": options.suite,
+        "warmup": options.warmup,
+        "repeats": options.repeats,
+    }
+    with open(f"{prefix}.json", "w") as f:
+        json.dump({"metadata": metadata, "results": results}, f, indent=2)
+
+    rows = [result["summary"] for result in results]
+    if options.suite == "protocol":
+        rows = [dict(row, **plot_columns(row)) for row in rows]
+    with open(f"{prefix}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def point_of(config):
+    suite = config.get("suite", DEFAULTS["suite"])
+    return (suite,) + tuple(config.get(key, DEFAULTS.get(key)) for key in KEYS[suite])
+
+
+def compare(results, baseline_path, tolerance):
+    """
+    Compare the means with those of a baseline. Returns the regressions: points slower (or sending more
+    bytes, or serving fewer requests) than the baseline by more than `tolerance` (relative).
+    """
+    with open(baseline_path) as f:
+        baseline = {
+            point_of(result["config"]): result["summary"] for result in json.load(f)["results"]
+        }
+    regressions = []
+    for result in results:
+        point = point_of(result["config"])
+        before = baseline.get(point)
+        if before is None:
+            continue
+        suite = point[0]
+        for metric in COMPARED[suite]:
+            old, new = before[f"mean_{metric}"], result["summary"][f"mean_{metric}"]
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            settings = dict(zip(KEYS[suite], point[1:]))
+            print(f"{suite} {settings} {metric}: {old:.6g} -> {new:.6g} ({change:+.1%}) {flag}")
+            if worse > tolerance:
+                regressions.append((point, metric, old, new))
+    return regressions
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the SMC protocols (the default suite), or the parts they are made of."
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--warmup", type=int, default=1, help="runs discarded before measuring")
+    common.add_argument("--repeats", type=int, default=5, help="measured runs per point")
+    common.add_argument("--output", help="prefix of the result files (default: benchmark[_<suite>] in the logs)")
+    common.add_argument("--baseline", help="results (JSON) to compare with")
+    common.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    common.add_argument("--verbose", action="store_true", help="log the requests of the clients (measured too)")
+    # The options of a setting are named after the key of the setting, see `KEYS`.
+    suites = parser.add_subparsers(dest="suite", metavar="suite")
+
+    protocol = suites.add_parser("protocol", parents=[common], help="the protocols over a grid of settings")
+    protocol.add_argument("--parties", type=int, nargs="+", default=[3])
+    protocol.add_argument("--ops", type=int, nargs="+", default=[10, 30, 70, 100], help="secrets (operations + 1)")
+    protocol.add_argument("--gates", nargs="+", default=["add"], choices=sorted(EXPRESSION_GENERATORS))
+    protocol.add_argument("--transports", dest="transport", nargs="+", default=["local"], choices=TRANSPORTS)
+    protocol.add_argument("--field-bits", type=int, nargs="+", default=[37], choices=sorted(FIELDS))
+    protocol.add_argument("--preprocessing", nargs="+", default=["ttp"], choices=PREPROCESSING)
+    protocol.add_argument("--key-bits", type=int, default=2048, help="size of the Paillier keys")
+    protocol.add_argument("--port", type=int, default=5000, help="port of the server (async and http)")
+
+    evaluator = suites.add_parser("evaluator", parents=[common], help="evaluators of deep expressions")
+    evaluator.add_argument("--ops", type=int, nargs="+", default=[1000, 10000, 50000, 100000],
+                           help="length of the chain of scalar additions")
+    evaluator.add_argument("--evaluators", dest="evaluator", nargs="+", default=list(EVALUATORS), choices=EVALUATORS)
+
+    throughput = suites.add_parser("server", parents=[common], help="request throughput of the server")
+    throughput.add_argument("--parties", type=int, nargs="+", default=[1, 5, 10, 20, 40])
+    throughput.add_argument("--requests", type=int, nargs="+", default=[200], help="requests sent by each party")
+    throughput.add_argument("--modes", dest="mode", nargs="+", default=list(SERVER_MODES), choices=SERVER_MODES)
+
+    sessions = suites.add_parser("sessions", parents=[common], help="concurrent sessions on one server")
+    sessions.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    sessions.add_argument("--parties", type=int, nargs="+", default=[3])
+    sessions.add_argument("--multiplications", type=int, nargs="+", default=[10])
+
+    field = suites.add_parser("field", parents=[common], help="operations of the finite fields")
+    field.add_argument("--field-bits", type=int, nargs="+", default=sorted(FIELDS), choices=sorted(FIELDS))
+    field.add_argument("--operations", dest="operation", nargs="+", default=list(FIELD_OPERATIONS),
+                       choices=FIELD_OPERATIONS)
+    field.add_argument("--sizes", dest="size", type=int, nargs="+", default=[1, 1000, 100000],
+                       help="size of the vectors, 1 for single elements")
+
+    # The protocols are benchmarked when no suite is named.
+    if not args or args[0] not in suites.choices and args[0] not in ("-h", "--help"):
+        args = ["protocol"] + list(args)
+    options = parser.parse_args(args)
+    # The clients log their requests at the debug level; the processes of the parties inherit the level.
+    logging.basicConfig(format="%(message)s", level=logging.WARNING)
+    logging.getLogger("smc.client").setLevel(logging.DEBUG if options.verbose else logging.WARNING)
+    suite = options.suite
+    if options.output is None:
+        options.output = os.path.join(LOG_DIR, "benchmark" if suite == "protocol" else f"benchmark_{suite}")
+    measure = {
+        "protocol": functools.partial(run_once, port=getattr(options, "port", None)),
+        "evaluator": measure_evaluator,
+        "server": measure_server,
+        "sessions": measure_sessions,
+        "field": measure_field,
+    }[suite]
+
+    grid = itertools.product(*(getattr(options, key) for key in KEYS[suite]))
+    results = []
+    for point in grid:
+        config = dict(zip(KEYS[suite], point), suite=suite)
+        if suite == "protocol":
+            config["key_bits"] = options.key_bits
+            if config["transport"] == "async" and config["preprocessing"] != "ttp":
+                print(f"{config}: skipped, the async parties only use the triplets of the trusted third party")
+                continue
+        result = run_point(config, options.warmup, options.repeats, measure, METRICS[suite])
+        summary = result["summary"]
+        if suite == "protocol" and summary["mean_online"] is not None:
+            print(
+                f"{config}: online {summary['mean_online'] * 1e3:.2f} ms, "
+                f"offline {summary['mean_offline'] * 1e3:.2f} ms, {summary['mean_bytes']:.0f} bytes, "
+                f"{summary['mean_rounds']:.0f} rounds"
+            )
+        elif suite != "protocol" and result["runs"]:
+            means = ", ".join(f"{metric} {summary[f'mean_{metric}']:.6g}" for metric in METRICS[suite])
+            print(f"{config}: {means}")
+        results.append(result)
+
+    os.makedirs(os.path.dirname(os.path.abspath(options.output)), exist_ok=True)
+    write_results(results, options.output, options)
+    print(f"Results saved to {options.output}.json and {options.output}.csv")
+
+    failures = sum(result["summary"]["failures"] for result in results)
+    regressions = compare(results, options.baseline, options.tolerance) if options.baseline else []
+    if failures:
+        print(f"{failures} run(s) failed", file=sys.stderr)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {options.baseline}", file=sys.stderr)
+    return 1 if failures or regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -6,7 +6,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import os
 
-def plot_experiment_results(csv_path, metric, ylabel, title, output_name):
+def plot_experiment_results(csv_path, metric, ylabel, title, output_name, filters=None, x_column=None):
     """
     Plot mean ± std error bars for a metric (computation or communication) using pandas.
 
@@ -16,9 +16,14 @@ def plot_experiment_results(csv_path, metric, ylabel, title, output_name):
         ylabel (str): Label for the y-axis.
         title (str): Plot title.
         output_name (str): Filename to save the plot (without extension).
+        filters (dict): Only plot the rows with these values, e.g. {"gates": "mul", "transport": "http"}
+            for the results of the benchmark runner.
+        x_column (str): Column on the x-axis (default: "num_operations", or "num_parties" if absent).
     """
     # Read the CSV file
     df = pd.read_csv(csv_path)
+    for column, value in (filters or {}).items():
+        df = df[df[column] == value]
 
     # Select appropriate columns based on the metric
     if metric == "computation":
@@ -30,12 +35,14 @@ def plot_experiment_results(csv_path, metric, ylabel, title, output_name):
     else:
         raise ValueError("Metric must be either 'computation' or 'communication'.")
 
-    x = df["num_operations"] if "num_operations" in df.columns else df["num_parties"]
+    if x_column is None:
+        x_column = "num_operations" if "num_operations" in df.columns else "num_parties"
+    x = df[x_column]
 
     # Plotting
     plt.figure()
     plt.errorbar(x, y, yerr=yerr, fmt='o-', capsize=5, linewidth=2)
-    plt.xlabel("Number of Operations" if "num_operations" in df.columns else "Number of Parties")
+    plt.xlabel("Number of Operations" if x_column == "num_operations" else "Number of Parties")
     plt.ylabel(ylabel)
     plt.title(title)
     plt.grid(True)
@@ -138,3 +145,29 @@ plot_experiment_results(
     title="Communication Cost vs Number of Parties",
     output_name="num_parties_communication_cost"
 )
+
+# =========================
+# Usage for the benchmark runner (performance_evaluation_scripts/benchmark.py)
+# =========================
+benchmark_csv = "../performance_evaluation_logs/benchmark.csv"
+if os.path.exists(benchmark_csv):
+    settings = ["transport", "gates", "parties", "field_bits", "preprocessing"]
+    for values, _ in pd.read_csv(benchmark_csv).groupby(settings):
+        filters = dict(zip(settings, values))
+        name = "_".join(str(value) for value in values)
+        plot_experiment_results(
+            csv_path=benchmark_csv,
+            metric="computation",
+            ylabel="Online Time (s)",
+            title=f"Online Time vs Number of Operations ({name})",
+            output_name=f"benchmark_{name}_computation_cost",
+            filters=filters,
+        )
+        plot_experiment_results(
+            csv_path=benchmark_csv,
+            metric="communication",
+            ylabel="Communication Cost (bytes)",
+            title=f"Communication Cost vs Number of Operations ({name})",
+            output_name=f"benchmark_{name}_communication_cost",
+            filters=filters,
+        )
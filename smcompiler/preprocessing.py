@@ -0,0 +1,196 @@
+"""
+Generation of the Beaver triplets by the parties themselves, without a trusted third party.
+
+Every party i draws its shares a_i and b_i at random. The product c = (sum a_i) (sum b_j) is the sum
+of the local products a_i b_i and of the cross products a_i b_j, which are turned into additive
+shares with Paillier encryption (semi-honest parties):
+1. i publishes its public key and the encryptions of its a_i, one per triplet, under its own key;
+2. j raises them to its b_j and adds a random mask r_ij, hiding the product statistically, under the
+   key of i: i decrypts a_i b_j + r_ij, j keeps -r_ij as its share of the cross product.
+The responses of j are packed, many triplets per ciphertext (one slot each), so that the costly
+operations are amortized over the batch. The whole batch takes two rounds of messages.
+
+The truncation pairs of the fixed-point protocols need no messages: every party draws its share of r
+as a random integer, split into its high and low bits, whose sums are shares of r and of (almost)
+floor(r / 2^bits): the carry of the low bits makes truncations up to n - 1 units larger than with the
+pairs of the trusted third party.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from communication import Communication
+from finite_field import FF, FiniteField
+from fixed_point import truncated_bits, value_bits
+from paillier import PrivateKey, PublicKey, generate_keypair, powmod
+from randomness import STATISTICAL_SECURITY, RandomSource, default_source
+from secret_sharing import Share, VectorShare
+
+DEFAULT_KEY_BITS = 2048
+
+
+class PaillierTripletGenerator:
+    """
+    Generator of the additive shares of Beaver triplets of one party, with its peers.
+
+    Attributes:
+        comm: communication layer of the party
+        participant_ids: all the parties generating the triplets
+        field: field of the triplets
+        key_bits: size of the Paillier modulus of the party
+    """
+
+    def __init__(
+            self,
+            comm: Communication,
+            participant_ids: List[str],
+            field: FiniteField = FF,
+            key_bits: int = DEFAULT_KEY_BITS,
+            source: RandomSource = default_source
+        ):
+        self.comm = comm
+        self.participant_ids = participant_ids
+        self.field = field
+        self.key_bits = key_bits
+        self.source = source
+        self.peers = [p for p in participant_ids if p != comm.client_id]
+        # Number of batches generated so far, so that the labels of their messages are unique.
+        self.batch = 0
+        self._private_key: Optional[PrivateKey] = None
+        # Bits of a slot: a cross product and its mask, without carry into the next slot.
+        self.slot_bits = 2 * field.order.bit_length() + STATISTICAL_SECURITY + 1
+        self.slots = (key_bits - 1) // self.slot_bits
+        if self.slots < 1:
+            raise ValueError(f"A {key_bits}-bit key is too small for the field {field}")
+
+    @property
+    def private_key(self) -> PrivateKey:
+        if self._private_key is None:
+            self._private_key = generate_keypair(self.key_bits, self.source)[1]
+        return self._private_key
+
+    def generate(self, count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Generate `count` triplets with the peers (which must ask for as many).
+
+        Returns:
+            the shares of this party of a, b and c, as vectors
+        """
+        field = self.field
+        a, b = field.random(count), field.random(count)
+        c = field.mul(a, b)
+        if not self.peers:
+            return a, b, c
+
+        prefix = f"triplets-{self.batch}"
+        self.batch += 1
+        private_key = self.private_key
+        public_key = private_key.public_key
+
+        # Round 1: the key and the encrypted shares of a.
+        encrypted_a = public_key.encode([private_key.encrypt(int(x), self.source) for x in a])
+        self.comm.publish_many({f"{prefix}-key": public_key.to_bytes(), f"{prefix}-a": encrypted_a})
+        published = self.comm.retrieve_many(self.peers, [f"{prefix}-key", f"{prefix}-a"])
+
+        # Round 2: the masked cross products, encrypted under the key of the peer they are sent to.
+        responses = dict()
+        cross = [int(x) for x in c]
+        for peer in self.peers:
+            peer_key = PublicKey.from_bytes(published[(peer, f"{prefix}-key")])
+            peer_a = peer_key.decode(published[(peer, f"{prefix}-a")])
+            if len(peer_a) != count:
+                raise ValueError(f"{peer} generates {len(peer_a)} triplets, not {count}")
+            response, masks = self.respond(peer_key, peer_a, b)
+            responses[(peer, f"{prefix}-{self.comm.client_id}")] = peer_key.encode(response)
+            cross = [(x - r) % field.order for x, r in zip(cross, masks)]
+        self.comm.send_private_many(responses)
+
+        received = self.comm.retrieve_private_many(f"{prefix}-{peer}" for peer in self.peers)
+        for peer in self.peers:
+            response = public_key.decode(received[f"{prefix}-{peer}"])
+            products = self.unpack([private_key.decrypt(x) for x in response], count)
+            cross = [(x + y) % field.order for x, y in zip(cross, products)]
+        return a, b, field.array(cross)
+
+    def respond(self, key: PublicKey, encrypted_a: List[int], b: np.ndarray) -> Tuple[List[int], List[int]]:
+        """
+        Encrypt the products of the shares of a peer with ours, masked, packed `slots` per ciphertext.
+
+        Returns:
+            the ciphertexts, and the masks (of every triplet)
+        """
+        bound = self.field.order ** 2 << STATISTICAL_SECURITY
+        masks = [self.source.below(bound) for _ in range(len(encrypted_a))]
+        shift = 1 << self.slot_bits
+        ciphertexts = []
+        for start in range(0, len(encrypted_a), self.slots):
+            end = min(start + self.slots, len(encrypted_a))
+            # Horner: slot k holds a_k b_k + r_k, in bits [k * slot_bits, (k + 1) * slot_bits).
+            acc, packed_masks = 1, 0
+            for k in reversed(range(start, end)):
+                if acc != 1:
+                    acc = powmod(acc, shift, key.n2)
+                acc = acc * powmod(encrypted_a[k], int(b[k]), key.n2) % key.n2
+                packed_masks = (packed_masks << self.slot_bits) | masks[k]
+            # Adding a fresh encryption also re-randomizes the ciphertext, which hides b.
+            ciphertexts.append(key.add(acc, key.encrypt(packed_masks, self.source)))
+        return ciphertexts, masks
+
+    def unpack(self, plaintexts: List[int], count: int) -> List[int]:
+        """
+        Products of the slots of the decrypted responses, reduced in the field.
+        """
+        slot_mask = (1 << self.slot_bits) - 1
+        values = []
+        for plaintext in plaintexts:
+            for _ in range(min(self.slots, count - len(values))):
+                values.append((plaintext & slot_mask) % self.field.order)
+                plaintext >>= self.slot_bits
+        return values
+
+    def triplets(
+            self,
+            op_ids: List[str],
+            sizes: Optional[Dict[str, int]] = None
+        ) -> Dict[str, Tuple[Share, Share, Share]]:
+        """
+        Triplets of several operations, as `Communication.retrieve_beaver_triplet_shares_many` returns
+        them: one batch for all of them. `sizes` gives the vector size of the operations on vectors.
+        Truncation pairs are drawn locally.
+        """
+        sizes = sizes or dict()
+        triplets = dict()
+        products = []
+        for op_id in op_ids:
+            bits = truncated_bits(op_id)
+            if bits is None:
+                products.append(op_id)
+            else:
+                triplets[op_id] = self.truncation_pair(bits, sizes.get(op_id))
+
+        counts = [sizes.get(op_id) or 1 for op_id in products]
+        a, b, c = self.generate(sum(counts))
+        start = 0
+        for op_id, count in zip(products, counts):
+            end = start + count
+            if op_id in sizes:
+                triplets[op_id] = tuple(VectorShare(x[start:end], self.field) for x in (a, b, c))
+            else:
+                triplets[op_id] = tuple(Share(int(x[start])) for x in (a, b, c))
+            start = end
+        return triplets
+
+    def truncation_pair(self, bits: int, size: Optional[int] = None) -> Tuple[Share, Share]:
+        """
+        Shares of this party of a truncation pair (r, floor(r / 2^bits)), see `fixed_point`.
+        """
+        # The shares of the parties sum up to r < 2^(k + STATISTICAL_SECURITY), as in `fixed_point`.
+        high_bound = (1 << (value_bits(self.field) + STATISTICAL_SECURITY - bits)) // len(self.participant_ids)
+        count = size or 1
+        r_high = [int(v) for v in self.source.elements(high_bound, count)]
+        r_low = [int(v) for v in self.source.elements(1 << bits, count)]
+        r = [(h << bits) + l for h, l in zip(r_high, r_low)]
+        if size is None:
+            return Share(r[0]), Share(r_high[0])
+        return VectorShare(self.field.array(r), self.field), VectorShare(self.field.array(r_high), self.field)
@@ -1,4 +1,10 @@
-from expression import Expression
+from typing import Optional, Union
+
+from expression import Expression, postorder
+from finite_field import FF, FiniteField
+from secret_sharing import AdditiveScheme, ShamirScheme
+
+PREPROCESSING = ("ttp", "paillier")
 
 
 class ProtocolSpec:
@@ -7,8 +13,68 @@ class ProtocolSpec:
     Attributes:
         participant_ids: List of IDs of the participating clients
         expr: Expression to be computed
+        field: Finite field in which the expression is computed (and the secrets shared). Fixed-point
+            products are truncated, which needs a large field (see `fixed_point`).
+        threshold: If set, values are Shamir-shared with this threshold t: any t + 1 parties can
+            reconstruct them, so the protocol completes without waiting for the others. Otherwise,
+            values are additively shared among all the participants.
+        preprocessing: How the Beaver triplets are generated: "ttp" (by the trusted third party of the
+            server) or "paillier" (by the parties themselves, see `preprocessing`; additive sharing only).
+        key_bits: Size of the Paillier keys of the parties, with "paillier" preprocessing.
     """
 
-    def __init__(self, participant_ids: list, expr: Expression):
+    def __init__(
+            self,
+            participant_ids: list,
+            expr: Expression,
+            field: FiniteField = FF,
+            threshold: Optional[int] = None,
+            preprocessing: str = "ttp",
+            key_bits: int = 2048
+        ):
+        if preprocessing not in PREPROCESSING:
+            raise ValueError(f"Unknown preprocessing {preprocessing!r}, expected one of {PREPROCESSING}")
+        if preprocessing != "ttp" and threshold is not None:
+            raise ValueError(f"{preprocessing} preprocessing generates additive triplets only")
         self.participant_ids = participant_ids
         self.expr = expr
+        self.field = field
+        self.threshold = threshold
+        self.preprocessing = preprocessing
+        self.key_bits = key_bits
+
+    def sharing_scheme(self) -> Union[AdditiveScheme, ShamirScheme]:
+        """
+        The secret sharing scheme of the protocol.
+        """
+        if self.threshold is None:
+            return AdditiveScheme(self.participant_ids, self.field)
+        return ShamirScheme(self.participant_ids, self.threshold, self.field)
+
+    def __getstate__(self):
+        # Pickling follows the nesting of the expression and would exceed the recursion limit on deep
+        # circuits: the expression is flattened into a list of nodes, operands referenced by index.
+        state = self.__dict__.copy()
+        index = dict()
+        nodes = []
+        for node in postorder(self.expr):
+            children = node.children()
+            if children:
+                nodes.append((
+                    type(node), node.id, tuple(index[child.id] for child in children), node.parameters(), node.precision
+                ))
+            else:
+                nodes.append((node, None, None, None, None))
+            index[node.id] = len(nodes) - 1
+        state["expr"] = nodes
+        return state
+
+    def __setstate__(self, state):
+        built = []
+        for node, node_id, children, parameters, precision in state["expr"]:
+            if children is not None:
+                node = node.from_children([built[i] for i in children], id=node_id, **parameters)
+                node.precision = precision
+            built.append(node)
+        self.__dict__.update(state)
+        self.expr = built[-1]
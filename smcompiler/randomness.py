@@ -0,0 +1,127 @@
+"""
+Cryptographically secure randomness for the shares and the triplets.
+
+Field elements are drawn in bulk from a seeded PRG: SHAKE-256 expanded in counter mode, read in
+chunks, so that the cost of drawing many elements is that of hashing their bytes rather than of one
+Python call per element. Elements are drawn by rejection sampling (masked to the bit length of the
+order, rejected if they exceed it), which is unbiased and vectorized with NumPy for orders of up to
+64 bits.
+
+The default source is seeded from the OS and reseeded in child processes, so that parties forked from
+the same parent do not share their randomness. A source can be given a seed for reproducible runs.
+"""
+
+import hashlib
+import os
+import threading
+import weakref
+from typing import Optional
+
+import numpy as np
+
+SEED_BYTES = 32
+# Masks of secret values (e.g. of the triplets generated by the parties, or of the fixed-point
+# truncations) hide them up to a statistical distance of 2^-STATISTICAL_SECURITY.
+STATISTICAL_SECURITY = 40
+
+# Sources to reseed in a forked child process.
+_sources: "weakref.WeakSet[RandomSource]" = weakref.WeakSet()
+
+
+class RandomSource:
+    """
+    Stream of random bytes and field elements, safe to use from several threads.
+
+    Attributes:
+        chunk_size: number of bytes generated at once
+    """
+
+    def __init__(self, seed: Optional[bytes] = None, chunk_size: int = 1 << 16):
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self.reseed(seed)
+        # Only the sources seeded from the OS are reseeded after a fork: seeded ones are reproducible.
+        self._system_seeded = seed is None
+        _sources.add(self)
+
+    def reseed(self, seed: Optional[bytes] = None) -> None:
+        """
+        Restart the stream from a seed (a fresh one from the OS if None).
+        """
+        with self._lock:
+            self._seed = os.urandom(SEED_BYTES) if seed is None else bytes(seed)
+            self._counter = 0
+            self._buffer = b""
+            self._offset = 0
+
+    def _expand(self, size: int) -> bytes:
+        block = hashlib.shake_256(self._seed + self._counter.to_bytes(8, "big")).digest(size)
+        self._counter += 1
+        return block
+
+    def read(self, size: int) -> bytes:
+        """
+        Next `size` random bytes.
+        """
+        with self._lock:
+            available = len(self._buffer) - self._offset
+            if size > available:
+                self._buffer = self._buffer[self._offset:] + self._expand(max(self.chunk_size, size - available))
+                self._offset = 0
+            data = self._buffer[self._offset:self._offset + size]
+            self._offset += size
+            return data
+
+    def below(self, bound: int) -> int:
+        """
+        Uniformly random integer in [0, bound).
+        """
+        bits = (bound - 1).bit_length()
+        width = (bits + 7) // 8
+        mask = (1 << bits) - 1
+        while True:
+            value = int.from_bytes(self.read(width), "big") & mask
+            if value < bound:
+                return value
+
+    def elements(self, bound: int, size: int) -> np.ndarray:
+        """
+        Vector of `size` uniformly random integers in [0, bound): uint64 if bound fits in 64 bits,
+        Python ints (object) otherwise.
+        """
+        bits = (bound - 1).bit_length()
+        # Draw enough words for all of them to be accepted with high probability.
+        acceptance = bound / (1 << bits)
+        if bits > 64:
+            width = (bits + 7) // 8
+            mask = (1 << bits) - 1
+            values = []
+            while len(values) < size:
+                count = int((size - len(values)) / acceptance * 1.05) + 16
+                data = self.read(width * count)
+                words = (int.from_bytes(data[i:i + width], "big") & mask for i in range(0, len(data), width))
+                values.extend(word for word in words if word < bound)
+            return np.array(values[:size], dtype=object)
+
+        mask = np.uint64((1 << bits) - 1)
+        values = np.empty(0, dtype=np.uint64)
+        while len(values) < size:
+            count = int((size - len(values)) / acceptance * 1.05) + 16
+            words = np.frombuffer(self.read(8 * count), dtype="<u8") & mask
+            values = np.concatenate((values, words[words < np.uint64(bound)]))
+        return values[:size]
+
+
+default_source = RandomSource()
+
+
+def _reseed_after_fork() -> None:
+    for source in list(_sources):
+        # The lock may have been held by another thread of the parent at the time of the fork.
+        source._lock = threading.Lock()
+        if source._system_seeded:
+            source.reseed()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reseed_after_fork)
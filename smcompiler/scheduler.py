@@ -0,0 +1,97 @@
+"""
+Round scheduling for the evaluation of an expression.
+
+Every multiplication of two secret values costs one Beaver round (open x - a and y - b), and so do the
+dot products and inner products of secret operands and the truncations of secret values (open x + r).
+Gates whose operands do not depend on each other can share that round, so the circuit is levelled by
+multiplicative depth and every level is opened in a single broadcast.
+
+Between two rounds, the nodes that only need local computation are evaluated in one flat pass, in
+topological order, so that circuits of any depth are evaluated without recursion.
+"""
+
+from typing import Dict, List
+
+from expression import (
+    Expression,
+    DotProduct, InnerProduct, Multiplication, Scalar, Secret, Truncation,
+    postorder
+)
+
+
+def is_gate(node: Expression, public: Dict[bytes, bool]) -> bool:
+    """
+    Return whether a node takes a round, given which of its operands are public.
+    """
+    if isinstance(node, (Multiplication, DotProduct)):
+        return not public[node.a.id] and not public[node.b.id]
+    if isinstance(node, InnerProduct):
+        return any(not public[x.id] and not public[y.id] for x, y in node.pairs())
+    return isinstance(node, Truncation) and not public[node.a.id]
+
+
+class Schedule:
+    """
+    Evaluation plan of an expression, computed in a single pass over its nodes.
+
+    Attributes:
+        levels: gates (see `is_gate`) grouped by multiplicative depth. The gates of level i only
+            depend on gates of the levels before it, so each level can be evaluated in one
+            communication round. Gates are listed in a deterministic (left to right) order such that
+            all parties agree on the schedule.
+        stages: the other nodes, in topological order, grouped by the number of rounds they depend on:
+            stage i can be evaluated locally right after level i - 1 (stage 0 before any round).
+        consumers: for every node, the number of operand slots it fills. Once that many nodes are
+            evaluated, the value of the node is no longer needed.
+        numbers: for every node, its position in the topological order (0 for the first operand, the
+            number of nodes minus one for the root).
+    """
+
+    def __init__(self, expr: Expression):
+        self.levels: List[List[Expression]] = []
+        self.stages: List[List[Expression]] = [[]]
+        self.consumers: Dict[bytes, int] = dict()
+        self.numbers: Dict[bytes, int] = dict()
+
+        depths: Dict[bytes, int] = dict()
+        public: Dict[bytes, bool] = dict()
+        for number, node in enumerate(postorder(expr)):
+            self.numbers[node.id] = number
+            children = node.children()
+            depth = 0
+            for child in children:
+                self.consumers[child.id] = self.consumers.get(child.id, 0) + 1
+                depth = max(depth, depths[child.id])
+            public[node.id] = isinstance(node, Scalar) or (
+                bool(children) and all(public[child.id] for child in children)
+            )
+            depths[node.id] = depth
+            if is_gate(node, public):
+                depths[node.id] = depth + 1
+                if len(self.levels) <= depth:
+                    self.levels.append([])
+                    self.stages.append([])
+                self.levels[depth].append(node)
+            else:
+                self.stages[depth].append(node)
+
+
+def multiplication_levels(expr: Expression) -> List[List[Expression]]:
+    """
+    Group the gates (e.g. secret multiplications) of an expression by multiplicative depth, see `Schedule`.
+    """
+    return Schedule(expr).levels
+
+
+def multiplicative_depth(expr: Expression) -> int:
+    """
+    Number of communication rounds needed to evaluate an expression.
+    """
+    return len(multiplication_levels(expr))
+
+
+def secret_inputs(expr: Expression) -> List[Secret]:
+    """
+    List the distinct secrets an expression depends on, in a deterministic (left to right) order.
+    """
+    return [node for node in postorder(expr) if isinstance(node, Secret)]
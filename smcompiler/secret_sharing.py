@@ -5,10 +5,12 @@ Secret sharing scheme.
 from __future__ import annotations
 
 import json
-import random
-from typing import List
+from typing import Dict, FrozenSet, List, Optional, Sequence, Union
 
-from finite_field import FF
+import numpy as np
+
+import wire
+from finite_field import FF, FiniteField
 
 class Share:
     """
@@ -31,20 +33,209 @@ class Share:
     def __mul__(self, other):
         return Share(self.value * other.value)
 
-    def serialize(self):
-        """Generate a representation suitable for passing in a message."""
+    def serialize(self, binary: bool = False):
+        """
+        Generate a representation suitable for passing in a message: JSON, or the compact fixed-width
+        encoding of `wire` if `binary` is set.
+        """
+        if binary:
+            return wire.encode_element(self.value)
         return json.dumps({"value": self.value})
 
     @staticmethod
-    def deserialize(serialized) -> Share:
-        """Restore object from its serialized representation."""
+    def deserialize(serialized, field: FiniteField = FF) -> Share:
+        """Restore object from its serialized representation (either encoding)."""
+        if wire.is_binary(serialized):
+            value, _ = wire.decode(serialized)
+            return as_share(value, field)
         data = json.loads(serialized)
+        if isinstance(data["value"], list):
+            return VectorShare(data["value"], field)
         return Share(data["value"])
 
-def share_secret(secret: int, num_shares: int) -> List[Share]:
-    shares = [Share(random.randint(0, FF.order)) for _ in range(num_shares - 1)]
-    shares.append(Share(FF.sub(secret, FF.sum(shares))))
+class VectorShare(Share):
+    """
+    A secret share of a vector of finite field elements, backed by a NumPy array.
+    Operations are applied element-wise, so one share (and one message) carries many values.
+    """
+
+    def __init__(self, value, field: FiniteField = FF):
+        super().__init__(field.array(value))
+        self.field = field
+
+    def __len__(self):
+        return len(self.value)
+
+    def __add__(self, other):
+        return VectorShare(self.field.add(self, other), self.field)
+
+    def __sub__(self, other):
+        return VectorShare(self.field.sub(self, other), self.field)
+
+    def __mul__(self, other):
+        return VectorShare(self.field.mul(self, other), self.field)
+
+    def serialize(self, binary: bool = False):
+        """Generate a representation suitable for passing in a message."""
+        if binary:
+            return wire.encode_vector(self.value)
+        return json.dumps({"value": [int(v) for v in self.value]})
+
+
+def as_share(value: Union[int, np.ndarray], field: FiniteField = FF) -> Share:
+    """
+    Wrap the result of a field operation into the matching share type.
+    """
+    return VectorShare(value, field) if isinstance(value, np.ndarray) else Share(value)
+
+
+def is_vector(secret) -> bool:
+    """
+    Whether a secret value is a vector of field elements rather than a single one.
+    """
+    return isinstance(secret, (list, tuple, np.ndarray))
+
+
+def share_secret(secret: Union[int, Sequence[int]], num_shares: int, field: FiniteField = FF) -> List[Share]:
+    if is_vector(secret):
+        return share_secret_vector(secret, num_shares, field)
+
+    shares = [Share(int(value)) for value in field.random(num_shares - 1)]
+    shares.append(Share(field.sub(secret, field.sum(shares))))
+    return shares
+
+def share_secret_vector(secret: Sequence[int], num_shares: int, field: FiniteField = FF) -> List[VectorShare]:
+    """
+    Additively share every element of a vector at once.
+    """
+    secret = field.array(secret)
+    shares = [VectorShare(field.random(len(secret)), field) for _ in range(num_shares - 1)]
+    shares.append(VectorShare(field.sub(secret, field.sum(shares)), field))
     return shares
 
-def reconstruct_secret(shares: List[Share]) -> int:
-    return sum(shares)
\ No newline at end of file
+def reconstruct_secret(shares: List[Share], field: FiniteField = FF) -> Union[int, List[int]]:
+    secret = field.sum(shares)
+    if isinstance(secret, np.ndarray):
+        return [int(v) for v in secret]
+    return secret
+
+
+class AdditiveScheme:
+    """
+    n-of-n additive sharing: the shares sum to the secret, and all of them are needed to reconstruct it.
+
+    Attributes:
+        participant_ids: holders of the shares, in the order `share` returns them
+        quorum: number of shares needed to reconstruct a secret
+    """
+
+    def __init__(self, participant_ids: Sequence[str], field: FiniteField = FF):
+        self.participant_ids = list(participant_ids)
+        self.field = field
+        self.quorum = len(self.participant_ids)
+
+    def share(self, secret: Union[int, Sequence[int]]) -> List[Share]:
+        return share_secret(secret, len(self.participant_ids), self.field)
+
+    def holds_constants(self, participant_id: str) -> bool:
+        """
+        Whether a party adds the public constants to its shares: only the first one, so that they are
+        counted once in the sum.
+        """
+        return participant_id == self.participant_ids[0]
+
+    def combine(self, shares: Dict[str, Sequence[Share]]) -> List[Union[int, np.ndarray]]:
+        """
+        Reconstruct several values at once from the shares of every party (same order for all parties).
+        """
+        return [self.field.sum(values) for values in zip(*shares.values())]
+
+    def reconstruct(self, shares: Dict[str, Share]) -> Union[int, List[int]]:
+        return reconstruct_secret(list(shares.values()), self.field)
+
+
+class ShamirScheme(AdditiveScheme):
+    """
+    (t, n) Shamir sharing: the shares are points of a random polynomial of degree t whose constant term
+    is the secret, so any t + 1 shares reconstruct it and t shares reveal nothing.
+
+    The share of a participant is the polynomial evaluated at 1 + its rank among the sorted participant
+    ids, so that every party (and the trusted third party) agrees on the points without coordination.
+    """
+
+    def __init__(self, participant_ids: Sequence[str], threshold: int, field: FiniteField = FF):
+        super().__init__(participant_ids, field)
+        if not 0 <= threshold < len(self.participant_ids):
+            raise ValueError(f"Threshold {threshold} out of range for {len(self.participant_ids)} participants")
+        self.threshold = threshold
+        self.quorum = threshold + 1
+        self.points = {pid: i + 1 for i, pid in enumerate(sorted(self.participant_ids))}
+        # Lagrange coefficients, computed once per subset of participants.
+        self._coefficients: Dict[FrozenSet[str], Dict[str, int]] = dict()
+
+    def share(self, secret: Union[int, Sequence[int]]) -> List[Share]:
+        field = self.field
+        if is_vector(secret):
+            secret = field.array(secret)
+            size: Optional[int] = len(secret)
+        else:
+            size = None
+        coefficients = [secret] + [field.random(size) for _ in range(self.threshold)]
+
+        shares = []
+        for pid in self.participant_ids:
+            # Horner evaluation of the polynomial at the point of the participant.
+            value = coefficients[-1]
+            for coefficient in reversed(coefficients[:-1]):
+                value = field.add(field.mul(value, self.points[pid]), coefficient)
+            shares.append(as_share(value, field))
+        return shares
+
+    def holds_constants(self, participant_id: str) -> bool:
+        """
+        Adding a constant to every share adds it to the secret: all parties add the public constants.
+        """
+        return True
+
+    def coefficients(self, participant_ids: FrozenSet[str]) -> Dict[str, int]:
+        """
+        Lagrange coefficients interpolating the secret (the value at 0) from the shares of a subset.
+        """
+        if participant_ids not in self._coefficients:
+            field = self.field
+            coefficients = dict()
+            for i in participant_ids:
+                numerator, denominator = 1, 1
+                for j in participant_ids:
+                    if j != i:
+                        numerator = field.mul(numerator, self.points[j])
+                        denominator = field.mul(denominator, field.sub(self.points[j], self.points[i]))
+                coefficients[i] = field.mul(numerator, field.inv(denominator))
+            self._coefficients[participant_ids] = coefficients
+        return self._coefficients[participant_ids]
+
+    def combine(self, shares: Dict[str, Sequence[Share]]) -> List[Union[int, np.ndarray]]:
+        """
+        Reconstruct several values at once from the shares of any `quorum` parties (extra shares are
+        ignored). Single elements are stacked into one vector, to be interpolated in a single batch.
+        """
+        if len(shares) < self.quorum:
+            raise ValueError(f"{self.quorum} shares are needed, got {len(shares)}")
+        subset = sorted(shares)[:self.quorum]
+        coefficients = self.coefficients(frozenset(subset))
+        field = self.field
+
+        values = {pid: [field._get_value(share) for share in shares[pid]] for pid in subset}
+        if all(type(v) is int for pid in subset for v in values[pid]):
+            batch = field.sum(field.mul(field.array(values[pid]), coefficients[pid]) for pid in subset)
+            return [int(v) for v in batch]
+        return [
+            field.sum(field.mul(column[k], coefficients[pid]) for k, pid in enumerate(subset))
+            for column in zip(*(values[pid] for pid in subset))
+        ]
+
+    def reconstruct(self, shares: Dict[str, Share]) -> Union[int, List[int]]:
+        (secret,) = self.combine({pid: [share] for pid, share in shares.items()})
+        if isinstance(secret, np.ndarray):
+            return [int(v) for v in secret]
+        return secret
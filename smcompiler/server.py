@@ -3,108 +3,481 @@ Trusted server that should help SMC client to communicate.
 You should not need to change this file.
 """
 
+import argparse
 import collections
+import json
+import logging
+import multiprocessing
+import os
 import sys
+import time
+import urllib.error
+import urllib.request
 from typing import Dict, List, Optional, Tuple
 
-from flask import Flask, request, Response, jsonify
+from flask import Flask, abort, request, Response, jsonify
 
+import wire
+from protocol import ProtocolSpec
+from transport import MessageStore
 from ttp import TrustedParamGenerator
 
 
 app: Flask = Flask("Trusted Third Party Server")
-store: Dict[str, Dict[Tuple[str, str], bytes]] = collections.defaultdict(dict)
+logger = logging.getLogger("smc.server")
+store = MessageStore()
+# TTP of the default session, i.e. of the routes without a session prefix.
 ttp: TrustedParamGenerator = TrustedParamGenerator()
+# TTP of the other sessions, which run their protocols concurrently and independently.
+sessions: Dict[str, TrustedParamGenerator] = dict()
 
+# Upper bound on the time (in seconds) a long-polling request can be held by the server.
+MAX_WAIT = 30.0
 
-@app.route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
-def send_private_message(sender_id: str, receiver_id: str, label: str):
+DEFAULT_SESSION = ""
+
+
+def session_route(rule: str, **options):
+    """
+    Register a route of a protocol both for the default session (`rule`) and within any session
+    (`/sessions/<session>` + `rule`). The view gets the session as its first argument.
+    """
+    def decorator(view):
+        app.add_url_rule(rule, view_func=view, defaults={"session": DEFAULT_SESSION}, **options)
+        app.add_url_rule(f"/sessions/<session>{rule}", view_func=view, **options)
+        return view
+    return decorator
+
+
+def session_ttp(session: str) -> TrustedParamGenerator:
+    """
+    TTP of a session. Aborts the current request (404) if the session is not open.
+    """
+    if session == DEFAULT_SESSION:
+        return ttp
+    if session not in sessions:
+        abort(404, f"Unknown session {session}")
+    return sessions[session]
+
+
+def open_session(session: str, participants: List[str], protocol_spec: Optional[ProtocolSpec] = None) -> None:
+    """
+    Open a session: register its participants, and generate the triplets of its protocol in the
+    background if it is given. Opening a session again adds participants to it.
+    """
+    if session == DEFAULT_SESSION:
+        generator = ttp
+    else:
+        generator = sessions.setdefault(session, TrustedParamGenerator())
+    for participant in participants:
+        generator.add_participant(participant)
+        store.add_participant(participant, session)
+    if protocol_spec is not None:
+        generator.preprocess(protocol_spec)
+
+
+def close_session(session: str) -> None:
+    """
+    Forget the messages, participants and triplets of a session.
+    """
+    store.end_session(session)
+    if session == DEFAULT_SESSION:
+        ttp.end_session()
+    sessions.pop(session, None)
+
+
+@app.route("/sessions/<session>", methods=["POST"])
+def create_session(session: str):
+    """
+    Open a session. The body is a JSON object {"participants": [...]}. The triplets of the session are
+    generated on demand, in the field and with the threshold the parties ask for.
+    """
+    open_session(session, request.get_json(force=True)["participants"])
+    logger.info(f"[ SESSION  ] OPEN {session}")
+    return Response(status=200)
+
+
+@app.route("/sessions/<session>", methods=["DELETE"])
+def delete_session(session: str):
+    """
+    Close a session, once its protocol is over.
+    """
+    close_session(session)
+    logger.info(f"[ SESSION  ] CLOSE {session}")
+    return Response(status=200)
+
+
+@session_route("/private/<sender_id>/<receiver_id>/<label>", methods=["POST"])
+def send_private_message(session: str, sender_id: str, receiver_id: str, label: str):
     """
     The client send a private message to the server.
     """
-    print(
+    logger.info(
         f"[ SEND     ] SENDER {sender_id} / LABEL {label} / RECEIVER {receiver_id}"
     )
-    _set_value("private", (receiver_id, label), request.get_data())
+    store.put("private", (receiver_id, label), request.get_data(), session)
     return Response(status=200)
 
 
-@app.route("/private/<receiver_id>/<label>", methods=["GET"])
-def retrieve_private_message(receiver_id: str, label: str):
+@session_route("/private/<receiver_id>/<label>", methods=["GET"])
+def retrieve_private_message(session: str, receiver_id: str, label: str):
     """
     The client retrieve a private message from the server.
+    If the query parameter `wait` is given, the request is held until the message is available or
+    `wait` seconds have elapsed (long polling).
     """
-    res = _get_value("private", (receiver_id, label))
+    res = store.get("private", (receiver_id, label), _wait_time(), receiver_id, session)
     if res is not None:
-        print(f"[ RETRIEVE ] RECEIVER {receiver_id} / LABEL {label}")
+        logger.info(f"[ RETRIEVE ] RECEIVER {receiver_id} / LABEL {label}")
         return res, 200
 
     return Response(status=404)
 
 
-@app.route("/public/<sender_id>/<label>", methods=["POST"])
-def publish_message(sender_id: str, label: str):
+@session_route("/public/<sender_id>/<label>", methods=["POST"])
+def publish_message(session: str, sender_id: str, label: str):
     """
     The client publish a public message on the server.
     """
-    print(f"[ PUBLISH  ] SENDER {sender_id} / LABEL {label}")
-    _set_value("public", (sender_id, label), request.get_data())
+    logger.info(f"[ PUBLISH  ] SENDER {sender_id} / LABEL {label}")
+    store.put("public", (sender_id, label), request.get_data(), session)
     return Response(status=200)
 
 
-@app.route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
-def retrieve_public_message(receiver_id: str, sender_id: str, label: str):
+@session_route("/public/<receiver_id>/<sender_id>/<label>", methods=["GET"])
+def retrieve_public_message(session: str, receiver_id: str, sender_id: str, label: str):
     """
     The client retrieve a public message from the server.
+    Supports long polling with the query parameter `wait`, see `retrieve_private_message`.
     """
-    res = _get_value("public", (sender_id, label))
+    res = store.get("public", (sender_id, label), _wait_time(), receiver_id, session)
     if res is not None:
-        print(
+        logger.info(
             f"[ RETRIEVE ] RECEIVER {receiver_id}. LABEL {label} / SENDER {sender_id}"
         )
         return res, 200
     return Response(status=404)
 
 
-@app.route("/shares/<client_id>/<op_id>", methods=["GET"])
-def retrieve_share(client_id: str, op_id: str):
+@session_route("/bulk/private/<sender_id>", methods=["POST"])
+def send_private_messages(session: str, sender_id: str):
+    """
+    The client send several private messages at once.
+    The body is a JSON list of [receiver_id, label, message] entries, or binary records
+    (receiver_id, label, message) framed as in `wire.pack_records`.
+    """
+    if _binary_body():
+        messages = {keys: message for keys, message in wire.unpack_records(request.get_data(), 2)}
+    else:
+        messages = {
+            (receiver_id, label): message.encode() for receiver_id, label, message in request.get_json(force=True)
+        }
+    logger.info(f"[ SEND     ] SENDER {sender_id} / {len(messages)} MESSAGES")
+    store.put_many("private", messages, session)
+    return Response(status=200)
+
+
+@session_route("/bulk/private/<receiver_id>/retrieve", methods=["POST"])
+def retrieve_private_messages(session: str, receiver_id: str):
+    """
+    The client retrieve several private messages at once.
+    The body is a JSON object {"labels": [...]}; the response maps every label to its message (as JSON,
+    or as binary records if the client accepts them), and is only sent once all of them are available.
+    Supports long polling with the query parameter `wait`.
+    """
+    labels = request.get_json(force=True)["labels"]
+    res = store.get_many(
+        "private", [(receiver_id, label) for label in labels], _wait_time(), receiver_id, session
+    )
+    if res is None:
+        return Response(status=404)
+
+    logger.info(f"[ RETRIEVE ] RECEIVER {receiver_id} / {len(labels)} LABELS")
+    if _accepts_binary():
+        return _binary_response([(label,) for _, label in res], list(res.values()))
+    return jsonify({label: message.decode() for (_, label), message in res.items()}), 200
+
+
+@session_route("/bulk/public/<sender_id>", methods=["POST"])
+def publish_messages(session: str, sender_id: str):
+    """
+    The client publish several public messages at once.
+    The body is a JSON object mapping labels to messages, or binary records (label, message).
+    """
+    if _binary_body():
+        messages = {(sender_id, label): message for (label,), message in wire.unpack_records(request.get_data(), 1)}
+    else:
+        messages = {
+            (sender_id, label): message.encode() for label, message in request.get_json(force=True).items()
+        }
+    logger.info(f"[ PUBLISH  ] SENDER {sender_id} / {len(messages)} LABELS")
+    store.put_many("public", messages, session)
+    return Response(status=200)
+
+
+@session_route("/bulk/public/<receiver_id>/retrieve", methods=["POST"])
+def retrieve_public_messages(session: str, receiver_id: str):
+    """
+    The client retrieve the messages published by several senders under several labels at once.
+    The body is a JSON object {"senders": [...], "labels": [...], "min_senders": k}; the response maps
+    every sender to its {label: message} pairs (or binary records (sender_id, label, message) if the
+    client accepts them). It is only sent once all the messages are available or, if `min_senders` is
+    given, once at least k senders published all their messages (and then only contains theirs).
+    Supports long polling with the query parameter `wait`.
+    """
+    query = request.get_json(force=True)
+    if query.get("min_senders") is not None:
+        res = store.get_quorum(
+            "public", query["senders"], query["labels"], query["min_senders"], _wait_time(), receiver_id, session
+        )
+    else:
+        channels = [(sender_id, label) for sender_id in query["senders"] for label in query["labels"]]
+        res = store.get_many("public", channels, _wait_time(), receiver_id, session)
+    if res is None:
+        return Response(status=404)
+
+    logger.info(f"[ RETRIEVE ] RECEIVER {receiver_id}. {len(query['labels'])} LABELS / {len(query['senders'])} SENDERS")
+    if _accepts_binary():
+        return _binary_response(list(res.keys()), list(res.values()))
+    messages: Dict[str, Dict[str, str]] = collections.defaultdict(dict)
+    for (sender_id, label), message in res.items():
+        messages[sender_id][label] = message.decode()
+    return jsonify(messages), 200
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """
+    Readiness probe: answers as soon as the server accepts requests, with the id of its process, the
+    number of registered participants and whether the offline phase is over.
+    """
+    return jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "participants": len(ttp.participant_ids),
+        "preprocessed": ttp.wait_preprocessing(0),
+    }), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Memory usage of the server: messages held in the store, triplets held by the TTPs (of all the
+    sessions), number of open sessions, and resident memory of the process (in bytes, None where
+    unavailable).
+    """
+    ttp_stats = ttp.stats()
+    for generator in list(sessions.values()):
+        for key, value in generator.stats().items():
+            ttp_stats[key] += value
+    return jsonify({
+        "store": store.stats(),
+        "ttp": ttp_stats,
+        "sessions": len(sessions),
+        "rss_bytes": _resident_memory(),
+    }), 200
+
+
+@session_route("/shares/<client_id>/<op_id>", methods=["GET"])
+def retrieve_share(session: str, client_id: str, op_id: str):
     """
     The client retrieve Beaver triplets generated by the server.
+    The optional query parameter `size` asks for a triplet of vectors, `order` for a triplet in
+    another field than the one of the protocol, and `threshold` for a Shamir-shared triplet.
     """
-    shares = ttp.retrieve_share(client_id, op_id)
+    shares = session_ttp(session).retrieve_share(
+        client_id,
+        op_id,
+        request.args.get("size", type=int),
+        request.args.get("order", type=int),
+        request.args.get("threshold", type=int),
+    )
+    if _accepts_binary():
+        return Response(b"".join(share.serialize(binary=True) for share in shares), 200, mimetype=wire.CONTENT_TYPE)
     return jsonify([share.serialize() for share in shares]), 200
 
 
-def _set_value(pool: str, channel: Tuple[str, str], data: bytes) -> None:
+@session_route("/bulk/shares/<client_id>/retrieve", methods=["POST"])
+def retrieve_shares(session: str, client_id: str):
     """
-    Push data to a channel in a given pool and send an event.
+    The client retrieve the Beaver triplets of several operations at once.
+    The body is a JSON object {"op_ids": [...], "sizes": {op_id: size}, "order": order, "threshold": t},
+    where all but the operation ids are optional. The response maps every operation id to its triplet
+    (or is made of binary records (op_id, triplet) if the client accepts them).
     """
-    store[pool][channel] = data
+    query = request.get_json(force=True)
+    shares = session_ttp(session).retrieve_shares(
+        client_id, query["op_ids"], query.get("sizes"), query.get("order"), query.get("threshold")
+    )
+    logger.info(f"[ SHARES   ] CLIENT {client_id} / {len(query['op_ids'])} TRIPLETS")
+    if _accepts_binary():
+        return _binary_response(
+            [(op_id,) for op_id in query["op_ids"]],
+            [b"".join(share.serialize(binary=True) for share in triplet) for triplet in shares]
+        )
+    return jsonify({
+        op_id: [share.serialize() for share in triplet]
+        for op_id, triplet in zip(query["op_ids"], shares)
+    }), 200
 
 
-def _get_value(pool: str, channel: Tuple[str, str]) -> Optional[bytes]:
+def _binary_body() -> bool:
     """
-    Subscribe to a channel in a given pool and get it once ready.
+    Whether the body of the current request is in the binary format.
     """
-    if channel not in store[pool]:
+    return request.mimetype == wire.CONTENT_TYPE
+
+
+def _accepts_binary() -> bool:
+    """
+    Whether the client of the current request prefers binary responses (content negotiation).
+    """
+    return request.accept_mimetypes.best_match(["application/json", wire.CONTENT_TYPE]) == wire.CONTENT_TYPE
+
+
+def _binary_response(records: List[Tuple[str, ...]], payloads: List[bytes]) -> Response:
+    return Response(wire.pack_records(records, payloads), 200, mimetype=wire.CONTENT_TYPE)
+
+
+def _resident_memory() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
         return None
-    return store[pool][channel]
 
 
-def run(host: str, port: int, participants: List[str]) -> None:
+def _wait_time() -> float:
+    """
+    Time the current request may be held waiting for a message.
+    """
+    return min(max(request.args.get("wait", default=0.0, type=float), 0.0), MAX_WAIT)
+
+
+def reset() -> None:
+    """
+    Forget every message, participant and triplet, e.g. between two protocols run in the same process.
+    """
+    global ttp
+    store.clear()
+    ttp = TrustedParamGenerator()
+    sessions.clear()
+
+
+def configure_logging(verbose: bool) -> None:
+    """
+    Switch the logging of every request on (development) or off (production).
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO if verbose else logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.INFO if verbose else logging.ERROR)
+
+
+def run(
+        host: str,
+        port: int,
+        participants: List[str],
+        protocol_spec: Optional[ProtocolSpec] = None,
+        production: bool = False,
+        verbose: Optional[bool] = None,
+        threads: int = 64
+    ) -> None:
     """
     Register the participants, then run the server.
+    If the protocol is known in advance, the Beaver triplets are generated in the background (offline
+    phase) while the parties start up.
+
+    The default development mode runs the Flask debug server and logs every request. The production
+    mode does not log requests (unless `verbose` is set) and serves them with a pool of `threads`
+    worker threads, with waitress if it is installed, or the multi-threaded Werkzeug server otherwise.
     """
-    for participant in participants:
-        ttp.add_participant(participant)
-    app.run(host, port, debug=True, threaded=False, processes=1, use_reloader=False)
+    configure_logging(not production if verbose is None else verbose)
+
+    open_session(DEFAULT_SESSION, participants, protocol_spec)
+
+    if not production:
+        # Long-polling requests block a worker thread, so requests are served concurrently.
+        app.run(host, port, debug=True, threaded=True, processes=1, use_reloader=False)
+        return
+
+    try:
+        from waitress import serve
+    except ImportError:
+        from werkzeug.serving import run_simple
+        run_simple(host, port, app, threaded=True)
+    else:
+        serve(app, host=host, port=port, threads=threads, connection_limit=max(100, 4 * threads))
+
+
+def wait_ready(host: str, port: int, timeout: float = 10.0, pid: Optional[int] = None) -> dict:
+    """
+    Block until the server answers on its health endpoint, and return its health report.
+    If `pid` is given, only the server running in that process counts (not one still shutting down).
+    Raises `TimeoutError` if it is not ready within `timeout` seconds.
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://{host}:{port}/health", timeout=1) as res:
+                report = json.loads(res.read())
+            if pid is None or report["pid"] == pid:
+                return report
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        if time.time() > deadline:
+            raise TimeoutError(f"The server on {host}:{port} is not ready after {timeout} seconds")
+        time.sleep(0.01)
+
+
+def start(
+        host: str,
+        port: int,
+        participants: List[str],
+        protocol_spec: Optional[ProtocolSpec] = None,
+        timeout: float = 10.0,
+        **options
+    ) -> multiprocessing.Process:
+    """
+    Run the server (see `run`, which takes the same `options`) in a new process, and block until it is
+    ready to serve requests. The process is stopped with `stop`.
+    """
+    process = multiprocessing.Process(target=run, args=(host, port, participants, protocol_spec), kwargs=options)
+    process.start()
+    try:
+        wait_ready(host, port, timeout, pid=process.pid)
+    except TimeoutError:
+        stop(process)
+        raise
+    return process
+
+
+def stop(process: multiprocessing.Process) -> None:
+    """
+    Stop a server started with `start`. Once this returns, its port is free again.
+    """
+    process.terminate()
+    process.join()
 
 
 def main(args: List[str]) -> None:
     """
     Entrypoint of the program.
     """
-    run("localhost", 5000, args)
+    parser = argparse.ArgumentParser(description="Trusted server of the SMC parties.")
+    parser.add_argument("participants", nargs="*", help="identifiers of the participating clients")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--production", action="store_true", help="concurrent server without request logging")
+    parser.add_argument("--verbose", action="store_true", default=None, help="log every request")
+    parser.add_argument("--threads", type=int, default=64, help="worker threads in production mode")
+    options = parser.parse_args(args)
+    run(
+        options.host, options.port, options.participants,
+        production=options.production, verbose=options.verbose, threads=options.threads
+    )
 
 
 if __name__ == "__main__":
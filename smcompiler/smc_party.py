@@ -5,29 +5,42 @@ MODIFY THIS FILE.
 """
 # You might want to import more classes if needed.
 
+import asyncio
 import collections
+import contextlib
 import json
 from typing import (
     Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
     Set,
     Tuple,
     Union
 )
 
-from communication import Communication
+import numpy as np
+
+import tracing
+from communication import AsyncCommunication, Communication
+from compiler import Circuit, compile_expression
 from expression import (
     Expression,
-    Secret, Scalar, Addition, Multiplication, Subtraction
+    Secret, Scalar, Addition, Multiplication, Subtraction, DotProduct, InnerProduct, SumReduce, Truncation,
+    postorder
 )
+from fixed_point import decode, encode, value_bits
+from preprocessing import PaillierTripletGenerator
 from protocol import ProtocolSpec
+from scheduler import secret_inputs
 from secret_sharing import(
-    reconstruct_secret,
-    share_secret,
+    as_share,
     Share,
+    VectorShare,
 )
 
-from finite_field import FF
-import random
 
 # Feel free to add as many imports as you want.
 
@@ -41,9 +54,16 @@ class SMCParty:
         server_host: hostname of the server
         server_port: port of the server
         protocol_spec (ProtocolSpec): Protocol specification
-        value_dict (dict): Dictionary assigning values to secrets belonging to this client.
+        value_dict (dict): Dictionary assigning values to secrets belonging to this client. A value is
+            either a field element or a vector (list) of field elements, in which case the protocol is
+            evaluated element-wise on the whole vector (but for dot products and sums). Secrets with a
+            precision take reals (or vectors of reals), and fixed-point results are returned as floats.
+        comm_options: Extra options of the communication layer (e.g. `long_poll=True`), see `Communication`.
+            With `tracer=tracing.Tracer(...)`, the phases, rounds and nodes of the run are traced too.
     """
 
+    communication_class = Communication
+
     def __init__(
             self,
             client_id: str,
@@ -51,37 +71,138 @@ class SMCParty:
             server_port: int,
             protocol_spec: ProtocolSpec,
             value_dict: Dict[Secret, int],
+            **comm_options,
         ):
-        self.comm = Communication(server_host, server_port, client_id)
+        self.comm = self.communication_class(server_host, server_port, client_id, **comm_options)
+        self.tracer = self.comm.tracer
 
         self.client_id = client_id
         self.protocol_spec = protocol_spec
         self.value_dict = value_dict
-        self.lead = client_id == protocol_spec.participant_ids[0]
+        self.field = protocol_spec.field
+        self.scheme = protocol_spec.sharing_scheme()
+        # Whether this party adds the public constants to its shares.
+        self.lead = self.scheme.holds_constants(client_id)
+        self.peers = [p for p in protocol_spec.participant_ids if p != client_id]
+        # Number of peers whose messages are needed to open a value: all of them with additive sharing,
+        # only `threshold` of them with Shamir sharing (None means all).
+        self.min_peers = self.scheme.quorum - 1 if self.scheme.quorum <= len(self.peers) else None
+        # Values of the nodes evaluated so far, indexed by expression id.
+        self.results: Dict[bytes, Union[Share, Scalar]] = dict()
+        # Beaver triplets (and truncation pairs) downloaded ahead of the online phase, indexed by
+        # operation id (see `op_id`).
+        self.triplets: Dict[str, Tuple[Share, Share, Share]] = dict()
+        # Number of nodes still to evaluate that use each value of `results`, see `store`.
+        self.consumers: Dict[bytes, int] = dict()
+        # Compiled protocol, which numbers the nodes exchanged, see `label`.
+        self.circuit: Optional[Circuit] = None
+        # Vector size of the operands of the inner products being opened (None for single values).
+        self.packed_sizes: Dict[bytes, Optional[int]] = dict()
+        # Generator of the triplets with the peers, with "paillier" preprocessing.
+        self.triplet_generator: Optional[PaillierTripletGenerator] = None
+        if protocol_spec.preprocessing == "paillier":
+            self.triplet_generator = PaillierTripletGenerator(
+                self.comm, protocol_spec.participant_ids, self.field, protocol_spec.key_bits
+            )
 
 
-    def run(self) -> int:
+    def run(self) -> Union[int, List[int]]:
         """
         The method the client use to do the SMC.
         """
 
+        tracer = self.tracer
+        with tracer.span("compile"):
+            circuit = self.compile()
+
+        # Input round: the shares of all the secrets of this client are sent in one request.
+        with tracer.span("input"):
+            messages = self.input_messages()
+            if messages:
+                self.comm.send_private_many(messages)
+
+            secrets = secret_inputs(circuit.expr)
+            buf = self.comm.retrieve_private_many(self.label(secret) for secret in secrets)
+            self.store_inputs(secrets, buf)
+
+        with tracer.span("triplets"):
+            self.retrieve_triplets([gate for level in circuit.levels for gate in level])
+        schedule = circuit.schedule
+
+        #process main: the local part of the circuit in topological order, with one batched Beaver round
+        # per level of multiplicative depth in between
+        for i, stage in enumerate(schedule.stages):
+            if i > 0:
+                with tracer.span(f"round {i}", gates=len(schedule.levels[i - 1])):
+                    self.multiply(schedule.levels[i - 1])
+            with tracer.span(f"stage {i}", nodes=len(stage)):
+                self.evaluate(stage)
+
+        with tracer.span("output"):
+            res = self.result_share(circuit)
+            self.comm.publish_message("result", res.serialize(self.comm.binary))
+            buf = self.comm.retrieve_many(self.peers, ["result"], self.min_peers)
+            return self.reconstruct(res, buf)
+
+    def input_messages(self) -> Dict[Tuple[str, str], bytes]:
+        """
+        Shares of the secrets of this client, indexed by (receiver_id, label). The protocol must be
+        compiled: secrets that the compiled circuit does not use are not sent.
+        """
+        messages = dict()
         for k in self.value_dict.keys():
-            l = share_secret(self.value_dict.get(k), len(self.protocol_spec.participant_ids))
-            # print(f"[ SHARES ] {self.client_id}'s secrets: {l}")
+            if k.id not in self.circuit.schedule.numbers:
+                continue
+            value = self.value_dict.get(k)
+            if k.precision is not None:
+                value = encode(value, k.precision)
+            l = self.scheme.share(value)
+            for client, share in zip(self.protocol_spec.participant_ids, l):
+                messages[(client, self.label(k))] = share.serialize(self.comm.binary)
+        return messages
+
+    def compile(self) -> Circuit:
+        """
+        Compile the expression of the protocol: all parties get the same optimized circuit.
+        """
+        circuit = compile_expression(self.protocol_spec.expr, field=self.field)
+        self.consumers = dict(circuit.schedule.consumers)
+        self.circuit = circuit
+        return circuit
 
-            i = 0
-            for client in self.protocol_spec.participant_ids:
-                self.comm.send_private_message(client, str(k.id.__hash__()), l[i].serialize())
-                i = i + 1
+    def label(self, node: Expression) -> str:
+        """
+        Label under which the messages and the triplet of a node of the compiled protocol are exchanged.
+        """
+        return self.circuit.label(node)
 
-        #process main
-        res = self.process_expression(self.protocol_spec.expr)
-        self.comm.publish_message("result", res.serialize())
-        final_shares = []
-        for client in self.protocol_spec.participant_ids:
-            final_shares.append(Share.deserialize(self.comm.retrieve_public_message(client, "result")))
+    def op_id(self, gate: Expression) -> str:
+        """
+        Operation id of the triplet (or truncation pair) of a gate of the compiled protocol.
+        """
+        return self.circuit.op_id(gate)
 
-        return FF.sum(final_shares)
+    def store_inputs(self, secrets: List[Secret], buf: Dict[str, bytes]) -> None:
+        for secret in secrets:
+            self.results[secret.id] = Share.deserialize(buf[self.label(secret)], self.field)
+
+    def result_share(self, circuit: Circuit) -> Share:
+        res = self.results[circuit.expr.id]
+        if isinstance(res, Scalar):
+            # A public result is a constant: only added by the parties holding the constants (see `lead`).
+            res = as_share(res.value if self.lead else 0, self.field)
+        return res
+
+    def reconstruct(self, res: Share, buf: Dict[Tuple[str, str], bytes]) -> Union[int, List[int]]:
+        """
+        Reconstruct the result from the share of this client and those received from its peers.
+        """
+        final_shares = {self.client_id: res}
+        for (participant_id, _), share in buf.items():
+            final_shares[participant_id] = Share.deserialize(share, self.field)
+        result = self.scheme.reconstruct(final_shares)
+        precision = self.protocol_spec.expr.precision
+        return result if precision is None else decode(result, precision, self.field)
 
 
     # Suggestion: To process expressions, make use of the *visitor pattern* like so:
@@ -89,74 +210,446 @@ class SMCParty:
             self,
             expr: Expression
         ):
-        identifier = random.randint(10**10, 10**11 - 1)
-        # print(f"[ DEBUG {self.client_id[0]} ] {identifier} PROCESSING EXPRESSION OF TYPE {type(expr)}: {expr}")
-        # if isinstance(expr, Addition) or isinstance(expr, Multiplication) or isinstance(expr, Subtraction):
-            # print(f"[ DEBUG {self.client_id[0]} ] Left branch expr.a: {expr.a}")
-            # print(f"[ DEBUG {self.client_id[0]} ] Left branch expr.b: {expr.b}")
-        # else:
-            # print(f"[ DEBUG {self.client_id[0]} ] Leaf node reached on: {expr}")
-
-        if isinstance(expr, Secret):
-            # print(f"{self.client_id} IS RETRIEVING WITH LABEL {expr.id.__hash__()}")
-            buf = self.comm.retrieve_private_message(str(expr.id.__hash__()))
-            z = Share.deserialize(buf)
-            # print(f"[ DEBUG {self.client_id[0]} ] {identifier} returning: {z}")
-            return z
-        elif isinstance(expr, (Scalar, Share)):
-            z = expr
-            # print(f"[ DEBUG {self.client_id[0]} ] {identifier} returning: {z}")
-            return z
-        elif isinstance(expr, (Addition, Subtraction)):
-            resA, resB = self.process_expression(expr.a), self.process_expression(expr.b)
-            z = self.combine(resA, Share(-resB.value) if isinstance(expr, Subtraction) else resB)
-            # print(f"[ DEBUG {self.client_id[0]} ] {identifier} returning: {z}")
-            return z
-
-        elif isinstance(expr, Multiplication):
-            resA, resB = self.process_expression(expr.a), self.process_expression(expr.b)
-            if isinstance(resA, Scalar) and isinstance(resB, Scalar):
-                z = Scalar(FF.mul(resA, resB))
-                # print(f"[ DEBUG {self.client_id[0]} ] {identifier} returning: {z}")
-                return z
-            if isinstance(resA, Scalar) or isinstance(resB, Scalar):
-                z = Share(FF.mul(resA, resB))
-                # print(f"[ DEBUG {self.client_id[0]} ] {identifier} returning: {z}")
-                return z
+        """
+        Evaluate an expression, operands first, with an explicit stack rather than recursion so that
+        circuits of any depth can be evaluated. Nodes already in `results` are not evaluated again.
+        """
+        self.evaluate(postorder(expr, skip=self.results))
+        return self.results[expr.id]
+
+    def evaluate(self, nodes: Iterable[Expression]) -> None:
+        """
+        Evaluate nodes given in topological order (operands first), skipping those already evaluated.
+        """
+        if self.tracer.enabled and self.tracer.nodes:
+            nodes = self.traced(nodes)
+        results = self.results
+        for node in nodes:
+            if node.id in results:
+                continue
+            if isinstance(node, Secret):
+                z = Share.deserialize(self.comm.retrieve_private_message(self.label(node)), self.field)
+            elif isinstance(node, Scalar):
+                z = node
+            elif isinstance(node, (Addition, Subtraction)):
+                resA, resB = results[node.a.id], results[node.b.id]
+                z = self.combine(resA, self.negate(resB) if isinstance(node, Subtraction) else resB)
+            elif isinstance(node, (Multiplication, DotProduct)):
+                resA, resB = results[node.a.id], results[node.b.id]
+                if isinstance(resA, Scalar) and isinstance(resB, Scalar):
+                    z = Scalar(self.field.mul(resA, resB))
+                elif isinstance(resA, Scalar) or isinstance(resB, Scalar):
+                    z = as_share(self.field.mul(resA, resB), self.field)
+                    if isinstance(node, DotProduct):
+                        z = as_share(self.field.total(z), self.field)
+                else:
+                    # Not scheduled ahead of time (e.g. when called outside of `run`): open it on its own.
+                    self.open_gate(node)
+                    continue
+            elif isinstance(node, InnerProduct):
+                operands = [(results[x.id], results[y.id]) for x, y in node.pairs()]
+                if any(not isinstance(x, Scalar) and not isinstance(y, Scalar) for x, y in operands):
+                    self.open_gate(node)
+                    continue
+                z = Scalar(0)
+                for resA, resB in operands:
+                    product = self.field.mul(resA, resB)
+                    z = self.combine(z, Scalar(product) if isinstance(resA, Scalar) and isinstance(resB, Scalar)
+                                     else as_share(product, self.field))
+            elif isinstance(node, SumReduce):
+                res = results[node.a.id]
+                z = res if isinstance(res, Scalar) else as_share(self.field.total(res), self.field)
+            elif isinstance(node, Truncation):
+                res = results[node.a.id]
+                if isinstance(res, Scalar):
+                    value = res.value % self.field.order
+                    signed = value - self.field.order if value > self.field.order // 2 else value
+                    z = Scalar((signed >> node.bits) % self.field.order)
+                else:
+                    self.open_gate(node)
+                    continue
             else:
-                a, b, c = self.comm.retrieve_beaver_triplet_shares(str(expr.id.__hash__()))
+                raise ValueError("Unknown expression type")
+            self.store(node, z)
+
+    def open_gate(self, gate: Expression) -> None:
+        """
+        Open a gate that was not scheduled ahead of time, in a round of its own. `evaluate` records its
+        span, as that of any other node.
+        """
+        self.multiply([gate], traced=False)
+
+    def traced(self, nodes: Iterable[Expression]) -> Iterator[Expression]:
+        """
+        Record a span per node, covering its evaluation: the time until the next node is asked for, and
+        the requests made meanwhile (e.g. for the share of a secret).
+        """
+        for node in nodes:
+            start, (network, counters) = self.tracer.now(), tracing.usage()
+            yield node
+            self.record_nodes([node], start, network, counters)
+
+    @contextlib.contextmanager
+    def traced_gates(self, gates: List[Expression]) -> Iterator[None]:
+        """
+        Record a span per gate opened by the enclosed code. The gates share the messages of their round:
+        its network wait, bytes, requests and retries are split evenly among them.
+        """
+        if not (self.tracer.enabled and self.tracer.nodes):
+            yield
+            return
+        start, (network, counters) = self.tracer.now(), tracing.usage()
+        yield
+        self.record_nodes(gates, start, network, counters)
+
+    def record_nodes(self, nodes: List[Expression], start: float, network: float, counters: Dict[str, int]) -> None:
+        """
+        Record the spans of nodes evaluated together since `start`, given the usage of the current span
+        then (see `tracing.usage`): what it waited and counted since is split evenly among the nodes.
+        """
+        tracer = self.tracer
+        end = tracer.now()
+        total_network, total_counters = tracing.usage()
+        numbers = self.circuit.schedule.numbers if self.circuit is not None else dict()
+        for i, node in enumerate(nodes):
+            shares = dict()
+            for key, value in total_counters.items():
+                quotient, remainder = divmod(value - counters[key], len(nodes))
+                shares[key] = quotient + (i < remainder)
+            tracer.record(
+                type(node).__name__, "node", start, end, (total_network - network) / len(nodes), shares,
+                node=numbers.get(node.id)
+            )
+
+    def store(self, node: Expression, value: Union[Share, Scalar]) -> None:
+        """
+        Record the value of a node, and release the values of its operands once all the nodes using
+        them are evaluated, so that only the live part of the circuit is kept in memory.
+        """
+        self.results[node.id] = value
+        consumers = self.consumers
+        for child in node.children():
+            count = consumers.get(child.id)
+            if count == 1:
+                del consumers[child.id]
+                del self.results[child.id]
+            elif count is not None:
+                consumers[child.id] = count - 1
+
+    def multiply(self, gates: List[Expression], traced: bool = True) -> None:
+        """
+        Evaluate a batch of independent gates (secret multiplications, dot and inner products, truncations)
+        in a single round, recording a span per gate unless `traced` is off (see `traced_gates`).
+
+        The masked operands (x - a, y - b) of every gate are broadcast together in one message, so the
+        number of rounds follows the multiplicative depth of the circuit rather than its number of gates.
+        """
+        with self.traced_gates(gates if traced else []):
+            operands = [tuple(self.process_expression(child) for child in gate.children()) for gate in gates]
+            triplets = [self.triplet(gate, ops) for gate, ops in zip(gates, operands)]
+            messages, openings = self.mask(gates, operands, triplets)
+            self.comm.publish_many(messages)
+            buf = self.comm.retrieve_many(self.peers, list(messages), self.min_peers)
+            self.unmask(gates, openings, triplets, buf)
+
+    def triplet(self, gate: Expression, operands: Tuple[Union[Share, Scalar], ...]) -> Tuple[Share, ...]:
+        """
+        Triplet (or truncation pair) of a gate: retrieved ahead of the online phase, or else from the
+        trusted third party. The parties that generate their triplets have them all already.
+        """
+        op_id = self.op_id(gate)
+        if op_id in self.triplets:
+            return self.triplets.pop(op_id)
+        if self.triplet_generator is not None:
+            raise ValueError(f"No {self.protocol_spec.preprocessing} triplet was generated for operation {op_id}")
+        return self.comm.retrieve_beaver_triplet_shares(
+            op_id, self.triplet_size(gate, self.vector_size(*operands)), self.field, self.protocol_spec.threshold
+        )
+
+    def vector_size(self, *operands: Union[Share, Scalar]) -> Optional[int]:
+        """
+        Size of the triplet of a product: products of vectors are element-wise, they need a triplet of
+        vectors of the same size.
+        """
+        sizes = [len(res) for res in operands if isinstance(res, VectorShare)]
+        return max(sizes) if sizes else None
 
-                x_a, y_b = Share(FF.sub(resA, a)), Share(FF.sub(resB, b))
-                # It would be more efficient to send only one message, but it's more accurate from the handout
-                # to broadcast both values separately.
+    @staticmethod
+    def triplet_size(gate: Expression, operand_size: Optional[int]) -> Optional[int]:
+        """
+        Size of the triplet of a gate whose operands have the given vector size: the products of an
+        inner product are packed in one vector triplet.
+        """
+        if isinstance(gate, InnerProduct):
+            return len(gate.xs) * (operand_size or 1)
+        return operand_size
 
-                self.comm.publish_message(f"{expr.id.__hash__()}_x-a", x_a.serialize())
-                self.comm.publish_message(f"{expr.id.__hash__()}_y-b", y_b.serialize())
+    def packed(self, operands: Sequence[Union[Share, Scalar]], size: Optional[int]) -> np.ndarray:
+        """
+        Concatenation of the values of operands, single values repeated to the vector size (if any).
+        """
+        values = []
+        for res in operands:
+            if isinstance(res, Scalar):
+                # Public constants are counted once, by the lead parties.
+                res = as_share(res.value if self.lead else 0, self.field)
+            if isinstance(res, VectorShare):
+                values.extend(res.value)
+            else:
+                values.extend([res.value] * (size or 1))
+        return self.field.array(values)
 
-                for participant_id in self.protocol_spec.participant_ids:
-                    if participant_id == self.client_id:
-                        continue
+    @staticmethod
+    def opened_names(gate: Expression) -> Tuple[str, ...]:
+        """
+        Names of the masked values opened by a gate.
+        """
+        if isinstance(gate, Truncation):
+            return ("x+r",)
+        if isinstance(gate, InnerProduct):
+            return ("x-a|y-b",)
+        return ("x-a", "y-b")
 
-                    r_x_a = Share.deserialize(self.comm.retrieve_public_message(participant_id, f"{expr.id.__hash__()}_x-a"))
-                    x_a = FF.add(x_a, r_x_a)
+    def mask(
+            self,
+            gates: List[Expression],
+            operands: List[Tuple[Share, ...]],
+            triplets: List[Tuple[Share, ...]]
+        ) -> Tuple[Dict[str, bytes], list]:
+        """
+        Mask the operands of the gates with their triplets (or truncation pairs).
+
+        Returns:
+            the messages to publish, indexed by label, and the shares of the masked operands of this
+            client (x - a and y - b of every product, x + r of every truncation, see `fixed_point`)
+        """
+        openings = []
+        for gate, ops, triplet in zip(gates, operands, triplets):
+            if isinstance(gate, InnerProduct):
+                # The masked operands of all the products, as one vector: x - a, then y - b.
+                size = self.vector_size(*ops)
+                self.packed_sizes[gate.id] = size
+                n, (a, b, _) = len(gate.xs), triplet
+                x_a = self.field.sub(self.packed(ops[:n], size), a)
+                y_b = self.field.sub(self.packed(ops[n:], size), b)
+                openings.append(np.concatenate((x_a, y_b)))
+            elif isinstance(gate, Truncation):
+                # Shifted to be positive, so that adding r does not wrap around the field.
+                offset = 1 << (value_bits(self.field) - 1) if self.lead else 0
+                openings.append(self.field.sum([ops[0], triplet[0], offset]))
+            else:
+                (resA, resB), (a, b, _) = ops, triplet
+                openings.extend((self.field.sub(resA, a), self.field.sub(resB, b)))
+        labels = [f"{self.label(gate)}_{name}" for gate in gates for name in self.opened_names(gate)]
+        messages = {
+            label: as_share(value, self.field).serialize(self.comm.binary) for label, value in zip(labels, openings)
+        }
+        return messages, openings
 
-                    r_y_b = Share.deserialize(self.comm.retrieve_public_message(participant_id, f"{expr.id.__hash__()}_y-b"))
-                    y_b = FF.add(y_b, r_y_b)
+    def unmask(
+            self,
+            gates: List[Expression],
+            openings: list,
+            triplets: List[Tuple[Share, ...]],
+            buf: Dict[Tuple[str, str], bytes]
+        ) -> None:
+        """
+        Open the masked operands from the shares received from the peers, and compute the products.
+        """
+        message_labels = [f"{self.label(gate)}_{name}" for gate in gates for name in self.opened_names(gate)]
+        shares = {self.client_id: openings}
+        for participant_id in {sender for sender, _ in buf}:
+            shares[participant_id] = [
+                Share.deserialize(buf[(participant_id, label)], self.field) for label in message_labels
+            ]
+        opened = iter(self.scheme.combine(shares))
 
-                z = FF.sum([FF.mul(x_a, b), FF.mul(y_b, a), c])
+        for gate, triplet in zip(gates, triplets):
+            if isinstance(gate, Truncation):
+                z = self.truncate(gate, next(opened), triplet)
+            elif isinstance(gate, InnerProduct):
+                z = self.inner_product(gate, next(opened), triplet)
+            else:
+                (x_a, y_b), (a, b, c) = (next(opened), next(opened)), triplet
+                z = self.field.sum([self.field.mul(x_a, b), self.field.mul(y_b, a), c])
                 if self.lead:
-                    z = FF.add(z, FF.mul(x_a, y_b))
+                    z = self.field.add(z, self.field.mul(x_a, y_b))
+                if isinstance(gate, DotProduct):
+                    # The element-wise products of a dot product only need to be summed up.
+                    z = self.field.total(z)
+            self.store(gate, as_share(z, self.field))
+
+    def inner_product(self, gate: InnerProduct, masked, triplet: Tuple[Share, Share, Share]):
+        """
+        Share of an inner product, from its opened masked operands: the Beaver products of all the
+        pairs at once, summed up.
+        """
+        (a, b, c), half = triplet, len(masked) // 2
+        x_a, y_b = masked[:half], masked[half:]
+        z = self.field.sum([self.field.mul(x_a, b), self.field.mul(y_b, a), c])
+        if self.lead:
+            z = self.field.add(z, self.field.mul(x_a, y_b))
+        size = self.packed_sizes.pop(gate.id)
+        if size is None:
+            return self.field.total(z)
+        return self.field.sum([z[i:i + size] for i in range(0, len(z), size)])
+
+    def truncate(self, gate: Truncation, masked, pair: Tuple[Share, Share]):
+        """
+        Share of a truncated value, from the opened x + 2^(k-1) + r and the shares of floor(r / 2^bits).
+        """
+        z = 0
+        if self.lead:
+            offset = 1 << (value_bits(self.field) - 1 - gate.bits)
+            if isinstance(masked, np.ndarray):
+                shifted = self.field.array(int(v) >> gate.bits for v in masked)
+            else:
+                shifted = int(masked) >> gate.bits
+            z = self.field.sub(shifted, offset)
+        return self.field.sub(z, pair[1])
+
+    def retrieve_triplets(self, gates: List[Expression]) -> None:
+        """
+        Download the Beaver triplets of the given gates in one request, ahead of the online phase, or
+        generate them with the peers with "paillier" preprocessing.
+        The shares of the inputs must be known, to find out which gates multiply vectors.
+        """
+        if not gates:
+            return
 
-                # print(f"[ DEBUG {self.client_id[0]} ] {identifier} returning: {z}")
-                return Share(z)
-            
-        else:
-            raise ValueError("Unknown expression type")
+        if self.triplet_generator is not None:
+            self.triplets = self.triplet_generator.triplets(
+                [self.op_id(gate) for gate in gates], self.triplet_sizes(gates)
+            )
+            return
+
+        self.triplets = self.comm.retrieve_beaver_triplet_shares_many(
+            [self.op_id(gate) for gate in gates],
+            self.triplet_sizes(gates),
+            self.field,
+            self.protocol_spec.threshold
+        )
+
+    def triplet_sizes(self, gates: List[Expression]) -> Dict[str, int]:
+        """
+        Vector size of the triplets of the gates on vectors, indexed by operation id.
+        """
+        # Vector size of the value of every node, None for a single value.
+        sizes: Dict[bytes, Optional[int]] = dict()
+        vector_sizes = dict()
+        for gate in gates:
+            for node in postorder(gate, skip=sizes):
+                if isinstance(node, Secret):
+                    share = self.results[node.id]
+                    sizes[node.id] = len(share) if isinstance(share, VectorShare) else None
+                elif isinstance(node, (DotProduct, SumReduce)):
+                    sizes[node.id] = None
+                else:
+                    children = [sizes[child.id] for child in node.children() if sizes[child.id] is not None]
+                    sizes[node.id] = max(children) if children else None
+            operands = [sizes[child.id] for child in gate.children() if sizes[child.id] is not None]
+            size = self.triplet_size(gate, max(operands) if operands else None)
+            if size is not None:
+                vector_sizes[self.op_id(gate)] = size
+        return vector_sizes
 
     def combine(self, resA: Expression, resB: Expression) -> Union[Share, Scalar, Expression]:
         if isinstance(resA, Scalar) and isinstance(resB, Scalar):
-            return Scalar(FF.add(resA, resB))
-        if (isinstance(resA, Scalar) or isinstance(resB, Scalar) and self.lead) \
+            return Scalar(self.field.add(resA, resB))
+        # A scalar is only added by the lead parties, so that it is counted once in the reconstruction.
+        if ((isinstance(resA, Scalar) or isinstance(resB, Scalar)) and self.lead) \
                 or (not isinstance(resA, Scalar) and not isinstance(resB, Scalar)):
-            return Share(FF.add(resA, resB))
-        return Share(resB.value) if isinstance(resA, Scalar) else resA
\ No newline at end of file
+            return as_share(self.field.add(resA, resB), self.field)
+        return resB if isinstance(resA, Scalar) else resA
+
+    def negate(self, res: Union[Share, Scalar]) -> Union[Share, Scalar]:
+        if isinstance(res, Scalar):
+            return Scalar(self.field.sub(0, res))
+        return as_share(self.field.sub(0, res), self.field)
+
+
+class AsyncSMCParty(SMCParty):
+    """
+    An SMC client whose `run` is a coroutine, so that many parties can run in one event loop (e.g. for
+    local benchmarks, rather than one process per party).
+
+    The messages of a round are published while the messages of the peers are awaited, so a round
+    takes a single round trip to the server. Independent subexpressions are evaluated together: the
+    gates of a level of multiplicative depth share one round (see `scheduler.Schedule`).
+
+    Same arguments as `SMCParty`. Its communication layer is an `AsyncCommunication`. Only the
+    triplets of the trusted third party are supported ("ttp" preprocessing).
+    """
+
+    communication_class = AsyncCommunication
+
+    async def run(self) -> Union[int, List[int]]:
+        try:
+            return await self._run()
+        finally:
+            await self.comm.close()
+
+    async def _run(self) -> Union[int, List[int]]:
+        if self.triplet_generator is not None:
+            raise ValueError(f"{self.protocol_spec.preprocessing} preprocessing is not supported by AsyncSMCParty")
+        tracer = self.tracer
+        with tracer.span("compile"):
+            circuit = self.compile()
+
+        with tracer.span("input"):
+            messages = self.input_messages()
+            secrets = secret_inputs(circuit.expr)
+            retrieval = self.comm.retrieve_private_many(self.label(secret) for secret in secrets)
+            if messages:
+                _, buf = await asyncio.gather(self.comm.send_private_many(messages), retrieval)
+            else:
+                buf = await retrieval
+            self.store_inputs(secrets, buf)
+
+        gates = [gate for level in circuit.levels for gate in level]
+        if gates:
+            with tracer.span("triplets"):
+                self.triplets = await self.comm.retrieve_beaver_triplet_shares_many(
+                    [self.op_id(gate) for gate in gates],
+                    self.triplet_sizes(gates),
+                    self.field,
+                    self.protocol_spec.threshold
+                )
+
+        schedule = circuit.schedule
+        for i, stage in enumerate(schedule.stages):
+            if i > 0:
+                with tracer.span(f"round {i}", gates=len(schedule.levels[i - 1])):
+                    await self.multiply(schedule.levels[i - 1])
+            with tracer.span(f"stage {i}", nodes=len(stage)):
+                self.evaluate(stage)
+
+        with tracer.span("output"):
+            res = self.result_share(circuit)
+            _, buf = await asyncio.gather(
+                self.comm.publish_message("result", res.serialize(self.comm.binary)),
+                self.comm.retrieve_many(self.peers, ["result"], self.min_peers),
+            )
+            return self.reconstruct(res, buf)
+
+    def open_gate(self, gate: Expression) -> None:
+        """
+        The evaluation of the nodes is synchronous: it cannot wait for a round, so the gates must all
+        have been scheduled by `run`.
+        """
+        raise ValueError(f"{type(gate).__name__} gates of AsyncSMCParty are only opened by run, in their rounds")
+
+    async def multiply(self, gates: List[Expression], traced: bool = True) -> None:
+        """
+        Evaluate a batch of independent gates in a single round, see `SMCParty.multiply`. Their
+        triplets must have been retrieved (as `run` does).
+        """
+        with self.traced_gates(gates if traced else []):
+            operands = [tuple(self.process_expression(child) for child in gate.children()) for gate in gates]
+            triplets = [self.triplets.pop(self.op_id(gate)) for gate in gates]
+            messages, openings = self.mask(gates, operands, triplets)
+            _, buf = await asyncio.gather(
+                self.comm.publish_many(messages),
+                self.comm.retrieve_many(self.peers, list(messages), self.min_peers),
+            )
+            self.unmask(gates, openings, triplets, buf)
@@ -0,0 +1,112 @@
+"""
+Tests of the client-side communication against a server running in a thread.
+"""
+
+import asyncio
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+import server
+from communication import AsyncCommunication, Communication
+from secret_sharing import Share
+
+
+@pytest.fixture
+def server_port():
+    for participant in ("Alice", "Bob", "Charlie"):
+        server.ttp.add_participant(participant)
+    http_server = make_server("localhost", 0, server.app, threaded=True)
+    thread = threading.Thread(target=http_server.serve_forever)
+    thread.start()
+    yield http_server.server_port
+    http_server.shutdown()
+    thread.join()
+    server.reset()
+
+
+def test_connections_are_reused(server_port):
+    alice = Communication("localhost", server_port, "Alice", pool_size=1)
+    bob = Communication("localhost", server_port, "Bob", pool_size=1)
+
+    for i in range(10):
+        alice.publish_message(f"reuse-{i}", str(i))
+    for i in range(10):
+        assert bob.retrieve_public_message("Alice", f"reuse-{i}") == str(i).encode()
+
+    stats = alice.connection_stats()
+    assert stats["requests"] == 10
+    assert stats["connections"] == 1
+    assert stats["reused"] == 9
+    assert bob.connections_opened == 1
+    assert bob.bytes_received == 10
+
+
+def test_long_poll_retrieval(server_port):
+    alice = Communication("localhost", server_port, "Alice")
+    bob = Communication("localhost", server_port, "Bob", long_poll=True, long_poll_timeout=5)
+
+    sender = threading.Timer(0.2, alice.send_private_message, args=("Bob", "long-poll-private", "7"))
+    sender.start()
+    assert bob.retrieve_private_message("long-poll-private") == b"7"
+    sender.join()
+    assert bob.requests_sent == 1
+
+
+def test_bulk_messages(server_port):
+    alice = Communication("localhost", server_port, "Alice")
+    bob = Communication("localhost", server_port, "Bob")
+    charlie = Communication("localhost", server_port, "Charlie")
+
+    alice.publish_many({"bulk_x": "1", "bulk_y": "2"})
+    bob.publish_many({"bulk_x": "3", "bulk_y": "4"})
+    messages = charlie.retrieve_many(["Alice", "Bob"], ["bulk_x", "bulk_y"])
+    assert messages == {
+        ("Alice", "bulk_x"): b"1", ("Alice", "bulk_y"): b"2",
+        ("Bob", "bulk_x"): b"3", ("Bob", "bulk_y"): b"4",
+    }
+    assert charlie.requests_sent == 1
+
+    # Bulk and single-message routes share the same store.
+    assert charlie.retrieve_public_message("Bob", "bulk_y") == b"4"
+
+    alice.send_private_many({("Bob", "bulk/private"): "5", ("Charlie", "bulk/private"): "6"})
+    assert bob.retrieve_private_many(["bulk/private"]) == {"bulk/private": b"5"}
+    assert charlie.retrieve_private_message("bulk/private") == b"6"
+
+
+def test_binary_bulk_messages(server_port):
+    alice = Communication("localhost", server_port, "Alice", binary=True)
+    bob = Communication("localhost", server_port, "Bob", binary=True)
+
+    payload = Share(12345).serialize(binary=True)
+    alice.publish_many({"binary_x": payload})
+    assert bob.retrieve_many(["Alice"], ["binary_x"]) == {("Alice", "binary_x"): payload}
+
+    alice.send_private_many({("Bob", "binary/private"): payload})
+    assert bob.retrieve_private_many(["binary/private"]) == {"binary/private": payload}
+
+    a, b, c = bob.retrieve_beaver_triplet_shares("binary-op")
+    triplets = bob.retrieve_beaver_triplet_shares_many(["binary-op", "binary-vector-op"], {"binary-vector-op": 3})
+    assert triplets["binary-op"][2].value == c.value
+    assert len(triplets["binary-vector-op"][0]) == 3
+
+
+def test_async_concurrent_requests(server_port):
+    async def exchange():
+        alice = AsyncCommunication("localhost", server_port, "Alice", long_poll=True, long_poll_timeout=5)
+        bob = AsyncCommunication("localhost", server_port, "Bob", long_poll=True, long_poll_timeout=5)
+        # Bob waits for the messages while Alice publishes them.
+        messages, _ = await asyncio.gather(
+            bob.retrieve_many(["Alice"], ["async_x", "async_y"]),
+            alice.publish_many({"async_x": "1", "async_y": "2"}),
+        )
+        triplets = await bob.retrieve_beaver_triplet_shares_many(["async_op"])
+        await asyncio.gather(alice.close(), bob.close())
+        return messages, triplets, bob.requests_sent
+
+    messages, triplets, requests_sent = asyncio.run(exchange())
+    assert messages == {("Alice", "async_x"): b"1", ("Alice", "async_y"): b"2"}
+    assert len(triplets["async_op"]) == 3
+    assert requests_sent == 2
@@ -0,0 +1,159 @@
+"""
+Unit tests for the expression compiler.
+"""
+
+from compiler import compile_expression
+from expression import (
+    Addition, InnerProduct, Multiplication, Scalar, Secret, SumReduce, Truncation, inner_product, postorder
+)
+from finite_field import FF, PRIME_128, FiniteField
+from fixed_point import encode
+from test_integration import suite
+
+
+def test_common_subexpressions_are_shared():
+    a, b, c = Secret(), Secret(), Secret()
+    expr = (a * b) * c + (b * a) + (a * b)
+    circuit = compile_expression(expr)
+    assert circuit.num_multiplications == 2
+    assert circuit.multiplicative_depth == 2
+
+
+def test_scalar_subtrees_are_folded():
+    a = Secret()
+    circuit = compile_expression(a * (Scalar(2) * Scalar(3) - Scalar(1)))
+    assert isinstance(circuit.expr, Multiplication)
+    assert circuit.expr.a is a
+    assert isinstance(circuit.expr.b, Scalar) and circuit.expr.b.value == 5
+
+
+def test_scalar_additions_are_merged():
+    secrets = [Secret() for _ in range(4)]
+    expr = secrets[0] + Scalar(5)
+    for secret in secrets[1:]:
+        expr = expr + (secret + Scalar(5))
+    expr = expr - Scalar(3)
+
+    circuit = compile_expression(expr)
+    assert isinstance(circuit.expr, Addition)
+    assert isinstance(circuit.expr.b, Scalar) and circuit.expr.b.value == 17
+    # 4 secrets, 3 additions between them and 1 constant.
+    assert circuit.num_nodes == 9
+
+
+def test_multiplications_by_constants():
+    a = Secret()
+    assert compile_expression(a * Scalar(1)).expr is a
+    circuit = compile_expression(a * Scalar(0) + Scalar(4))
+    assert isinstance(circuit.expr, Scalar) and circuit.expr.value == 4
+    assert compile_expression(Scalar(0) - a).expr.b is a
+
+
+def test_compilation_is_deterministic():
+    a, b = Secret(), Secret()
+    expr = (a + Scalar(3)) * (b - Scalar(FF.order + 1))
+    assert compile_expression(expr).expr.id == compile_expression(expr).expr.id
+
+
+def test_labels_are_sequential_and_stable():
+    a, b, c = Secret(), Secret(), Secret()
+    expr = a * b + b * c + Scalar(2)
+    circuit = compile_expression(expr)
+    labels = [circuit.label(node) for node in postorder(circuit.expr)]
+    assert labels == [str(i) for i in range(circuit.num_nodes)]
+    other = compile_expression(expr)
+    assert [other.label(node) for node in postorder(other.expr)] == labels
+
+
+
+def test_products_are_balanced():
+    secrets = [Secret() for _ in range(16)]
+    expr = secrets[0] * Scalar(3)
+    for secret in secrets[1:]:
+        expr = expr * (secret * Scalar(3))
+
+    assert compile_expression(expr, rebalance=False).multiplicative_depth == 15
+    circuit = compile_expression(expr)
+    assert circuit.num_multiplications == 15
+    assert circuit.multiplicative_depth == 4
+    # The scalars are folded into a single constant.
+    assert isinstance(circuit.expr.b, Scalar) and circuit.expr.b.value == 3 ** 16
+
+
+def test_deeper_operands_are_combined_last():
+    a, b, c, d, e = Secret(), Secret(), Secret(), Secret(), Secret()
+    expr = (a * b * c * d) * e
+    assert compile_expression(expr).multiplicative_depth == 3
+
+
+def test_shared_nodes_end_runs():
+    a, b, c = Secret(), Secret(), Secret()
+    shared = a * b
+    expr = (shared * c) + shared
+    circuit = compile_expression(expr)
+    assert circuit.num_multiplications == 2
+    assert circuit.multiplicative_depth == 2
+
+def test_shared_subexpressions_and_constants():
+    """
+    f(a, b, c) = (a * b + 2 * 3) * c + (b * a) - 4
+    """
+    a, b, c = Secret(), Secret(), Secret()
+
+    parties = {
+        "Alice": {a: 3},
+        "Bob": {b: 14},
+        "Charlie": {c: 2},
+    }
+
+    expr = (a * b + Scalar(2) * Scalar(3)) * c + (b * a) - Scalar(4)
+    expected = (3 * 14 + 6) * 2 + 14 * 3 - 4
+    suite(parties, expr, expected)
+
+
+def test_balanced_product():
+    """
+    f(a, b, c, d, e, f, g, h) = a * b * c * d * e * f * g * h, in 3 rounds
+    """
+    secrets = [Secret() for _ in range(8)]
+    parties = {
+        "Alice": {secrets[0]: 3, secrets[1]: 5},
+        "Bob": {secrets[2]: 7, secrets[3]: 2},
+        "Charlie": {secrets[4]: 11, secrets[5]: 13},
+        "Dave": {secrets[6]: 4, secrets[7]: 6},
+    }
+
+    expr = secrets[0]
+    for secret in secrets[1:]:
+        expr = expr * secret
+    assert compile_expression(expr).multiplicative_depth == 3
+    suite(parties, expr, 3 * 5 * 7 * 2 * 11 * 13 * 4 * 6)
+
+
+def test_fixed_point_and_reductions():
+    field = FiniteField(PRIME_128)
+    circuit = compile_expression(Scalar(-1.5, precision=8) * Scalar(0.5, precision=8), field=field)
+    assert circuit.expr.value == encode(-0.75, 8) % field.order
+
+    a, b = Secret(precision=8), Secret(precision=8)
+    circuit = compile_expression(a * b, field=field)
+    assert isinstance(circuit.expr, Truncation) and circuit.multiplicative_depth == 2
+    assert circuit.op_id(circuit.expr) == f"{circuit.label(circuit.expr)}.trunc8"
+
+    # Public operands of dot products need no round.
+    circuit = compile_expression(a.dot(Scalar(3)), field=field)
+    assert isinstance(circuit.expr, SumReduce) and circuit.multiplicative_depth == 0
+
+
+def test_inner_products_are_fused():
+    xs, ys = [Secret() for _ in range(4)], [Secret() for _ in range(4)]
+    circuit = compile_expression(inner_product(xs + [Scalar(2)], ys + [xs[0]]))
+    # The product with a constant is local, the others take one triplet and one round.
+    assert isinstance(circuit.expr, Addition)
+    fused = [node for node in postorder(circuit.expr) if isinstance(node, InnerProduct)]
+    assert len(fused) == 1 and len(fused[0].xs) == 4
+    assert circuit.num_multiplications == 1 and circuit.multiplicative_depth == 1
+
+    # Products commute, and so do their terms.
+    assert compile_expression(inner_product(ys[::-1], xs[::-1])).expr.id == fused[0].id
+    assert isinstance(compile_expression(inner_product([xs[0], Scalar(3)], ys[:2])).expr.a, Multiplication)
@@ -5,7 +5,12 @@ Testing expressions is not obligatory.
 MODIFY THIS FILE.
 """
 
-from expression import Secret, Scalar
+import pickle
+
+import pytest
+
+from expression import IdAllocator, Multiplication, Secret, Scalar, Truncation, inner_product, postorder
+from protocol import ProtocolSpec
 
 
 # Example test, you can adapt it to your needs.
@@ -23,3 +28,53 @@ def test():
     c = Secret(3)
     expr = a+b+c
     assert repr(expr) == "((Secret(1) + Secret(2)) + Secret(3))"
+
+
+def test_ids_are_sequential():
+    allocator = IdAllocator()
+    assert [allocator() for _ in range(3)] == [b"0", b"1", b"2"]
+    a, b = Secret(), Secret()
+    assert int(b.id) == int(a.id) + 1
+
+
+def test_postorder():
+    a, b = Secret(), Secret()
+    shared = a * b
+    expr = shared + (shared - a)
+    order = [node.id for node in postorder(expr)]
+    assert order == [a.id, b.id, shared.id, expr.b.id, expr.id]
+    assert [node.id for node in postorder(expr, skip={shared.id})] == [a.id, expr.b.id, expr.id]
+
+
+def test_deep_protocol_spec_pickling():
+    secrets = [Secret() for _ in range(20000)]
+    expr = secrets[0]
+    for secret in secrets[1:]:
+        expr = expr + secret * Scalar(2)
+    prot = pickle.loads(pickle.dumps(ProtocolSpec(participant_ids=["Alice"], expr=expr)))
+    assert [node.id for node in postorder(prot.expr)] == [node.id for node in postorder(expr)]
+
+
+def test_fixed_point_precisions():
+    p, n = Secret(precision=8), Secret()
+    assert (p + n).precision == 8 and isinstance((p + n).b, Multiplication)
+    assert (p * n).precision == 8 and isinstance(p * n, Multiplication)
+    product = p * Scalar(0.5)
+    assert isinstance(product, Truncation) and product.bits == 8 and product.precision == 8
+    assert (p.dot(p) - Scalar(1)).precision == 8 and p.sum().precision == 8
+
+    prot = pickle.loads(pickle.dumps(ProtocolSpec(participant_ids=["Alice"], expr=product + n)))
+    assert prot.expr.precision == 8 and prot.expr.a.bits == 8
+
+
+def test_inner_products():
+    xs, ys = [Secret(), Secret()], [Secret(), Scalar(2)]
+    expr = inner_product(xs, ys)
+    assert list(expr.pairs()) == list(zip(xs, ys)) and expr.children() == (*xs, *ys)
+    prot = pickle.loads(pickle.dumps(ProtocolSpec(participant_ids=["Alice"], expr=expr)))
+    assert [x.id for x in prot.expr.xs] == [x.id for x in xs] and [y.id for y in prot.expr.ys] == [y.id for y in ys]
+
+    with pytest.raises(ValueError):
+        inner_product(xs, ys[:1])
+    fixed = inner_product([Secret(precision=8)], [Secret(precision=8)])
+    assert isinstance(fixed, Truncation) and fixed.precision == 8
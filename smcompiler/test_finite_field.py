@@ -0,0 +1,42 @@
+"""
+Unit tests for the finite field arithmetic.
+"""
+
+import numpy as np
+
+from finite_field import FF, PRIME_128, PRIME_256, FiniteField
+
+
+def test_fields_of_different_orders():
+    small, large = FiniteField(101), FiniteField(PRIME_256)
+    assert small.add(100, 5) == 4
+    assert large.add(PRIME_256 - 1, 5) == 4
+    assert large.mul(2 ** 200, 2 ** 200) == pow(2, 400, PRIME_256)
+    assert FiniteField(FF.order) == FF and FiniteField(PRIME_128) != FF
+
+
+def test_large_field_vectors():
+    field = FiniteField(PRIME_128)
+    x = field.array([PRIME_128 - 1, 2 ** 127, 3])
+    y = np.array([2, 2 ** 63, 5], dtype=np.uint64)
+    assert field.add(x, y).tolist() == [1, (2 ** 127 + 2 ** 63) % PRIME_128, 8]
+    assert field.sub(y, x).tolist() == [3, (2 ** 63 - 2 ** 127) % PRIME_128, 2]
+    assert field.mul(x, y).tolist() == [(a * int(b)) % PRIME_128 for a, b in zip(x, y)]
+
+
+def test_batched_sum():
+    vectors = [FF.random(10) for _ in range(50)]
+    expected = [sum(int(v[i]) for v in vectors) % FF.order for i in range(10)]
+    assert FF.sum(vectors + [7]).tolist() == [(e + 7) % FF.order for e in expected]
+    assert FF.sum([FF.order - 1] * 1000) == (1000 * (FF.order - 1)) % FF.order
+
+    field = FiniteField(PRIME_256)
+    vectors = [field.random(3) for _ in range(5)]
+    assert field.sum(vectors).tolist() == [sum(v[i] for v in vectors) % PRIME_256 for i in range(3)]
+
+
+def test_inverse():
+    for field in (FF, FiniteField(PRIME_256)):
+        a = field.random()
+        assert field.mul(a, field.inv(a)) == 1
+        assert field.pow(a, field.order - 1) == 1
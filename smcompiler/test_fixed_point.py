@@ -0,0 +1,110 @@
+"""
+Unit tests for fixed-point values, truncations, vector reductions and inner products.
+"""
+
+import pytest
+
+from expression import Scalar, Secret, inner_product
+from finite_field import FF, PRIME_128, FiniteField
+from fixed_point import decode, encode, truncated_bits, truncation_op_id, truncation_pair, value_bits
+from protocol import ProtocolSpec
+from test_integration import run_processes, run_threads
+from transport import LocalTransport
+
+FIELD = FiniteField(PRIME_128)
+# Truncations are exact up to one unit in the last place.
+ULP = 2 ** -16
+
+
+def test_encoding():
+    assert encode(1.5, 16) == 3 << 15
+    assert encode([-0.25, 2], 4) == [-4, 32]
+    assert decode(FIELD.array(encode([-0.25, 2], 4)), 4, FIELD) == [-0.25, 2.0]
+    assert decode(FF.order - 1, 0) == -1.0
+
+
+def test_truncation_pairs():
+    bits = 16
+    r, r_high = truncation_pair(FIELD, bits)
+    assert r >> bits == r_high and r < 2 ** (value_bits(FIELD) + 40)
+    r, r_high = truncation_pair(FIELD, bits, size=5)
+    assert [int(v) >> bits for v in r] == [int(v) for v in r_high]
+
+    assert truncated_bits(truncation_op_id("12", bits)) == bits
+    assert truncated_bits("12") is None
+    with pytest.raises(ValueError):
+        value_bits(FF)
+
+
+def test_fixed_point_protocol():
+    """
+    f(p, q, w) = p * q * 0.5 + w - 3, with reals
+    """
+    p, q, w = Secret(precision=16), Secret(precision=16), Secret()
+    parties = {"Alice": {p: 3.25}, "Bob": {q: -1.5}, "Charlie": {w: 7}}
+    expr = p * q * Scalar(0.5) + w - Scalar(3)
+    assert expr.precision == 16
+    for threshold in (None, 1):
+        prot = ProtocolSpec(list(parties), expr, field=FIELD, threshold=threshold)
+        for result in run_threads(prot, parties):
+            assert result == pytest.approx(3.25 * -1.5 * 0.5 + 7 - 3, abs=2 * ULP)
+
+    with pytest.raises(ValueError):
+        run_threads(ProtocolSpec(list(parties), expr), parties)
+
+
+def test_dot_product_and_sum():
+    """
+    f(x, y, z, s) = x . y + sum(z) * s + sum(x * y), on vectors
+    """
+    x, y, z, s = Secret(), Secret(), Secret(), Secret()
+    parties = {"Alice": {x: [1, 2, 3], s: 4}, "Bob": {y: [4, 5, 6]}, "Charlie": {z: [7, 8]}}
+    prot = ProtocolSpec(list(parties), x.dot(y) + z.sum() * s + (x * y).sum())
+    assert run_threads(prot, parties) == [32 + 15 * 4 + 32] * 3
+
+    # Dot products of single values are products.
+    prot = ProtocolSpec(list(parties), s.dot(s) + x.dot(Scalar(2)))
+    assert run_threads(prot, parties) == [16 + 12] * 3
+
+
+def test_inner_product():
+    """
+    f(x, y) = x0 * y0 + x1 * y1 + x2 * 3, on scalars, vectors and reals
+    """
+    x, y = [Secret() for _ in range(3)], [Secret() for _ in range(2)]
+    parties = {"Alice": {x[0]: 1, x[1]: 2, x[2]: [3, 4]}, "Bob": {y[0]: 5, y[1]: [6, 7]}}
+    expr = inner_product(x, y + [Scalar(3)])
+    for threshold in (None, 1):
+        prot = ProtocolSpec(list(parties), expr, threshold=threshold)
+        assert run_threads(prot, parties) == [[5 + 12 + 9, 5 + 14 + 12]] * 2
+
+    p = [Secret(precision=16) for _ in range(4)]
+    parties = {"Alice": {p[0]: 1.5, p[1]: -2.0}, "Bob": {p[2]: 0.25, p[3]: 0.75}}
+    prot = ProtocolSpec(list(parties), inner_product(p[:2], p[2:]), field=FIELD)
+    for result in run_threads(prot, parties):
+        assert result == pytest.approx(1.5 * 0.25 - 2.0 * 0.75, abs=ULP)
+
+
+def test_fixed_point_vectors_over_the_server():
+    """
+    Weighted mean of vectors of reals, with the parties in processes and the triplets from the server
+    """
+    values, weights = Secret(precision=16), Secret(precision=16)
+    parties = {"Alice": {values: [1.5, -2.25, 4.0]}, "Bob": {weights: [0.5, 0.25, 0.25]}}
+    prot = ProtocolSpec(list(parties), values.dot(weights) - values.sum() * Scalar(0.125), field=FIELD)
+    results = run_processes(list(parties), *[(name, prot, value_dict) for name, value_dict in parties.items()])
+    expected = 1.5 * 0.5 - 2.25 * 0.25 + 4.0 * 0.25 - (1.5 - 2.25 + 4.0) * 0.125
+    for result in results:
+        assert result == pytest.approx(expected, abs=3 * ULP)
+
+
+def test_fixed_point_with_paillier_preprocessing():
+    a, b = Secret(precision=16), Secret(precision=16)
+    parties = {"Alice": {a: [0.5, -3.0]}, "Bob": {b: [2.0, 1.25]}}
+    prot = ProtocolSpec(list(parties), a * b, field=FIELD, preprocessing="paillier", key_bits=1024)
+    transport = LocalTransport(list(parties), prot)
+    for result in run_threads(prot, parties, transport):
+        # The locally drawn truncation pairs may add a carry per party.
+        assert result == pytest.approx([1.0, -3.75], abs=len(parties) * ULP)
+    # Neither the triplets nor the truncation pairs come from the trusted third party.
+    assert transport.ttp.stats() == {"triplets": 0, "served": 0}
@@ -5,16 +5,17 @@ You can *add* new tests here, but it is best to  add them to a new test file.
 ALL EXISTING TESTS IN THIS SUITE SHOULD PASS WITHOUT ANY MODIFICATION TO THEM.
 """
 
-import time
+import threading
 from multiprocessing import Process, Queue
 
 import pytest
 
 from expression import Scalar, Secret
 from protocol import ProtocolSpec
-from server import run
+import server
 
 from smc_party import SMCParty
+from transport import LocalTransport
 
 
 def smc_client(client_id, prot, value_dict, queue):
@@ -30,18 +31,12 @@ def smc_client(client_id, prot, value_dict, queue):
     print(f"{client_id} has finished!")
 
 
-def smc_server(args):
-    run("localhost", 5000, args)
-
-
 def run_processes(server_args, *client_args):
     queue = Queue()
 
-    server = Process(target=smc_server, args=(server_args,))
     clients = [Process(target=smc_client, args=(*args, queue)) for args in client_args]
 
-    server.start()
-    time.sleep(3)
+    server_process = server.start("localhost", 5000, server_args)
     for client in clients:
         client.start()
 
@@ -52,17 +47,40 @@ def run_processes(server_args, *client_args):
     for client in clients:
         results.append(queue.get())
 
-    server.terminate()
-    server.join()
-
-    # To "ensure" the workers are dead.
-    time.sleep(2)
-
+    server.stop(server_process)
     print("Server stopped.")
 
     return results
 
 
+def run_threads(prot, parties, transport=None, **comm_options):
+    """
+    Run the parties in threads of this process, exchanging their messages in memory rather than
+    through a server (through `transport` if it is given).
+    """
+    transport = transport or LocalTransport(prot.participant_ids, prot)
+    results, errors = dict(), dict()
+
+    def run_party(name, value_dict):
+        try:
+            results[name] = SMCParty(
+                name, "localhost", 5000, prot, value_dict, transport=transport, **comm_options
+            ).run()
+        except Exception as error:
+            errors[name] = error
+
+    threads = [threading.Thread(target=run_party, args=item) for item in parties.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The failure of a party, rather than the missing results of the others.
+    for name in parties:
+        if name in errors:
+            raise errors[name]
+    return [results[name] for name in parties]
+
+
 def suite(parties, expr, expected):
     participants = list(parties.keys())
 
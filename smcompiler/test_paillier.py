@@ -0,0 +1,91 @@
+"""
+Unit tests for the Paillier cryptosystem and the triplets the parties generate with it.
+"""
+
+import threading
+
+import pytest
+
+from communication import Communication
+from expression import Secret
+from finite_field import FF, PRIME_128, FiniteField
+from paillier import PublicKey, generate_keypair, is_probable_prime
+from preprocessing import PaillierTripletGenerator
+from protocol import ProtocolSpec
+from randomness import RandomSource
+from test_integration import run_threads
+from transport import LocalTransport
+
+
+def test_primality():
+    assert [n for n in range(30) if is_probable_prime(n)] == [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    assert is_probable_prime(FF.order) and is_probable_prime(PRIME_128)
+    assert not is_probable_prime(FF.order * PRIME_128)
+    assert is_probable_prime(2 ** 127 - 1) and not is_probable_prime(2 ** 127 + 1)
+
+
+def test_encryption_is_additively_homomorphic():
+    source = RandomSource(b"paillier")
+    public_key, private_key = generate_keypair(512, source)
+    assert public_key.n.bit_length() == 512
+
+    x, y = 123456789, 987654321
+    c_x, c_y = public_key.encrypt(x, source), private_key.encrypt(y, source)
+    assert private_key.decrypt(c_x) == x and private_key.decrypt(c_y) == y
+    # Encryption is randomized.
+    assert public_key.encrypt(x, source) != c_x
+    assert private_key.decrypt(public_key.add(c_x, c_y)) == x + y
+    assert private_key.decrypt(public_key.mul(c_x, 3)) == 3 * x
+    assert private_key.decrypt(public_key.encrypt(-1, source)) == public_key.n - 1
+
+    received = PublicKey.from_bytes(public_key.to_bytes())
+    assert received.n == public_key.n
+    assert received.decode(received.encode([c_x, c_y, 1])) == [c_x, c_y, 1]
+
+
+@pytest.mark.parametrize("field", [FF, FiniteField(PRIME_128)])
+def test_generated_triplets_are_valid(field):
+    participants = ["Alice", "Bob", "Charlie"]
+    transport = LocalTransport(participants, timeout=30)
+    generators = {
+        name: PaillierTripletGenerator(Communication("localhost", 5000, name, transport=transport), participants, field, 1024)
+        for name in participants
+    }
+    # More triplets than slots in a ciphertext.
+    count = generators["Alice"].slots + 3
+    results = dict()
+
+    def generate(name):
+        results[name] = generators[name].generate(count)
+
+    threads = [threading.Thread(target=generate, args=(name,)) for name in participants]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    a, b, c = (field.sum([results[name][i] for name in participants]) for i in range(3))
+    assert len(c) == count
+    assert field.mul(a, b).tolist() == c.tolist()
+    assert transport.store.stats()["messages"] == 0
+
+
+def test_key_too_small_for_the_field():
+    comm = Communication("localhost", 5000, "Alice", transport=LocalTransport(["Alice"]))
+    with pytest.raises(ValueError):
+        PaillierTripletGenerator(comm, ["Alice"], FiniteField(PRIME_128), key_bits=256)
+
+
+def test_protocol_with_paillier_preprocessing():
+    """
+    f(a, b, c) = (a + b) * c * a, on scalars and vectors, with triplets generated by the parties
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    parties = {"Alice": {a: 3}, "Bob": {b: 14}, "Charlie": {c: [2, 5]}}
+    prot = ProtocolSpec(list(parties), (a + b) * c * a, preprocessing="paillier", key_bits=512)
+    assert run_threads(prot, parties) == [[17 * 2 * 3, 17 * 5 * 3]] * 3
+
+    with pytest.raises(ValueError):
+        ProtocolSpec(list(parties), a * b, threshold=1, preprocessing="paillier")
+    with pytest.raises(ValueError):
+        ProtocolSpec(list(parties), a * b, preprocessing="ot")
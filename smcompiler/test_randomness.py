@@ -0,0 +1,52 @@
+"""
+Unit tests for the randomness of the shares and the triplets.
+"""
+
+import os
+
+import numpy as np
+
+from finite_field import FF, PRIME_128, FiniteField
+from randomness import RandomSource, default_source
+from secret_sharing import share_secret
+
+
+def test_seeded_sources_are_reproducible():
+    first, second = RandomSource(b"seed"), RandomSource(b"seed")
+    assert first.read(100) + first.read(5) == second.read(105)
+    assert first.elements(FF.order, 1000).tolist() == second.elements(FF.order, 1000).tolist()
+    assert RandomSource(b"other").read(32) != RandomSource(b"seed").read(32)
+
+
+def test_elements_are_in_range():
+    source = RandomSource(b"range", chunk_size=64)
+    for bound in (2, 3, 257, FF.order, 2 ** 64 - 59, PRIME_128):
+        values = source.elements(bound, 500)
+        assert len(values) == 500 and all(0 <= int(v) < bound for v in values)
+        assert 0 <= source.below(bound) < bound
+    # Every value of a small range comes up, the bound itself never does.
+    assert set(source.elements(5, 1000).tolist()) == {0, 1, 2, 3, 4}
+
+
+def test_field_elements_are_uniform():
+    values = FF.random(100000)
+    assert values.dtype == np.uint64
+    assert abs(values.astype(float).mean() / FF.order - 0.5) < 0.01
+    assert FiniteField(PRIME_128).random(3).dtype == object
+
+
+def test_shares_of_scalars_are_field_elements():
+    for _ in range(100):
+        shares = share_secret(FF.order - 1, 3)
+        assert all(0 <= share.value < FF.order for share in shares)
+        assert sum(share.value for share in shares) % FF.order == FF.order - 1
+
+
+def test_forked_processes_draw_different_values():
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write, default_source.read(16))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(read, 16) != default_source.read(16)
@@ -0,0 +1,58 @@
+"""
+Unit tests for the round scheduler, and integration tests for batched multiplications.
+"""
+
+from expression import Scalar, Secret
+from scheduler import Schedule, multiplication_levels, multiplicative_depth
+from test_integration import suite
+
+
+def test_levels_of_chain():
+    secrets = [Secret() for _ in range(4)]
+    expr = secrets[0] * secrets[1] * secrets[2] * secrets[3]
+    levels = multiplication_levels(expr)
+    assert [len(level) for level in levels] == [1, 1, 1]
+
+
+def test_levels_of_balanced_product():
+    a, b, c, d = Secret(), Secret(), Secret(), Secret()
+    left, right = a * b, c * d
+    expr = left * right
+    levels = multiplication_levels(expr)
+    assert [[gate.id for gate in level] for level in levels] == [[left.id, right.id], [expr.id]]
+    assert multiplicative_depth(expr) == 2
+
+
+
+def test_stages_between_rounds():
+    a, b, c = Secret(), Secret(), Secret()
+    total = a + b
+    left = total * c
+    expr = left + c
+    schedule = Schedule(expr)
+    assert [[node.id for node in stage] for stage in schedule.stages] == [[a.id, b.id, total.id, c.id], [expr.id]]
+    assert [[gate.id for gate in level] for level in schedule.levels] == [[left.id]]
+    assert schedule.consumers == {a.id: 1, b.id: 1, total.id: 1, c.id: 2, left.id: 1}
+
+def test_scalar_multiplications_are_local():
+    a, b = Secret(), Secret()
+    expr = (a * Scalar(3)) * (Scalar(2) * b) + a * (Scalar(2) * Scalar(5))
+    assert multiplicative_depth(expr) == 1
+
+
+def test_batched_products():
+    """
+    f(a, b, c, d) = (a * b) * (c * d) + a * c
+    """
+    a, b, c, d = Secret(), Secret(), Secret(), Secret()
+
+    parties = {
+        "Alice": {a: 3},
+        "Bob": {b: 5},
+        "Charlie": {c: 7},
+        "Dave": {d: 11},
+    }
+
+    expr = (a * b) * (c * d) + a * c
+    expected = (3 * 5) * (7 * 11) + 3 * 7
+    suite(parties, expr, expected)
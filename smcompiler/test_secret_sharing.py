@@ -5,6 +5,85 @@ Testing secret sharing is not obligatory.
 MODIFY THIS FILE.
 """
 
+import itertools
+
+import numpy as np
+
+from finite_field import FF, PRIME_256, FiniteField
+from secret_sharing import (
+    ShamirScheme,
+    reconstruct_secret,
+    share_secret,
+    Share,
+    VectorShare,
+)
+
 
 def test():
     raise NotImplementedError("You can create some tests.")
+
+
+def test_share_and_reconstruct():
+    shares = share_secret(1234, 5)
+    assert len(shares) == 5
+    assert reconstruct_secret(shares) == 1234
+
+
+def test_share_and_reconstruct_vector():
+    secret = [0, 1, 2, FF.order - 1, 123456789]
+    shares = share_secret(secret, 4)
+    assert all(isinstance(share, VectorShare) and len(share) == len(secret) for share in shares)
+    assert reconstruct_secret(shares) == secret
+
+
+def test_vector_share_arithmetic():
+    x = [FF.order - 2, 3, 10**11]
+    y = [5, FF.order - 7, 10**11 - 1]
+    vx, vy = VectorShare(x), VectorShare(y)
+    assert (vx + vy).value.tolist() == [(a + b) % FF.order for a, b in zip(x, y)]
+    assert (vx - vy).value.tolist() == [(a - b) % FF.order for a, b in zip(x, y)]
+    assert (vx * vy).value.tolist() == [(a * b) % FF.order for a, b in zip(x, y)]
+    assert FF.mul(vx, 3).tolist() == [(3 * a) % FF.order for a in x]
+
+
+def test_share_and_reconstruct_large_field():
+    field = FiniteField(PRIME_256)
+    secret = PRIME_256 - 12345
+    assert reconstruct_secret(share_secret(secret, 3, field), field) == secret
+
+    vector = [2 ** 255, 1, PRIME_256 - 1]
+    shares = share_secret(vector, 3, field)
+    restored = [Share.deserialize(share.serialize(binary=True), field) for share in shares]
+    assert reconstruct_secret(restored, field) == vector
+
+
+def test_vector_share_serialization():
+    share = VectorShare([1, 2, 3])
+    restored = Share.deserialize(share.serialize())
+    assert isinstance(restored, VectorShare)
+    assert np.array_equal(restored.value, share.value)
+
+
+def test_shamir_any_quorum_reconstructs():
+    participants = ["Alice", "Bob", "Charlie", "David", "Eve"]
+    scheme = ShamirScheme(participants, 2)
+    shares = dict(zip(participants, scheme.share(424242)))
+    for subset in itertools.combinations(participants, 3):
+        assert scheme.reconstruct({pid: shares[pid] for pid in subset}) == 424242
+    assert scheme.reconstruct(shares) == 424242
+
+
+def test_shamir_batched_combine():
+    participants = ["Alice", "Bob", "Charlie"]
+    scheme = ShamirScheme(participants, 1)
+    secrets = [5, FF.order - 1, [1, 2, 3]]
+    shares = {pid: [] for pid in participants}
+    for secret in secrets:
+        for pid, share in zip(participants, scheme.share(secret)):
+            shares[pid].append(share)
+    opened = scheme.combine({pid: shares[pid] for pid in ("Bob", "Charlie")})
+    assert opened[:2] == [5, FF.order - 1]
+    assert list(opened[2]) == [1, 2, 3]
+    # Sums of shares are shares of the sum.
+    total = {pid: [FF.add(shares[pid][0], shares[pid][1])] for pid in ("Alice", "Charlie")}
+    assert scheme.combine(total) == [4]
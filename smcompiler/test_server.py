@@ -0,0 +1,115 @@
+"""
+Unit tests for the trusted server routes.
+"""
+
+import threading
+import time
+
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def clean_server():
+    yield
+    server.reset()
+
+
+def test_long_poll_returns_once_posted():
+    client = server.app.test_client()
+
+    def publish():
+        time.sleep(0.3)
+        server.app.test_client().post("/public/Alice/long-poll", data=b"42")
+
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    start = time.time()
+    res = client.get("/public/Bob/Alice/long-poll", query_string={"wait": 5})
+    elapsed = time.time() - start
+    publisher.join()
+
+    assert res.status_code == 200
+    assert res.data == b"42"
+    assert elapsed < 5
+
+
+def test_long_poll_times_out():
+    client = server.app.test_client()
+    res = client.get("/private/Bob/never-sent", query_string={"wait": 0.1})
+    assert res.status_code == 404
+
+
+def test_poll_without_wait():
+    client = server.app.test_client()
+    assert client.get("/private/Bob/not-yet").status_code == 404
+    client.post("/private/Alice/Bob/not-yet", data=b"1")
+    res = client.get("/private/Bob/not-yet")
+    assert res.status_code == 200
+    assert res.data == b"1"
+
+
+def test_bulk_retrieve_waits_for_all_senders():
+    client = server.app.test_client()
+    client.post("/bulk/public/Alice", json={"bulk-wait": "1"})
+    query = {"senders": ["Alice", "Bob"], "labels": ["bulk-wait"]}
+    assert client.post("/bulk/public/Charlie/retrieve", json=query).status_code == 404
+
+    client.post("/bulk/public/Bob", json={"bulk-wait": "2"})
+    res = client.post("/bulk/public/Charlie/retrieve", json=query)
+    assert res.status_code == 200
+    assert res.get_json() == {"Alice": {"bulk-wait": "1"}, "Bob": {"bulk-wait": "2"}}
+
+
+def test_health():
+    res = server.app.test_client().get("/health")
+    assert res.status_code == 200
+    assert res.get_json()["status"] == "ok"
+
+
+def test_start_blocks_until_ready():
+    process = server.start("localhost", 5001, ["Alice", "Bob"])
+    try:
+        report = server.wait_ready("localhost", 5001, timeout=0)
+        assert report["pid"] == process.pid
+        assert report["participants"] == 2
+    finally:
+        server.stop(process)
+    with pytest.raises(TimeoutError):
+        server.wait_ready("localhost", 5001, timeout=0.1)
+
+
+def test_metrics_report_evictions():
+    server.open_session(server.DEFAULT_SESSION, ["Alice", "Bob"])
+    client = server.app.test_client()
+    client.post("/bulk/public/Alice", json={"metrics": "12345"})
+    assert client.get("/metrics").get_json()["store"]["bytes"] == 5
+
+    client.post("/bulk/public/Bob/retrieve", json={"senders": ["Alice"], "labels": ["metrics"]})
+    report = client.get("/metrics").get_json()
+    assert report["store"] == {"messages": 0, "bytes": 0, "evicted": 1, "sessions": 1}
+    assert report["sessions"] == 0
+    assert report["ttp"] == {"triplets": 0, "served": 0}
+    assert report["rss_bytes"] > 0
+
+
+def test_sessions_are_isolated():
+    client = server.app.test_client()
+    assert client.post("/sessions/first", json={"participants": ["Alice", "Bob"]}).status_code == 200
+    assert client.post("/sessions/second", json={"participants": ["Alice", "Charlie"]}).status_code == 200
+
+    client.post("/sessions/first/public/Alice/x", data=b"1")
+    client.post("/sessions/second/public/Alice/x", data=b"2")
+    assert client.get("/sessions/first/public/Bob/Alice/x").data == b"1"
+    assert client.get("/sessions/second/public/Charlie/Alice/x").data == b"2"
+    assert client.get("/public/Bob/Alice/x").status_code == 404
+
+    # Each session has its own participants and triplets.
+    assert client.get("/sessions/second/shares/Charlie/op").status_code == 200
+    assert len(server.sessions["first"].participant_ids) == 2
+    assert client.get("/sessions/unknown/shares/Alice/op").status_code == 404
+
+    assert client.delete("/sessions/first").status_code == 200
+    assert "first" not in server.sessions
+    assert client.get("/metrics").get_json()["sessions"] == 1
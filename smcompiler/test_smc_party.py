@@ -0,0 +1,190 @@
+"""
+Unit tests for the evaluation of expressions by a party.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+import server
+from expression import Scalar, Secret
+from finite_field import FF, PRIME_256, FiniteField
+from protocol import ProtocolSpec
+from scheduler import Schedule
+from secret_sharing import as_share
+from smc_party import AsyncSMCParty, SMCParty
+from test_communication import server_port
+from test_integration import run_processes, suite
+from transport import LocalTransport
+
+
+def local_party(expr, values):
+    """A single party holding all the inputs, evaluating without any message exchange."""
+    party = SMCParty("Alice", "localhost", 5000, ProtocolSpec(participant_ids=["Alice"], expr=expr), {})
+    for secret, value in values.items():
+        party.results[secret.id] = as_share(value)
+    party.consumers = dict(Schedule(expr).consumers)
+    return party
+
+
+def test_deep_expression():
+    secrets = [Secret() for _ in range(50000)]
+    expr = secrets[0]
+    for secret in secrets[1:]:
+        expr = expr * Scalar(3) - secret + Scalar(1)
+
+    values = {secret: i for i, secret in enumerate(secrets)}
+    expected = 0
+    for i in range(1, len(secrets)):
+        expected = (expected * 3 - i + 1) % FF.order
+
+    party = local_party(expr, values)
+    assert party.process_expression(expr).value == expected
+    # Intermediate values are released as soon as they are used.
+    assert len(party.results) == 1
+
+
+def test_shared_values_are_kept_until_last_use():
+    a, b = Secret(), Secret()
+    shared = a - b
+    expr = (shared + a) * Scalar(2) + shared
+
+    party = local_party(expr, {a: 7, b: 3})
+    assert party.process_expression(expr).value == ((7 - 3) + 7) * 2 + (7 - 3)
+    assert list(party.results) == [expr.id]
+
+
+def test_deep_circuit():
+    """
+    f(a, b, c) = a * b + c + c + ... + c, deeper than the recursion limit of Python
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    parties = {
+        "Alice": {a: 3},
+        "Bob": {b: 14},
+        "Charlie": {c: 2},
+    }
+
+    expr = a * b
+    for _ in range(5000):
+        expr = expr + c
+    suite(parties, expr, 3 * 14 + 5000 * 2)
+
+
+def test_large_field_circuit():
+    """
+    f(a, b, c) = a * b - c, with inputs that only fit in a 256-bit field
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    values = {"Alice": {a: 2 ** 200}, "Bob": {b: 3 ** 30}, "Charlie": {c: [1, 2]}}
+
+    prot = ProtocolSpec(participant_ids=list(values), expr=a * b - c, field=FiniteField(PRIME_256))
+    results = run_processes(list(values), *[(name, prot, value_dict) for name, value_dict in values.items()])
+    for result in results:
+        assert result == [2 ** 200 * 3 ** 30 - 1, 2 ** 200 * 3 ** 30 - 2]
+
+
+def test_threshold_circuit_without_a_party():
+    """
+    f(a, b, c) = (a + 5) * b * c, Shamir-shared with threshold 2: David never shows up
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    values = {"Alice": {a: 3}, "Bob": {b: 14}, "Charlie": {c: 2}}
+
+    participants = list(values) + ["David"]
+    prot = ProtocolSpec(participant_ids=participants, expr=(a + Scalar(5)) * b * c, threshold=2)
+    results = run_processes(participants, *[(name, prot, value_dict) for name, value_dict in values.items()])
+    assert results == [(3 + 5) * 14 * 2] * 3
+
+
+def test_async_parties_in_one_event_loop(server_port):
+    """
+    f(a, b, c, d) = a * b * c + 2 * d, with all the parties in a single event loop
+    """
+    a, b, c, d = Secret(), Secret(), Secret(), Secret()
+    values = {"Alice": {a: 3, d: [4, 5]}, "Bob": {b: 14}, "Charlie": {c: 2}}
+    prot = ProtocolSpec(participant_ids=list(values), expr=a * b * c + d * Scalar(2))
+
+    async def run_parties():
+        parties = [
+            AsyncSMCParty(name, "localhost", server_port, prot, value_dict, long_poll=True)
+            for name, value_dict in values.items()
+        ]
+        return await asyncio.gather(*(party.run() for party in parties))
+
+    assert asyncio.run(run_parties()) == [[3 * 14 * 2 + 8, 3 * 14 * 2 + 10]] * 3
+
+
+def test_async_parties_with_a_local_transport():
+    """
+    f(a, b, c) = a * b + c, with the async parties exchanging their messages in memory, without a server
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    values = {"Alice": {a: 3}, "Bob": {b: 14}, "Charlie": {c: [2, 5]}}
+    prot = ProtocolSpec(participant_ids=list(values), expr=a * b + c)
+    transport = LocalTransport(list(values), prot, timeout=30)
+
+    async def run_parties():
+        parties = [
+            AsyncSMCParty(name, "localhost", 5000, prot, value_dict, transport=transport)
+            for name, value_dict in values.items()
+        ]
+        return await asyncio.gather(*(party.run() for party in parties))
+
+    assert asyncio.run(run_parties()) == [[3 * 14 + 2, 3 * 14 + 5]] * 3
+    assert transport.store.stats()["messages"] == 0
+
+
+def test_async_parties_only_open_scheduled_gates():
+    a, b = Secret(), Secret()
+    party = AsyncSMCParty("Alice", "localhost", 5000, ProtocolSpec(participant_ids=["Alice"], expr=a * b), {})
+    party.results.update({a.id: as_share(3), b.id: as_share(14)})
+    assert party.process_expression(a * Scalar(2)).value == 6
+    with pytest.raises(ValueError):
+        party.process_expression(a * b)
+
+
+def test_many_async_parties_with_a_local_transport():
+    """
+    f(x1, ..., xn) = x1 * x2 * ... * xn, with more parties in one event loop than the default executor
+    of asyncio has workers: their reads must not keep the others from sending
+    """
+    n = min(32, (os.cpu_count() or 1) + 4) + 4
+    secrets = [Secret() for _ in range(n)]
+    expr = secrets[0]
+    for secret in secrets[1:]:
+        expr = expr * secret
+    values = {f"P{i}": {secret: 2 if i < 3 else 1} for i, secret in enumerate(secrets)}
+    prot = ProtocolSpec(participant_ids=list(values), expr=expr)
+    transport = LocalTransport(list(values), prot, timeout=10)
+
+    async def run_parties():
+        parties = [
+            AsyncSMCParty(name, "localhost", 5000, prot, value_dict, transport=transport)
+            for name, value_dict in values.items()
+        ]
+        return await asyncio.gather(*(party.run() for party in parties))
+
+    assert asyncio.run(run_parties()) == [8] * n
+
+
+def test_concurrent_sessions(server_port):
+    """
+    The same protocol run twice at the same time on one server, in two sessions
+    """
+    a, b = Secret(), Secret()
+    prot = ProtocolSpec(participant_ids=["Alice", "Bob"], expr=a * b + a)
+    inputs = {"first": (3, 14), "second": (5, 7)}
+    for session in inputs:
+        server.open_session(session, prot.participant_ids)
+
+    async def run_parties():
+        parties = [
+            AsyncSMCParty(name, "localhost", server_port, prot, {secret: value}, session=session, long_poll=True)
+            for session, values in inputs.items()
+            for name, secret, value in zip(prot.participant_ids, (a, b), values)
+        ]
+        return await asyncio.gather(*(party.run() for party in parties))
+
+    assert asyncio.run(run_parties()) == [3 * 14 + 3] * 2 + [5 * 7 + 5] * 2
@@ -0,0 +1,92 @@
+"""
+Unit tests for the traces of protocol runs.
+"""
+
+import json
+import threading
+import time
+
+from communication import Communication
+from expression import Scalar, Secret
+from protocol import ProtocolSpec
+from smc_party import SMCParty
+from test_communication import server_port
+from tracing import NULL_TRACER, Tracer, chrome_trace, write_chrome_trace
+from transport import LocalTransport
+
+
+def test_spans_sum_up_their_children():
+    tracer = Tracer("Alice")
+    with tracer.span("round 1") as round_span:
+        with tracer.span("publish_many", "network") as network_span:
+            network_span.count(bytes_sent=10, requests=1)
+            time.sleep(0.01)
+        start = tracer.now()
+        tracer.record("Addition", "node", start, start + 0.5)
+        # Spans measured by the caller are already accounted to their parent.
+        tracer.record("Multiplication", "node", start, start + 0.5, 0.01, {"bytes_sent": 10})
+    assert round_span.counters["bytes_sent"] == 10 and round_span.counters["requests"] == 1
+    assert round_span.network == network_span.duration >= 0.01
+    assert round_span.compute == round_span.duration - round_span.network
+    assert tracer.summary()["bytes_sent"] == 10
+    assert [span.name for span in tracer.spans] == ["publish_many", "Addition", "Multiplication", "round 1"]
+
+
+def test_traced_protocol():
+    a, b, c = Secret(), Secret(), Secret()
+    values = {"Alice": {a: 3}, "Bob": {b: 14}, "Charlie": {c: 2}}
+    prot = ProtocolSpec(participant_ids=list(values), expr=a * b * c + Scalar(5))
+    transport = LocalTransport(prot.participant_ids, prot)
+    parties = [
+        SMCParty(name, "localhost", 5000, prot, value_dict, transport=transport, tracer=Tracer(name))
+        for name, value_dict in values.items()
+    ]
+    threads = [threading.Thread(target=party.run) for party in parties]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    trace = parties[0].tracer.to_dict()
+    names = [span["name"] for span in trace["spans"]]
+    assert {"compile", "input", "triplets", "round 1", "round 2", "output"} <= set(names)
+    assert "Addition" in names and "Secret" in names
+    rounds = [span for span in trace["spans"] if span["name"].startswith("round")]
+    assert all(span["bytes_sent"] > 0 and span["bytes_received"] > 0 for span in rounds)
+    # The gates opened in a round share its messages.
+    gates = [span for span in trace["spans"] if span["name"] == "Multiplication"]
+    assert len(gates) == 2 and all(gate["network"] > 0 for gate in gates)
+    assert sorted(gate["bytes_received"] for gate in gates) == sorted(span["bytes_received"] for span in rounds)
+    assert trace["summary"]["bytes_sent"] == parties[0].comm.bytes_sent
+    (triplets,) = [span for span in trace["spans"] if span["name"] == "triplets"]
+    assert triplets["bytes_received"] > 0
+    assert trace["summary"]["requests"] == parties[0].comm.requests_sent
+
+    events = chrome_trace(party.tracer.to_dict() for party in parties)["traceEvents"]
+    assert {event["pid"] for event in events} == {0, 1, 2}
+    assert all(event["ph"] in ("M", "X") for event in events)
+
+
+def test_polling_retries_are_counted(server_port, tmp_path):
+    tracer = Tracer("Bob")
+    bob = Communication("localhost", server_port, "Bob", poll_delay=0.05, tracer=tracer)
+    alice = Communication("localhost", server_port, "Alice")
+    timer = threading.Timer(0.3, alice.send_private_message, ("Bob", "x", "42"))
+    timer.start()
+    assert bob.retrieve_private_message("x") == b"42"
+    timer.join()
+
+    (span,) = tracer.spans
+    assert span.name == "retrieve_private_message" and span.category == "network"
+    assert span.counters["retries"] >= 1
+    assert span.counters["requests"] == span.counters["retries"] + 1
+
+    path = tmp_path / "trace.json"
+    write_chrome_trace(str(path), [tracer])
+    (_, event) = json.loads(path.read_text())["traceEvents"]
+    assert event["args"]["retries"] == span.counters["retries"]
+
+
+def test_tracing_is_off_by_default():
+    comm = Communication("localhost", 5000, "Alice")
+    assert comm.tracer is NULL_TRACER and not NULL_TRACER.spans
@@ -0,0 +1,122 @@
+"""
+Unit tests for the in-memory transport.
+"""
+
+import threading
+
+import pytest
+
+from communication import Communication
+from expression import Scalar, Secret
+from finite_field import FF
+from protocol import ProtocolSpec
+from smc_party import SMCParty
+from test_integration import run_threads
+from transport import LocalTransport, MessageStore
+
+
+def test_message_store_waits_for_messages():
+    store = MessageStore()
+    writer = threading.Timer(0.1, store.put_many, args=("public", {("Alice", "x"): b"1", ("Bob", "x"): b"2"}))
+    writer.start()
+    assert store.get_many("public", [("Alice", "x"), ("Bob", "x")], timeout=5) == {
+        ("Alice", "x"): b"1", ("Bob", "x"): b"2"
+    }
+    writer.join()
+    assert store.get("private", ("Alice", "x")) is None
+    assert store.get_quorum("public", ["Alice", "Bob", "Charlie"], ["x"], 2) == {
+        ("Alice", "x"): b"1", ("Bob", "x"): b"2"
+    }
+    assert store.get_quorum("public", ["Alice", "Bob", "Charlie"], ["x"], 3, timeout=0.05) is None
+
+
+def test_communication_over_local_transport():
+    transport = LocalTransport(["Alice", "Bob"], timeout=1)
+    alice = Communication("localhost", 5000, "Alice", transport=transport)
+    bob = Communication("localhost", 5000, "Bob", transport=transport)
+
+    alice.send_private_message("Bob", "private", "7")
+    alice.publish_many({"x": "1", "y": b"2"})
+    assert bob.retrieve_private_message("private") == b"7"
+    assert bob.retrieve_many(["Alice"], ["x", "y"]) == {("Alice", "x"): b"1", ("Alice", "y"): b"2"}
+    assert bob.bytes_received == 3
+
+    a, b, c = alice.retrieve_beaver_triplet_shares("op")
+    a_bob, b_bob, c_bob = bob.retrieve_beaver_triplet_shares_many(["op"])["op"]
+    assert FF.mul(FF.add(a, a_bob), FF.add(b, b_bob)) == FF.add(c, c_bob)
+
+    with pytest.raises(TimeoutError):
+        bob.retrieve_public_message("Alice", "never-sent")
+
+
+def test_protocol_over_local_transport():
+    """
+    f(a, b, c) = (a + b) * c * 3, with the parties in threads of this process
+    """
+    a, b, c = Secret(), Secret(), Secret()
+    parties = {"Alice": {a: 3}, "Bob": {b: 14}, "Charlie": {c: [2, 5]}}
+    prot = ProtocolSpec(participant_ids=list(parties), expr=(a + b) * c * Scalar(3))
+    assert run_threads(prot, parties) == [[17 * 2 * 3, 17 * 5 * 3]] * 3
+
+    # The failures of the parties are raised, e.g. when a participant never shows up.
+    prot = ProtocolSpec(participant_ids=list(parties) + ["David"], expr=a * b + c)
+    with pytest.raises(TimeoutError):
+        run_threads(prot, parties, LocalTransport(prot.participant_ids, prot, timeout=0.5))
+
+
+def test_message_store_evicts_read_messages():
+    store = MessageStore()
+    for participant in ("Alice", "Bob", "Charlie"):
+        store.add_participant(participant)
+    store.put_many("public", {("Alice", "x"): b"12"})
+    store.put("private", ("Bob", "y"), b"3")
+    assert store.stats()["bytes"] == 3
+
+    assert store.get("private", ("Bob", "y"), reader="Bob") == b"3"
+    assert store.get_many("public", [("Alice", "x")], reader="Bob") == {("Alice", "x"): b"12"}
+    # Reading again does not count twice: Charlie has not read it yet.
+    assert store.get("public", ("Alice", "x"), reader="Bob") == b"12"
+    assert store.stats() == {"messages": 1, "bytes": 2, "evicted": 1, "sessions": 1}
+
+    assert store.get_quorum("public", ["Alice"], ["x"], 1, reader="Charlie") == {("Alice", "x"): b"12"}
+    assert store.stats()["messages"] == 0
+    assert store.stats()["bytes"] == 0
+
+    # The last read of a reader can be retried once its messages are evicted (e.g. if its response was lost).
+    assert store.get_quorum("public", ["Alice"], ["x"], 1, reader="Charlie") == {("Alice", "x"): b"12"}
+    assert store.get("private", ("Bob", "y"), reader="Bob") == b"3"
+    store.end_session()
+    assert store.get("private", ("Bob", "y"), reader="Bob") is None
+
+
+def test_message_store_sessions():
+    store = MessageStore()
+    store.put("public", ("Alice", "x"), b"1", session="first")
+    store.put("public", ("Alice", "x"), b"2", session="second")
+    assert store.get("public", ("Alice", "x"), session="first") == b"1"
+
+    # Without registered participants, public messages are kept until the end of their session.
+    store.end_session("first")
+    assert store.get("public", ("Alice", "x"), session="first") is None
+    assert store.get("public", ("Alice", "x"), session="second") == b"2"
+    assert store.stats()["bytes"] == 1
+
+
+def test_local_protocol_leaves_no_message_behind():
+    a, b = Secret(), Secret()
+    parties = {"Alice": {a: 3}, "Bob": {b: 14}}
+    prot = ProtocolSpec(participant_ids=list(parties), expr=a * b + a)
+    transport = LocalTransport(prot.participant_ids, prot)
+    results = dict()
+
+    def run_party(name):
+        results[name] = SMCParty(name, "localhost", 5000, prot, parties[name], transport=transport).run()
+
+    threads = [threading.Thread(target=run_party, args=(name,)) for name in parties]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"Alice": 45, "Bob": 45}
+    assert transport.store.stats()["messages"] == 0
+    assert transport.ttp.stats() == {"triplets": 0, "served": 1}
@@ -5,8 +5,89 @@ Testing ttp is not obligatory.
 MODIFY THIS FILE.
 """
 
+import pytest
+
+from expression import Secret
+from finite_field import FF
+from protocol import ProtocolSpec
+from secret_sharing import reconstruct_secret
 from ttp import TrustedParamGenerator
 
 
 def test():
     raise NotImplementedError("You can create some tests.")
+
+
+def make_ttp(participants):
+    ttp = TrustedParamGenerator()
+    for participant in participants:
+        ttp.add_participant(participant)
+    return ttp
+
+
+def test_triplet_is_valid():
+    participants = ["Alice", "Bob", "Charlie"]
+    ttp = make_ttp(participants)
+    triplets = [ttp.retrieve_share(participant, "op") for participant in participants]
+    a, b, c = [reconstruct_secret(list(shares)) for shares in zip(*triplets)]
+    assert c == FF.mul(a, b)
+
+
+def test_vector_triplet_is_valid():
+    participants = ["Alice", "Bob"]
+    ttp = make_ttp(participants)
+    triplets = [ttp.retrieve_share(participant, "op", 5) for participant in participants]
+    a, b, c = [reconstruct_secret(list(shares)) for shares in zip(*triplets)]
+    assert c == [FF.mul(x, y) for x, y in zip(a, b)]
+
+
+def test_preprocessing_fills_the_pool():
+    participants = ["Alice", "Bob"]
+    ttp = make_ttp(participants)
+    secrets = [Secret() for _ in range(4)]
+    expr = secrets[0] * secrets[1] + secrets[2] * secrets[3]
+
+    ttp.preprocess(ProtocolSpec(participants, expr))
+    assert ttp.wait_preprocessing(timeout=5)
+    assert len(ttp.stored_shares) == 2
+
+    # The bulk download serves the pre-generated triplets.
+    alice = ttp.retrieve_shares("Alice", [op_id for op_id, _ in ttp.stored_shares])
+    assert len(ttp.stored_shares) == 2
+    assert len(alice) == 2
+
+
+def test_triplets_are_evicted_once_retrieved_by_all():
+    participants = ["Alice", "Bob"]
+    ttp = make_ttp(participants)
+    alice = ttp.retrieve_share("Alice", "op")
+    # Retried requests get the same share.
+    assert ttp.retrieve_share("Alice", "op") == alice
+    bob = ttp.retrieve_share("Bob", "op")
+    assert ttp.stats() == {"triplets": 0, "served": 1}
+    # Even once the triplet is evicted: the response to the last request may have been lost.
+    assert ttp.retrieve_shares("Bob", ["op"]) == [bob]
+
+    ttp.retrieve_share("Alice", "other-op")
+    with pytest.raises(ValueError):
+        ttp.retrieve_share("Alice", "op")
+
+    # The next protocol may use the same operation ids.
+    ttp.end_session()
+    assert ttp.stats() == {"triplets": 0, "served": 0}
+    ttp.retrieve_share("Alice", "op")
+
+
+def test_preprocessed_triplets_of_vectors_are_dropped():
+    participants = ["Alice", "Bob"]
+    ttp = make_ttp(participants)
+    a, b = Secret(), Secret()
+    ttp.preprocess(ProtocolSpec(participants, a * b))
+    assert ttp.wait_preprocessing(timeout=5)
+    (op_id, size), = ttp.stored_shares
+    assert size is None
+
+    # The operands are vectors: the parties ask for a vector triplet instead.
+    for participant in participants:
+        ttp.retrieve_share(participant, op_id, 3)
+    assert ttp.stats() == {"triplets": 0, "served": 1}
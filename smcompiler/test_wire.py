@@ -0,0 +1,52 @@
+"""
+Unit tests for the binary wire format.
+"""
+
+import numpy as np
+
+import wire
+from finite_field import FF
+from secret_sharing import Share, VectorShare
+
+
+def test_element_round_trip():
+    encoded = wire.encode_element(FF.order - 1)
+    assert len(encoded) == 2 + 8
+    assert wire.is_binary(encoded)
+    assert wire.decode(encoded) == (FF.order - 1, len(encoded))
+
+
+def test_vector_round_trip():
+    values = FF.array([0, 1, FF.order - 1, 42])
+    encoded = wire.encode_vector(values)
+    assert len(encoded) == 6 + 8 * len(values)
+    decoded, end = wire.decode(encoded)
+    assert end == len(encoded)
+    assert np.array_equal(decoded, values)
+
+
+def test_wide_elements_are_length_prefixed():
+    assert wire.element_width(2**127 - 1) == 16
+    assert wire.element_width(FF.order) == 8
+
+
+def test_share_encodings():
+    share = Share(123)
+    assert Share.deserialize(share.serialize(binary=True)).value == 123
+    assert Share.deserialize(share.serialize()).value == 123
+    vector = VectorShare([1, 2, 3])
+    restored = Share.deserialize(vector.serialize(binary=True))
+    assert isinstance(restored, VectorShare)
+    assert restored.value.tolist() == [1, 2, 3]
+
+
+def test_decode_all():
+    data = wire.encode_element(1) + wire.encode_vector(FF.array([2, 3])) + wire.encode_element(4)
+    values = wire.decode_all(data)
+    assert values[0] == 1 and values[1].tolist() == [2, 3] and values[2] == 4
+
+
+def test_records_round_trip():
+    records = [("Alice", "label"), ("Bob", "other")]
+    payloads = [b"\x00\xb1binary", b""]
+    assert wire.unpack_records(wire.pack_records(records, payloads), 2) == list(zip(records, payloads))
@@ -0,0 +1,254 @@
+"""
+Structured traces of protocol runs.
+
+A `Tracer` records spans: the phases and rounds of a party (category "round"), the expression nodes it
+evaluates (category "node") and its requests to the server (category "network"). Every span sums up
+what happened within it: time spent waiting on the network (the rest is computation), payload bytes
+sent and received, requests made and polling retries (requests answered "not ready yet"). The gates
+opened together in a round share its messages: each of their node spans gets an even part of them.
+
+Traces can be exported as JSON, or in the Chrome trace event format (chrome://tracing, Perfetto), one
+process per party on a common clock, to find out which rounds stall.
+
+Example:
+>>> tracer = Tracer("Alice")
+>>> party = SMCParty("Alice", "localhost", 5000, protocol_spec, value_dict, tracer=tracer)
+>>> party.run()
+>>> write_chrome_trace("trace.json", [tracer])
+"""
+
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+COUNTERS = ("bytes_sent", "bytes_received", "requests", "retries")
+
+# Innermost open span of the running thread or task, which the requests are accounted to.
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span", default=None)
+
+
+class Span:
+    """
+    A timed section of a run.
+
+    Attributes:
+        name: what is done, e.g. "round 2" or the type of a node
+        category: "round", "node" or "network"
+        start, end: bounds of the span, in seconds since the epoch
+        network: time waited on the network within the span, in seconds
+        counters: bytes sent and received, requests and polling retries within the span
+        args: other attributes, e.g. the number of gates of a round
+    """
+
+    __slots__ = ("name", "category", "start", "end", "network", "counters", "args", "parent")
+
+    def __init__(self, name: str, category: str, start: float, args: dict, parent: Optional["Span"] = None):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.end = start
+        self.network = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.args = args
+        self.parent = parent
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def compute(self) -> float:
+        """Time of the span not spent waiting on the network."""
+        # Concurrent requests (see `AsyncSMCParty`) overlap, so their waits may sum up to more than the span.
+        return max(0.0, self.duration - self.network)
+
+    def count(self, **counts: int) -> None:
+        for key, value in counts.items():
+            self.counters[key] += value
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "category": self.category,
+            "start": self.start,
+            "duration": self.duration,
+            "network": self.network,
+            "compute": self.compute,
+            **self.counters,
+            **self.args,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def usage() -> Tuple[float, Dict[str, int]]:
+    """
+    Network wait and counters of the innermost open span so far (none outside of spans): what a section
+    of code adds to them is what it waited and counted.
+    """
+    span = _current.get()
+    if span is None:
+        return 0.0, dict.fromkeys(COUNTERS, 0)
+    return span.network, dict(span.counters)
+
+
+def count(**counts: int) -> None:
+    """
+    Account bytes, requests or retries (see `COUNTERS`) to the innermost open span, if any.
+    """
+    span = _current.get()
+    if span is not None:
+        span.count(**counts)
+
+
+class Tracer:
+    """
+    Recorder of the spans of one party.
+
+    Attributes:
+        process: name of the traced party, e.g. its client id
+        nodes: whether to record a span per evaluated node, rather than only rounds and requests
+        spans: spans ended so far
+    """
+
+    enabled = True
+
+    def __init__(self, process: str = "", nodes: bool = True):
+        self.process = process
+        self.nodes = nodes
+        self.spans: List[Span] = []
+        # Offset of the epoch to `time.perf_counter`, so that traces of several processes line up.
+        self._epoch = time.time() - time.perf_counter()
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        return self._epoch + time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "round", **args) -> Iterator[Span]:
+        """
+        Record the enclosed code as a span, nested in the span open around it.
+        """
+        span = Span(name, category, self.now(), args, _current.get())
+        token = _current.set(span)
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+            self._end(span, self.now())
+
+    def record(
+            self,
+            name: str,
+            category: str,
+            start: float,
+            end: float,
+            network: float = 0.0,
+            counters: Optional[Dict[str, int]] = None,
+            **args
+        ) -> Span:
+        """
+        Record a span measured by the caller (see `now`), e.g. for spans too short for `span`. Its network
+        wait and counters are a part of those of the span open around it, already accounted to it.
+        """
+        span = Span(name, category, start, args, _current.get())
+        span.network = network
+        if counters:
+            span.count(**counters)
+        self._end(span, end, accounted=True)
+        return span
+
+    def _end(self, span: Span, end: float, accounted: bool = False) -> None:
+        span.end = end
+        if span.category == "network":
+            span.network = span.duration
+        parent = span.parent
+        if parent is not None and not accounted:
+            # Parents sum up their children: each level adds its total once the child is done.
+            parent.network += span.network
+            parent.count(**span.counters)
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Totals of the top-level spans: duration, network wait, computation and counters.
+        """
+        roots = [span for span in self.spans if span.parent is None]
+        totals = {
+            "duration": sum(span.duration for span in roots),
+            "network": sum(span.network for span in roots),
+            "compute": sum(span.compute for span in roots),
+        }
+        for key in COUNTERS:
+            totals[key] = sum(span.counters[key] for span in roots)
+        return totals
+
+    def to_dict(self) -> dict:
+        return {
+            "process": self.process,
+            "summary": self.summary(),
+            "spans": [span.to_dict() for span in sorted(self.spans, key=lambda span: span.start)],
+        }
+
+    def dump(self, path: str) -> None:
+        """
+        Write the trace as JSON.
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+class NullTracer(Tracer):
+    """
+    Tracer recording nothing, used when tracing is off.
+    """
+
+    enabled = False
+
+    def span(self, name: str, category: str = "round", **args):
+        return contextlib.nullcontext()
+
+    def record(self, name: str, category: str, start: float, end: float, network: float = 0.0,
+               counters: Optional[Dict[str, int]] = None, **args) -> None:
+        return None
+
+
+NULL_TRACER = NullTracer()
+
+
+def chrome_trace(traces: Iterable[dict]) -> dict:
+    """
+    Merge traces (as returned by `Tracer.to_dict`, possibly from other processes) into one trace in the
+    Chrome trace event format, with one process per party.
+    """
+    events = []
+    for pid, trace in enumerate(traces):
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": trace["process"]}})
+        for span in trace["spans"]:
+            args = {key: value for key, value in span.items() if key not in ("name", "category", "start", "duration")}
+            events.append({
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": span["start"] * 1e6,
+                "dur": span["duration"] * 1e6,
+                "pid": pid,
+                "tid": 0,
+                "args": args,
+            })
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_chrome_trace(path: str, traces: Iterable) -> None:
+    """
+    Write the traces of several parties (tracers, or their `to_dict`) as one Chrome trace.
+    """
+    traces = [trace.to_dict() if isinstance(trace, Tracer) else trace for trace in traces]
+    with open(path, "w") as f:
+        json.dump(chrome_trace(traces), f)
@@ -0,0 +1,303 @@
+"""
+Transports of the messages exchanged by the SMC clients.
+
+By default, `Communication` sends its messages to the trusted server over HTTP. It can instead be given
+a `Transport`, which exchanges them by other means. `LocalTransport` keeps them in memory, for the
+parties running in the same process (e.g. in threads): no server process, sockets or serialization to
+HTTP, so that tests and protocol-level benchmarks measure the computation rather than the network stack.
+"""
+
+import collections
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from finite_field import FF, FiniteField
+from protocol import ProtocolSpec
+from secret_sharing import Share
+from ttp import TrustedParamGenerator
+
+
+class MessageStore:
+    """
+    Thread-safe store of the messages, in pools ("private" and "public") of channels. Reads can wait
+    for the messages to be written.
+
+    Messages are scoped by protocol session (the default session is ""), and evicted as soon as all
+    their expected readers have read them: the receiver of a private message, the other participants
+    of the session for a public one. Messages without known readers (e.g. published before the
+    participants are registered) are kept until `end_session`. The last read of every reader is kept
+    too, so that it can be retried (e.g. if the response was lost) after its messages are evicted.
+    """
+
+    def __init__(self):
+        self.pools: Dict[Tuple[str, str], Dict[Tuple[str, str], bytes]] = collections.defaultdict(dict)
+        self.participants: Dict[str, Set[str]] = collections.defaultdict(set)
+        # Readers that still have to read each message, indexed by (session, pool, channel).
+        self.readers: Dict[Tuple[str, str, Tuple[str, str]], Set[str]] = dict()
+        # Messages of the last read of every reader, indexed by (session, pool, reader).
+        self.last_read: Dict[Tuple[str, str, str], Dict[Tuple[str, str], bytes]] = dict()
+        self.nbytes = 0
+        self.evicted = 0
+        # Notified whenever a message is stored, to wake up the waiting reads.
+        self.updated = threading.Condition()
+
+    def add_participant(self, participant_id: str, session: str = "") -> None:
+        with self.updated:
+            self.participants[session].add(participant_id)
+
+    def _expected_readers(self, session: str, pool: str, channel: Tuple[str, str]) -> Optional[Set[str]]:
+        if pool == "private":
+            return {channel[0]}
+        readers = self.participants[session] - {channel[0]}
+        return readers or None
+
+    def put(self, pool: str, channel: Tuple[str, str], data: bytes, session: str = "") -> None:
+        """
+        Push data to a channel in a given pool and send an event.
+        """
+        self.put_many(pool, {channel: data}, session)
+
+    def put_many(self, pool: str, data: Dict[Tuple[str, str], bytes], session: str = "") -> None:
+        """
+        Push data to several channels of a given pool at once.
+        """
+        with self.updated:
+            store = self.pools[(session, pool)]
+            for channel, message in data.items():
+                self.nbytes += len(message) - len(store.get(channel, b""))
+                store[channel] = message
+                readers = self._expected_readers(session, pool, channel)
+                if readers is not None:
+                    self.readers[(session, pool, channel)] = readers
+            self.updated.notify_all()
+
+    def _readable(self, session: str, pool: str, reader: Optional[str]) -> Dict[Tuple[str, str], bytes]:
+        """
+        Messages a reader can read: those stored, and those of its last read.
+        """
+        store = self.pools[(session, pool)]
+        last = self.last_read.get((session, pool, reader)) if reader is not None else None
+        return collections.ChainMap(store, last) if last else store
+
+    def _consume(self, session: str, pool: str, res: Dict[Tuple[str, str], bytes], reader: Optional[str]) -> None:
+        """
+        Record that `reader` read the messages, and evict those read by all their readers.
+        """
+        if reader is None:
+            return
+        self.last_read[(session, pool, reader)] = res
+        store = self.pools[(session, pool)]
+        for channel in res:
+            readers = self.readers.get((session, pool, channel))
+            if readers is None:
+                continue
+            readers.discard(reader)
+            if not readers:
+                del self.readers[(session, pool, channel)]
+                self.nbytes -= len(store.pop(channel))
+                self.evicted += 1
+
+    def get(
+            self,
+            pool: str,
+            channel: Tuple[str, str],
+            timeout: Optional[float] = 0,
+            reader: Optional[str] = None,
+            session: str = ""
+        ) -> Optional[bytes]:
+        """
+        Subscribe to a channel in a given pool and get it once ready.
+        Waits at most `timeout` seconds (forever if None) for the data to be pushed.
+        """
+        res = self.get_many(pool, [channel], timeout, reader, session)
+        return None if res is None else res[channel]
+
+    def get_many(
+            self,
+            pool: str,
+            channels: Iterable[Tuple[str, str]],
+            timeout: Optional[float] = 0,
+            reader: Optional[str] = None,
+            session: str = ""
+        ) -> Optional[Dict[Tuple[str, str], bytes]]:
+        """
+        Get the data of several channels of a given pool, once all of them are ready.
+        Waits at most `timeout` seconds (forever if None), and returns None if some data is still missing.
+        """
+        channels = list(channels)
+        with self.updated:
+            ready = self.updated.wait_for(
+                lambda: all(channel in self._readable(session, pool, reader) for channel in channels), timeout=timeout
+            )
+            if not ready:
+                return None
+            readable = self._readable(session, pool, reader)
+            res = {channel: readable[channel] for channel in channels}
+            self._consume(session, pool, res, reader)
+            return res
+
+    def get_quorum(
+            self,
+            pool: str,
+            senders: List[str],
+            labels: List[str],
+            quorum: int,
+            timeout: Optional[float] = 0,
+            reader: Optional[str] = None,
+            session: str = ""
+        ) -> Optional[Dict[Tuple[str, str], bytes]]:
+        """
+        Get the data of the senders that pushed all the given labels, once there are at least `quorum` of
+        them. Waits at most `timeout` seconds (forever if None), and returns None if there are not enough
+        such senders yet.
+        """
+        with self.updated:
+            def complete() -> List[str]:
+                readable = self._readable(session, pool, reader)
+                return [sender for sender in senders if all((sender, label) in readable for label in labels)]
+
+            ready = self.updated.wait_for(lambda: len(complete()) >= quorum, timeout=timeout)
+            if not ready:
+                return None
+            readable = self._readable(session, pool, reader)
+            res = {(sender, label): readable[(sender, label)] for sender in complete() for label in labels}
+            self._consume(session, pool, res, reader)
+            return res
+
+    def end_session(self, session: str = "") -> None:
+        """
+        Forget the messages and participants of a session, including the messages not read by all
+        their readers (e.g. those of the parties left out of a quorum).
+        """
+        with self.updated:
+            for key in [key for key in self.pools if key[0] == session]:
+                self.nbytes -= sum(len(message) for message in self.pools.pop(key).values())
+            for key in [key for key in self.readers if key[0] == session]:
+                del self.readers[key]
+            for key in [key for key in self.last_read if key[0] == session]:
+                del self.last_read[key]
+            self.participants.pop(session, None)
+
+    def clear(self) -> None:
+        with self.updated:
+            self.pools.clear()
+            self.participants.clear()
+            self.readers.clear()
+            self.last_read.clear()
+            self.nbytes = 0
+            self.evicted = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Memory usage of the store: number and total size of the messages held, and number evicted.
+        """
+        with self.updated:
+            return {
+                "messages": sum(len(store) for store in self.pools.values()),
+                "bytes": self.nbytes,
+                "evicted": self.evicted,
+                "sessions": len({session for session, _ in self.pools}),
+            }
+
+
+class Transport:
+    """
+    Exchange of the messages of the clients, see `Communication` for the meaning of the methods.
+    Reads block until the messages are available.
+    """
+
+    def send_private_many(self, sender_id: str, messages: Dict[Tuple[str, str], bytes]) -> None:
+        raise NotImplementedError
+
+    def retrieve_private_many(self, receiver_id: str, labels: List[str]) -> Dict[str, bytes]:
+        raise NotImplementedError
+
+    def publish_many(self, sender_id: str, messages: Dict[str, bytes]) -> None:
+        raise NotImplementedError
+
+    def retrieve_many(
+            self,
+            receiver_id: str,
+            sender_ids: List[str],
+            labels: List[str],
+            min_senders: Optional[int] = None
+        ) -> Dict[Tuple[str, str], bytes]:
+        raise NotImplementedError
+
+    def retrieve_triplets(
+            self,
+            client_id: str,
+            op_ids: List[str],
+            sizes: Optional[Dict[str, int]] = None,
+            field: FiniteField = FF,
+            threshold: Optional[int] = None
+        ) -> Dict[str, Tuple[Share, Share, Share]]:
+        raise NotImplementedError
+
+
+class LocalTransport(Transport):
+    """
+    In-memory transport shared by the parties of one process: it plays the role of the server, with
+    its own message store and trusted third party.
+
+    Attributes:
+        store: messages exchanged so far
+        ttp: generator of the Beaver triplets
+        timeout: longest time in seconds a read waits for a message before raising `TimeoutError`
+            (forever if None)
+    """
+
+    def __init__(
+            self,
+            participant_ids: Iterable[str] = (),
+            protocol_spec: Optional[ProtocolSpec] = None,
+            timeout: Optional[float] = 60.0
+        ):
+        self.store = MessageStore()
+        self.ttp = TrustedParamGenerator()
+        self.timeout = timeout
+        for participant_id in participant_ids:
+            self.ttp.add_participant(participant_id)
+            self.store.add_participant(participant_id)
+        if protocol_spec is not None:
+            self.ttp.preprocess(protocol_spec)
+
+    def _check(self, res: Optional[dict], what: str) -> dict:
+        if res is None:
+            raise TimeoutError(f"{what} not received within {self.timeout} seconds")
+        return res
+
+    def send_private_many(self, sender_id: str, messages: Dict[Tuple[str, str], bytes]) -> None:
+        self.store.put_many("private", messages)
+
+    def retrieve_private_many(self, receiver_id: str, labels: List[str]) -> Dict[str, bytes]:
+        res = self.store.get_many("private", [(receiver_id, label) for label in labels], self.timeout, receiver_id)
+        return {label: message for (_, label), message in self._check(res, "Private messages").items()}
+
+    def publish_many(self, sender_id: str, messages: Dict[str, bytes]) -> None:
+        self.store.put_many("public", {(sender_id, label): message for label, message in messages.items()})
+
+    def retrieve_many(
+            self,
+            receiver_id: str,
+            sender_ids: List[str],
+            labels: List[str],
+            min_senders: Optional[int] = None
+        ) -> Dict[Tuple[str, str], bytes]:
+        if min_senders is not None:
+            res = self.store.get_quorum("public", sender_ids, labels, min_senders, self.timeout, receiver_id)
+        else:
+            channels = [(sender_id, label) for sender_id in sender_ids for label in labels]
+            res = self.store.get_many("public", channels, self.timeout, receiver_id)
+        return self._check(res, "Public messages")
+
+    def retrieve_triplets(
+            self,
+            client_id: str,
+            op_ids: List[str],
+            sizes: Optional[Dict[str, int]] = None,
+            field: FiniteField = FF,
+            threshold: Optional[int] = None
+        ) -> Dict[str, Tuple[Share, Share, Share]]:
+        order = None if field == FF else field.order
+        return dict(zip(op_ids, self.ttp.retrieve_shares(client_id, op_ids, sizes, order, threshold)))
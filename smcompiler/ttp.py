@@ -7,30 +7,58 @@ MODIFY THIS FILE.
 import collections
 from typing import (
     Dict,
+    Iterable,
+    List,
+    Optional,
     Set,
     Tuple,
 )
 
-from communication import Communication
+from compiler import compile_expression
+from expression import InnerProduct
+from fixed_point import truncated_bits, truncation_pair
+from protocol import ProtocolSpec
 from secret_sharing import(
-    share_secret,
+    AdditiveScheme,
+    ShamirScheme,
     Share,
 )
 
-import random
-from finite_field import FF
+import threading
+from finite_field import FF, FiniteField
 
 # Feel free to add as many imports as you want.
 
 
 class TrustedParamGenerator:
     """
-    A trusted third party that generates random values for the Beaver triplet multiplication scheme.
+    A trusted third party that generates random values for the Beaver triplet multiplication scheme,
+    and the truncation pairs (r, floor(r / 2^bits)) of the fixed-point truncations, served under the
+    operation ids of `fixed_point.truncation_op_id` in place of triplets.
     """
 
     def __init__(self):
         self.participant_ids: Set[str] = set()
-        self.stored_shares: Dict[str, Dict[str, Share]] = dict()
+        # Triplets indexed by (operation id, vector size or None), then by participant.
+        self.stored_shares: Dict[Tuple[str, Optional[int]], Dict[str, Tuple[Share, Share, Share]]] = dict()
+        # Participants that retrieved each stored triplet. A triplet is evicted once all of them did, and
+        # its key is then kept in `served` until the end of the session, so that it is never generated
+        # (and used) again.
+        self.retrieved: Dict[Tuple[str, Optional[int]], Set[str]] = collections.defaultdict(set)
+        self.served: Set[Tuple[str, Optional[int]]] = set()
+        # Shares of the last request of every participant, so that a retried request (e.g. whose response
+        # was lost) gets them again, even if the triplets were evicted since.
+        self.last_served: Dict[str, Dict[Tuple[str, Optional[int]], Tuple[Share, Share, Share]]] = dict()
+        # Vector size of the triplets generated ahead of the requests, by operation id, until the
+        # parties ask for them: it is guessed, as the TTP does not know the sizes of the inputs.
+        self.preprocessed: Dict[str, Optional[int]] = dict()
+        # The server answers requests concurrently: a triplet must only be generated once.
+        self._lock = threading.Lock()
+        self._preprocessing: Optional[threading.Thread] = None
+        # Field and Shamir threshold (None for additive sharing) of the protocol, unless a request asks
+        # for others.
+        self.field = FF
+        self.threshold: Optional[int] = None
 
 
     def add_participant(self, participant_id: str) -> None:
@@ -39,23 +67,158 @@ class TrustedParamGenerator:
         """
         self.participant_ids.add(participant_id)
 
-    def retrieve_share(self, client_id: str, op_id: str) -> Tuple[Share, Share, Share]:
+    def retrieve_share(
+            self,
+            client_id: str,
+            op_id: str,
+            size: Optional[int] = None,
+            order: Optional[int] = None,
+            threshold: Optional[int] = None
+        ) -> Tuple[Share, Share, Share]:
         """
         Retrieve a triplet of shares for a given client_id.
+        If `size` is given, the triplet is made of vectors of `size` elements, for element-wise products.
+        If `order` is given, the triplet is generated in the field of that order.
+        If `threshold` is given, the triplet is Shamir-shared with that threshold.
         """
+        return self.retrieve_shares(client_id, [op_id], None if size is None else {op_id: size}, order, threshold)[0]
+
+    def retrieve_shares(
+            self,
+            client_id: str,
+            op_ids: Iterable[str],
+            sizes: Optional[Dict[str, int]] = None,
+            order: Optional[int] = None,
+            threshold: Optional[int] = None
+        ) -> List[Tuple[Share, Share, Share]]:
+        """
+        Retrieve the triplets of several operations at once for a given client_id.
+        `sizes` gives the vector size of the operations on vectors.
+        """
+        sizes = sizes or dict()
+        keys = [(op_id, sizes.get(op_id)) for op_id in op_ids]
+        with self._lock:
+            last = self.last_served.get(client_id, dict())
+            shares = [last[key] if key in last else self._retrieve(client_id, key, order, threshold) for key in keys]
+            self.last_served[client_id] = dict(zip(keys, shares))
+        return shares
+
+    def _retrieve(
+            self,
+            client_id: str,
+            key: Tuple[str, Optional[int]],
+            order: Optional[int],
+            threshold: Optional[int]
+        ) -> Tuple[Share, Share, Share]:
+        op_id, size = key
+        if key in self.served:
+            raise ValueError(f"The triplet of operation {op_id} was already retrieved by all the participants")
+        self._supersede(op_id, size)
         # If it's the first time the TTP receives a request for that operation id, it has to generate the shares first
-        if op_id not in self.stored_shares:
-            self._generate_shares(op_id)
-        
-        return self.stored_shares[op_id][client_id]
-    
-    def _generate_shares(self, op_id: str) -> None:
-        a, b = random.randint(0, FF.order - 1), random.randint(0, FF.order - 1)
-        c = FF.mul(a, b)
-
-        a_shares, b_shares, c_shares = [share_secret(x, len(self.participant_ids)) for x in (a, b, c)]
-
-        self.stored_shares[op_id] = dict(zip(self.participant_ids, zip(a_shares, b_shares, c_shares)))
+        if key not in self.stored_shares:
+            field = self.field if order is None else FiniteField(order)
+            self._generate_shares(op_id, size, field, self.threshold if threshold is None else threshold)
+
+        # A participant may retrieve its share again until all of them did, and after that with a retry
+        # of its last request (see `last_served`).
+        share = self.stored_shares[key][client_id]
+        self.retrieved[key].add(client_id)
+        if len(self.retrieved[key]) == len(self.stored_shares[key]):
+            del self.stored_shares[key]
+            del self.retrieved[key]
+            self.served.add(key)
+        return share
+
+    def preprocess(self, protocol_spec: ProtocolSpec) -> Optional[threading.Thread]:
+        """
+        Offline phase: generate in the background the triplets of every multiplication of a protocol,
+        so that they are ready before the parties ask for them. The parties of a protocol with another
+        preprocessing generate the triplets themselves: there is nothing to do.
+        """
+        if protocol_spec.preprocessing != "ttp":
+            return None
+        self.field = protocol_spec.field
+        self.threshold = protocol_spec.threshold
+        circuit = compile_expression(protocol_spec.expr, field=self.field)
+        # Inner products take one vector triplet for all their products (of single values, presumably).
+        operations = [
+            (circuit.op_id(gate), len(gate.xs) if isinstance(gate, InnerProduct) else None)
+            for level in circuit.levels for gate in level
+        ]
+        with self._lock:
+            self.preprocessed.update(operations)
+        self._preprocessing = threading.Thread(target=self._fill_pool, args=(operations,), daemon=True)
+        self._preprocessing.start()
+        return self._preprocessing
+
+    def end_session(self) -> None:
+        """
+        Forget the triplets of the protocol, served or not, so that the next one may reuse its
+        operation ids.
+        """
+        with self._lock:
+            self.stored_shares.clear()
+            self.retrieved.clear()
+            self.served.clear()
+            self.last_served.clear()
+            self.preprocessed.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Number of triplets held (not yet retrieved by all the participants) and already served.
+        """
+        with self._lock:
+            return {"triplets": len(self.stored_shares), "served": len(self.served)}
+
+    def wait_preprocessing(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for the offline phase to finish, and return whether it is done.
+        """
+        if self._preprocessing is None:
+            return True
+        self._preprocessing.join(timeout)
+        return not self._preprocessing.is_alive()
+
+    def _fill_pool(self, operations: List[Tuple[str, Optional[int]]]) -> None:
+        for op_id, size in operations:
+            with self._lock:
+                # Skip the operations already asked for: their triplets are generated on request.
+                if op_id in self.preprocessed and (op_id, size) not in self.stored_shares:
+                    self._generate_shares(op_id, size, self.field, self.threshold)
+
+    def _supersede(self, op_id: str, size: Optional[int]) -> None:
+        """
+        The parties ask for the triplet of an operation: drop the one preprocessed for it if its size
+        was guessed wrong (e.g. for an operation on vectors), unless a participant already retrieved it.
+        """
+        if op_id not in self.preprocessed:
+            return
+        stale = (op_id, self.preprocessed.pop(op_id))
+        if stale[1] != size and not self.retrieved.get(stale):
+            self.stored_shares.pop(stale, None)
+
+    def _generate_shares(
+            self,
+            op_id: str,
+            size: Optional[int],
+            field: FiniteField,
+            threshold: Optional[int] = None
+        ) -> None:
+        bits = truncated_bits(op_id)
+        if bits is None:
+            a, b = field.random(size), field.random(size)
+            values = (a, b, field.mul(a, b))
+        else:
+            values = truncation_pair(field, bits, size)
+
+        participant_ids = sorted(self.participant_ids)
+        if threshold is None:
+            scheme = AdditiveScheme(participant_ids, field)
+        else:
+            scheme = ShamirScheme(participant_ids, threshold, field)
+        shares = [scheme.share(x) for x in values]
+
+        self.stored_shares[(op_id, size)] = dict(zip(participant_ids, zip(*shares)))
 
 
     # Feel free to add as many methods as you want.
@@ -0,0 +1,121 @@
+"""
+Compact binary encoding of field elements, and framing of bulk messages.
+
+A field element is encoded as a fixed-width big-endian integer: 8 bytes as long as the values fit in
+64 bits (always the case in the default field), their byte length otherwise. Encoded values carry a small header so
+that they are self-delimiting and distinguishable from the JSON encoding (which starts with "{"):
+
+    single element:  TAG_ELEMENT | width (1 byte) | value (width bytes)
+    vector:          TAG_VECTOR  | width (1 byte) | count (4 bytes) | values (count * width bytes)
+
+Bulk requests and responses are a sequence of records, each made of a fixed number of string keys
+(2-byte length prefix) followed by a payload (4-byte length prefix).
+"""
+
+import struct
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+from finite_field import FF
+
+TAG_ELEMENT = 0xB1
+TAG_VECTOR = 0xB2
+
+# MIME type of binary bodies, used for content negotiation with the server.
+CONTENT_TYPE = "application/octet-stream"
+
+
+def element_width(order: int = FF.order) -> int:
+    """
+    Number of bytes of an encoded element of a field of the given order.
+    """
+    return max(8, (order.bit_length() + 7) // 8)
+
+
+def is_binary(data: Union[bytes, str]) -> bool:
+    """
+    Whether a message is in the binary encoding (rather than JSON).
+    """
+    return isinstance(data, (bytes, bytearray)) and len(data) > 0 and data[0] in (TAG_ELEMENT, TAG_VECTOR)
+
+
+def encode_element(value: int) -> bytes:
+    width = max(element_width(), (int(value).bit_length() + 7) // 8)
+    return bytes((TAG_ELEMENT, width)) + int(value).to_bytes(width, "big")
+
+
+def encode_vector(values: Sequence[int]) -> bytes:
+    if isinstance(values, np.ndarray) and values.dtype == np.uint64:
+        header = bytes((TAG_VECTOR, 8)) + struct.pack(">I", len(values))
+        return header + values.astype(">u8").tobytes()
+    width = max([element_width()] + [(int(v).bit_length() + 7) // 8 for v in values])
+    header = bytes((TAG_VECTOR, width)) + struct.pack(">I", len(values))
+    return header + b"".join(int(v).to_bytes(width, "big") for v in values)
+
+
+def decode(data: bytes, offset: int = 0) -> Tuple[Union[int, np.ndarray], int]:
+    """
+    Decode the value starting at `offset`.
+
+    Returns:
+        the element (int) or vector (NumPy array), and the offset right after it
+    """
+    tag, width = data[offset], data[offset + 1]
+    if tag == TAG_ELEMENT:
+        end = offset + 2 + width
+        return int.from_bytes(data[offset + 2:end], "big"), end
+    if tag == TAG_VECTOR:
+        (count,) = struct.unpack_from(">I", data, offset + 2)
+        start = offset + 6
+        end = start + count * width
+        if width == 8:
+            return np.frombuffer(data[start:end], dtype=">u8").astype(np.uint64), end
+        values = [int.from_bytes(data[i:i + width], "big") for i in range(start, end, width)]
+        return np.array(values, dtype=object), end
+    raise ValueError(f"Unknown wire tag {tag:#x}")
+
+
+def decode_all(data: bytes) -> List[Union[int, np.ndarray]]:
+    """
+    Decode a concatenation of encoded values.
+    """
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = decode(data, offset)
+        values.append(value)
+    return values
+
+
+def pack_records(records: Sequence[Tuple[str, ...]], payloads: Sequence[bytes]) -> bytes:
+    """
+    Frame records, each made of string keys and a binary payload, into one body.
+    """
+    parts = []
+    for keys, payload in zip(records, payloads):
+        for key in keys:
+            encoded = key.encode()
+            parts.append(struct.pack(">H", len(encoded)))
+            parts.append(encoded)
+        parts.append(struct.pack(">I", len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def unpack_records(data: bytes, num_keys: int) -> List[Tuple[Tuple[str, ...], bytes]]:
+    """
+    Inverse of `pack_records`, given the number of keys of every record.
+    """
+    records = []
+    offset = 0
+    while offset < len(data):
+        keys = []
+        for _ in range(num_keys):
+            (length,) = struct.unpack_from(">H", data, offset)
+            keys.append(data[offset + 2:offset + 2 + length].decode())
+            offset += 2 + length
+        (length,) = struct.unpack_from(">I", data, offset)
+        records.append((tuple(keys), bytes(data[offset + 4:offset + 4 + length])))
+        offset += 4 + length
+    return records